@@ -0,0 +1,323 @@
+# Times every stage of the reaction pipeline on synthetic workloads, saves the results as JSON and compares them with a baseline
+#
+#   python -m benchmarks.run                                  # default matrix, results in benchmarks/results/
+#   python -m benchmarks.run --output baseline.json           # store a baseline
+#   python -m benchmarks.run --compare baseline.json          # exit status 1 if a case got slower than the threshold
+#   python -m benchmarks.run --batch-sizes 1,100,10000,1000000 --stages pipeline
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from functools import cached_property
+
+from benchmarks.workloads import reaction_batch
+from src.particles import load_ElementalParticles, load_ComplexParticles
+from src.parser import parse_reaction, normalize_particles, analyze_complex_particles
+from src.validator import validate_process
+from src.identifier import process_particles, identify_flavor_change, identify_strong, identify_em, identify_weak, identify_interactions, sorted_reaction
+from src.resolver import ParticleResolver
+from src.pipeline import ReactionPipeline
+from src.cache import ReactionCache
+
+# Stages timed in isolation, in pipeline order; the input of each one is the output of the previous one, computed beforehand
+STAGES = ('parse_reaction', 'normalize_particles', 'validate_process', 'analyze_complex_particles',
+          'identify_flavor_change', 'identify_strong', 'identify_em', 'identify_weak', 'identify_interactions')
+
+# End-to-end runs: the whole pipeline one reaction at a time, without and with the result cache, and in batches validated together ('run_batch')
+PIPELINES = ('pipeline', 'pipeline_cached', 'pipeline_batch')
+
+MULTIPLICITIES = (2, 4, 8, 16, 32, 50)
+BATCH_SIZES = (1, 100, 10000)
+STAGE_BATCH = 1000
+PIPELINE_MULTIPLICITY = 4
+
+RESULTS_DIR = os.path.join('benchmarks', 'results')
+
+
+class Workload:
+    """
+    Synthetic batch of reactions with the input of every stage, so that each stage can be timed on its own.
+    The inputs are computed on first use, so end-to-end runs over large batches only build the reaction strings.
+
+    Args:
+        multiplicity (int): number of particles per reaction
+        size (int): number of reactions
+        ElementalParticles_db (dict): database of elemental particles
+        ComplexParticles_db (dict): database of complex particles
+        resolver (ParticleResolver): index of both databases
+        seed (int, optional): seed of the generator
+    """
+    def __init__(self, multiplicity, size, ElementalParticles_db, ComplexParticles_db, resolver, seed=0):
+        self.reactions = reaction_batch(multiplicity, size, seed)
+        self.ElementalParticles_db = ElementalParticles_db
+        self.ComplexParticles_db = ComplexParticles_db
+        self.resolver = resolver
+
+    @cached_property
+    def parsed(self):
+        return [parse_reaction(r) for r in self.reactions]
+
+    @cached_property
+    def normalized(self):
+        return [normalize_particles(p, self.resolver) for p in self.parsed]
+
+    @cached_property
+    def valid(self):
+        # Later stages only see the reactions that pass validation, as in the pipeline
+        return [n for n in self.normalized if not validate_process(n, self.ElementalParticles_db, self.ComplexParticles_db)]
+
+    @cached_property
+    def elemental(self):
+        return [analyze_complex_particles(n, self.resolver) for n in self.valid]
+
+    @cached_property
+    def sorted_elemental(self):
+        # The pipeline identifies the interactions on the particles sorted by name
+        return [sorted_reaction(e) for e in self.elemental]
+
+    @cached_property
+    def interacting(self):
+        return [process_particles(e)[1] for e in self.sorted_elemental]
+
+    @cached_property
+    def after_flavor(self):
+        return [identify_flavor_change(i, self.ElementalParticles_db)[2] for i in self.interacting]
+
+    @cached_property
+    def after_strong(self):
+        return [identify_strong(i, self.ElementalParticles_db)[1] for i in self.after_flavor]
+
+    @cached_property
+    def after_em(self):
+        return [identify_em(i, self.ElementalParticles_db)[2] for i in self.after_strong]
+
+
+def stage_runner(stage, workload, ElementalParticles_db, ComplexParticles_db, resolver):
+    """
+    Returns (function that runs a stage over the whole workload, number of items it processes).
+
+    Args:
+        stage (str): name from STAGES or PIPELINES
+        workload (Workload): inputs
+        ElementalParticles_db (dict): database of elemental particles
+        ComplexParticles_db (dict): database of complex particles
+        resolver (ParticleResolver): index of both databases
+    """
+    db = ElementalParticles_db
+    if stage == 'parse_reaction':
+        items = workload.reactions
+        return (lambda: [parse_reaction(r) for r in items]), len(items)
+    if stage == 'normalize_particles':
+        items = workload.parsed
+        return (lambda: [normalize_particles(p, resolver) for p in items]), len(items)
+    if stage == 'validate_process':
+        items = workload.normalized
+        return (lambda: [validate_process(n, db, ComplexParticles_db) for n in items]), len(items)
+    if stage == 'analyze_complex_particles':
+        items = workload.valid
+        return (lambda: [analyze_complex_particles(n, resolver) for n in items]), len(items)
+    if stage == 'identify_flavor_change':
+        items = workload.interacting
+        return (lambda: [identify_flavor_change(i, db) for i in items]), len(items)
+    if stage == 'identify_strong':
+        items = workload.after_flavor
+        return (lambda: [identify_strong(i, db) for i in items]), len(items)
+    if stage == 'identify_em':
+        items = workload.after_strong
+        return (lambda: [identify_em(i, db) for i in items]), len(items)
+    if stage == 'identify_weak':
+        items = workload.after_em
+        return (lambda: [identify_weak(i, db) for i in items]), len(items)
+    if stage == 'identify_interactions':
+        items = workload.sorted_elemental
+        return (lambda: [identify_interactions(e, db) for e in items]), len(items)
+    if stage in PIPELINES:
+        items = workload.reactions
+        pipeline = ReactionPipeline(ElementalParticles_db, ComplexParticles_db)
+        def run():
+            # A new cache every time, so that every repetition starts cold and only hits on repeats within the batch
+            if stage == 'pipeline_cached':
+                pipeline.cache = ReactionCache()
+            if stage == 'pipeline_batch':
+                return list(pipeline.run_batch(items))
+            return [pipeline.run(r) for r in items]
+        return run, len(items)
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def measure(run, repeats, min_time=0.2):
+    """
+    Times a function and returns the time of every measured call, in seconds.
+    The function is called once to warm up, and then 'repeats' times, or more if they took less than 'min_time' in total.
+
+    Args:
+        run (callable): function to time
+        repeats (int): minimum number of measured calls
+        min_time (float, optional): minimum total measured time, in seconds
+    """
+    run()
+    times = []
+    while len(times) < repeats or (sum(times) < min_time and len(times) < 1000):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def cases(stages, multiplicities, batch_sizes):
+    """Returns the (stage, multiplicity, batch size) of every benchmark: stages over every multiplicity with STAGE_BATCH reactions, and the pipeline also over every batch size"""
+    result = []
+    for stage in stages:
+        if stage in PIPELINES:
+            result += [(stage, PIPELINE_MULTIPLICITY, size) for size in batch_sizes]
+            result += [(stage, m, STAGE_BATCH) for m in multiplicities
+                       if (stage, m, STAGE_BATCH) not in result]
+        else:
+            result += [(stage, m, STAGE_BATCH) for m in multiplicities]
+    return result
+
+
+def case_name(stage, multiplicity, size):
+    return f"{stage}[m={multiplicity},n={size}]"
+
+
+def run_benchmarks(stages=STAGES + PIPELINES, multiplicities=MULTIPLICITIES, batch_sizes=BATCH_SIZES, repeats=5, seed=0, log=None):
+    """
+    Runs the benchmarks and returns the results as a JSON-serializable dictionary: 'meta' (machine and version information) and 'results', one entry per case with the best and median time per call and per item.
+
+    Args:
+        stages (iterable, optional): names from STAGES and PIPELINES
+        multiplicities (iterable, optional): numbers of particles per reaction
+        batch_sizes (iterable, optional): numbers of reactions of the end-to-end runs
+        repeats (int, optional): minimum number of measured calls per case
+        seed (int, optional): seed of the workload generator
+        log (file, optional): stream to report progress to
+    """
+    ElementalParticles_db = load_ElementalParticles()
+    ComplexParticles_db = load_ComplexParticles()
+    resolver = ParticleResolver(ElementalParticles_db, ComplexParticles_db)
+    workloads = {}
+    results = []
+    for stage, multiplicity, size in cases(stages, multiplicities, batch_sizes):
+        if (multiplicity, size) not in workloads:
+            workloads[(multiplicity, size)] = Workload(multiplicity, size, ElementalParticles_db, ComplexParticles_db, resolver, seed)
+        run, items = stage_runner(stage, workloads[(multiplicity, size)], ElementalParticles_db, ComplexParticles_db, resolver)
+        times = measure(run, repeats)
+        best = min(times)
+        result = {
+            'name': case_name(stage, multiplicity, size),
+            'stage': stage,
+            'multiplicity': multiplicity,
+            'batch': size,
+            'items': items,
+            'repeats': len(times),
+            'best_s': best,
+            'median_s': statistics.median(times),
+            'best_us_per_item': best / items * 1e6 if items else 0.0,
+        }
+        results.append(result)
+        if log is not None:
+            log.write(f"{result['name']:<50} {result['best_us_per_item']:>12.3f} us/item  ({items} items, {len(times)} runs)\n")
+            log.flush()
+    return {'meta': metadata(seed), 'results': results}
+
+
+def metadata(seed):
+    """Returns the information needed to tell whether two result files are comparable"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+    return {
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+        'seed': seed,
+    }
+
+
+def compare(results, baseline, threshold=0.1):
+    """
+    Compares two result files case by case on the best time per item, and returns a list of (case name, baseline, current, ratio, status) for the cases they share, where status is 'regression' when the current time is over (1 + threshold) times the baseline, 'improvement' when it is under (1 - threshold) times, and 'ok' otherwise.
+
+    Args:
+        results (dict): results of 'run_benchmarks'
+        baseline (dict): results stored earlier
+        threshold (float, optional): relative change that counts as significant
+    """
+    before = {r['name']: r['best_us_per_item'] for r in baseline['results']}
+    rows = []
+    for r in results['results']:
+        if r['name'] not in before or not before[r['name']]:
+            continue
+        ratio = r['best_us_per_item'] / before[r['name']]
+        if ratio > 1 + threshold:
+            status = 'regression'
+        elif ratio < 1 - threshold:
+            status = 'improvement'
+        else:
+            status = 'ok'
+        rows.append((r['name'], before[r['name']], r['best_us_per_item'], ratio, status))
+    return rows
+
+
+def _int_list(text):
+    return [int(float(x)) for x in text.split(',') if x]
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Benchmarks of the Feynman Diagrams Project pipeline")
+    arg_parser.add_argument('--stages', default=','.join(STAGES + PIPELINES),
+                            help="comma-separated stages to run (default: all)")
+    arg_parser.add_argument('--multiplicities', type=_int_list, default=list(MULTIPLICITIES),
+                            help="comma-separated particles per reaction (default: 2,4,8,16,32,50)")
+    arg_parser.add_argument('--batch-sizes', type=_int_list, default=list(BATCH_SIZES),
+                            help="comma-separated batch sizes of the end-to-end runs, up to 1e6 (default: 1,100,10000)")
+    arg_parser.add_argument('--repeats', type=int, default=5, help="minimum measured runs per case (default: 5)")
+    arg_parser.add_argument('--seed', type=int, default=0, help="seed of the workload generator (default: 0)")
+    arg_parser.add_argument('--output', metavar='PATH', help="results file (default: benchmarks/results/<date>.json)")
+    arg_parser.add_argument('--compare', metavar='BASELINE', help="results file to compare with")
+    arg_parser.add_argument('--threshold', type=float, default=0.1,
+                            help="relative slowdown reported as a regression (default: 0.1)")
+    args = arg_parser.parse_args(argv)
+
+    stages = [s for s in args.stages.split(',') if s]
+    unknown = [s for s in stages if s not in STAGES + PIPELINES]
+    if unknown:
+        arg_parser.error(f"unknown stages: {', '.join(unknown)}")
+
+    results = run_benchmarks(stages, args.multiplicities, args.batch_sizes, args.repeats, args.seed, log=sys.stderr)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline, args.threshold)
+        print()
+        print(f"Compared with {args.compare} (commit {baseline['meta'].get('commit') or '?'}), threshold {args.threshold:.0%}:")
+        for name, before, after, ratio, status in rows:
+            print(f"  {name:<50} {before:>12.3f} -> {after:>12.3f} us/item  x{ratio:.2f}  {status}")
+        regressions = [row for row in rows if row[4] == 'regression']
+        print(f"{len(regressions)} regressions, {sum(row[4] == 'improvement' for row in rows)} improvements, {len(rows)} cases compared")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+# Synthetic reaction workloads for the benchmarks
+
+import random
+
+# Reactions that pass validation, by number of particles. Any sum of them conserves every quantum number too (the validator compares them in exact units, see 'quantum_numbers'), so they are combined to reach larger multiplicities
+SEEDS = {
+    2: ['K0 -> anti_k0'],
+    3: ['pi0 -> gamma gamma', 'u antiu -> g', 'K+ -> pi+ pi0'],
+    4: ['e+ e- -> mu+ mu-', 'n -> p e- nu_e+', 'p antiproton -> pi+ pi-', 'e- gamma -> e- gamma', 'pi- p -> K0 lambda0'],
+    5: ['p p -> p n pi+'],
+}
+
+
+def _split(seed):
+    left, right = seed.split('->')
+    return left.split(), right.split()
+
+
+def synthetic_reaction(multiplicity, rng, invalid=False):
+    """
+    Builds a reaction string with 'multiplicity' particles in total, by joining random seed reactions. The particles of every side are shuffled.
+    An 'invalid' reaction gets an extra electron in the final state, so it breaks charge and lepton number conservation.
+
+    Args:
+        multiplicity (int): number of particles, at least 2
+        rng (random.Random): random number generator
+        invalid (bool, optional): make a reaction that breaks a conservation law
+    """
+    if multiplicity < 2:
+        raise ValueError("A reaction needs at least 2 particles")
+    initial, final = [], []
+    remaining = multiplicity
+    while remaining:
+        # Never leave a single particle, which no seed can fill
+        sizes = [size for size in SEEDS if size == remaining or remaining - size >= 2]
+        left, right = _split(rng.choice(SEEDS[rng.choice(sizes)]))
+        initial += left
+        final += right
+        remaining -= len(left) + len(right)
+    rng.shuffle(initial)
+    rng.shuffle(final)
+    if invalid:
+        final.append('e-')
+    return ' '.join(initial) + ' -> ' + ' '.join(final)
+
+
+def reaction_batch(multiplicity, size, seed=0, invalid_fraction=0.2, distinct=None):
+    """
+    Returns a list of 'size' synthetic reactions with 'multiplicity' particles each, the same for the same arguments.
+    With 'distinct', only that many different reactions are built and the batch repeats them, as a stream of user requests would.
+
+    Args:
+        multiplicity (int): number of particles per reaction
+        size (int): number of reactions
+        seed (int, optional): seed of the random number generator
+        invalid_fraction (float, optional): fraction of reactions that fail validation
+        distinct (int, optional): number of different reactions. Defaults to 'size'
+    """
+    rng = random.Random(seed)
+    distinct = min(distinct or size, size)
+    pool = [synthetic_reaction(multiplicity, rng, rng.random() < invalid_fraction) for _ in range(distinct)]
+    if distinct == size:
+        return pool
+    return [pool[rng.randrange(distinct)] for _ in range(size)]
@@ -1,14 +1,19 @@
+import argparse
+import shutil
+import sys
 
 from src.particles import load_ElementalParticles, load_ComplexParticles
 from src.parser import parse_reaction, normalize_particles, analyze_complex_particles
 from src.validator import validate_process
-from src.identifier import (
-    process_particles,
-    identify_flavor_change,
-    identify_strong,
-    identify_em,
-    identify_weak
-)
+from src.identifier import identify_interactions, sorted_reaction
+from src.diagram_generator import generate_diagrams, propagators, TikzWriter
+from src.compiler import LatexCompiler
+from src.pipeline import ReactionPipeline, classify_many, write_jsonl
+from src.resolver import ParticleResolver
+from src.cache import ReactionCache
+from src import instrumentation
+from src.profiling import SlowReactionProfiler
+from src.phasespace import PhaseSpaceGenerator, EVENTS_DIR
 
 def main():
     print()
@@ -21,7 +26,8 @@ def main():
     
     reaction_str = input("Enter a process (e.g., e+ e- -> mu+ mu-): ")
     try:
-        parsed_reaction = parse_reaction(reaction_str)
+        with instrumentation.timer('parse'):
+            parsed_reaction = parse_reaction(reaction_str)
     except Exception as e:
         print(f"Error parsing reaction: {e}")
         return
@@ -32,8 +38,10 @@ def main():
     
     ElementalParticles_db = load_ElementalParticles()
     ComplexParticles_db = load_ComplexParticles()
+    resolver = ParticleResolver(ElementalParticles_db, ComplexParticles_db)
     try:
-        normalized_reaction = normalize_particles(parsed_reaction, ElementalParticles_db, ComplexParticles_db)
+        with instrumentation.timer('normalize'):
+            normalized_reaction = normalize_particles(parsed_reaction, resolver)
     except Exception as e:
         print(f"Error normalizing particles: {e}")
         return
@@ -43,7 +51,8 @@ def main():
     # ------------------------------------------------------------
 
     try:
-        errors = validate_process(normalized_reaction, ElementalParticles_db, ComplexParticles_db)
+        with instrumentation.timer('validate'):
+            errors = validate_process(normalized_reaction, ElementalParticles_db, ComplexParticles_db)
         if errors:
             print()
             print("The reaction is not valid due to the following errors:")
@@ -62,7 +71,8 @@ def main():
     # STEP 4: BREAK COMPLEX INTO ELEMENTAL PARTICLES
     # ------------------------------------------------------------
     try:
-        elemental_reaction = analyze_complex_particles(normalized_reaction, ComplexParticles_db, ElementalParticles_db)
+        with instrumentation.timer('analyze'):
+            elemental_reaction = analyze_complex_particles(normalized_reaction, resolver)
     except Exception as e:
         print(f"Error analyzing complex particles: {e}")
         return
@@ -71,19 +81,13 @@ def main():
     # STEP 5: IDENTIFY REACTIONS
     # ------------------------------------------------------------
 
-    # 5.1 Process particles (group interacting/spectator)
-    spectator, interacting = process_particles(elemental_reaction)
-    updated_interacting = interacting.copy()
-    interactions_found = []
+    # Sorted like in the batch mode, so that both give the same pairs for every ordering of the particles
+    with instrumentation.timer('identify'):
+        interactions, updated_interacting = identify_interactions(sorted_reaction(elemental_reaction), ElementalParticles_db)
 
-    # Initialize interaction variables
-    quark_pairs = []
-    initial_em = []
-    final_em = []
-    weak_pairs = []
-
-    # 5.2 Check for flavor change
-    quark_flavor_pairs, lepton_flavor_pairs, updated_interacting = identify_flavor_change(interacting, ElementalParticles_db)
+    # 5.1 Flavor change
+    quark_flavor_pairs = interactions['flavor_change']['quark_pairs']
+    lepton_flavor_pairs = interactions['flavor_change']['lepton_pairs']
     if quark_flavor_pairs or lepton_flavor_pairs:
         print("Flavor-changing interactions detected:")
         if quark_flavor_pairs:
@@ -93,26 +97,24 @@ def main():
             print()
             print(f"Lepton flavor pairs: {lepton_flavor_pairs}")
 
-    # 5.3 Check strong interaction
-    if updated_interacting['initial'] or updated_interacting['final']:
-        quark_pairs, updated_interacting = identify_strong(updated_interacting, ElementalParticles_db)
-        if quark_pairs:
-            print()
-            print(f"Strong interaction quark pairs: {quark_pairs}")
+    # 5.2 Strong interaction
+    quark_pairs = interactions['strong']['quark_pairs']
+    if quark_pairs:
+        print()
+        print(f"Strong interaction quark pairs: {quark_pairs}")
 
-    # 5.4 Check electromagnetic interaction
-    if updated_interacting['initial'] or updated_interacting['final']:
-        initial_em, final_em, updated_interacting = identify_em(updated_interacting, ElementalParticles_db)
-        if initial_em or final_em:
-            print()
-            print(f"Electromagnetic interaction particles: Initial: {initial_em}, Final: {final_em}")
+    # 5.3 Electromagnetic interaction
+    initial_em = interactions['em']['initial_pairs']
+    final_em = interactions['em']['final_pairs']
+    if initial_em or final_em:
+        print()
+        print(f"Electromagnetic interaction particles: Initial: {initial_em}, Final: {final_em}")
 
-    # 5.5 Check weak interaction
-    if updated_interacting['initial'] or updated_interacting['final']:
-        weak_pairs, updated_interacting = identify_weak(updated_interacting, ElementalParticles_db)
-        if weak_pairs:
-            print()
-            print(f"Weak interaction pairs: {weak_pairs}")
+    # 5.4 Weak interaction
+    weak_pairs = interactions['weak']['pairs']
+    if weak_pairs:
+        print()
+        print(f"Weak interaction pairs: {weak_pairs}")
     
     if updated_interacting['initial'] or updated_interacting['final']:
         print()
@@ -122,29 +124,33 @@ def main():
     # ------------------------------------------------------------
     # STEP 6: GENERATE DIAGRAM
     # ------------------------------------------------------------
-    interactions = {
-        'flavor_change': {
-            'quark_pairs': quark_flavor_pairs,
-            'lepton_pairs': lepton_flavor_pairs
-        },
-        'strong': {
-            'quark_pairs': quark_pairs
-        },
-        'em': {
-            'initial_pairs': initial_em,
-            'final_pairs': final_em
-        },
-        'weak': {
-            'pairs': weak_pairs
-        }
-    }
     
     print()
     generation = input("Do you want to generate a Feynman diagram? (yes/no): ").strip().lower()
     if generation == 'yes':
         try:
-            print("Sorry, diagram generation is not yet implemented.")
+            loops = input("Include one-loop diagrams? (yes/no): ").strip().lower() == 'yes'
+            with instrumentation.timer('diagram'):
+                diagrams = list(generate_diagrams(elemental_reaction, ElementalParticles_db, interactions, loops=int(loops)))
+            print()
+            if not diagrams:
+                print("No diagram could be built for this reaction.")
+            writer = TikzWriter(ElementalParticles_db)
+            for i, diagram in enumerate(diagrams, 1):
+                lines = ", ".join(f"{particle} ({u} -> {v})" for u, v, particle in propagators(diagram))
+                print(f"Diagram {i} ({'one loop' if diagram['loops'] else 'tree level'}): {' '.join(diagram['initial'])} -> {' '.join(diagram['final'])}")
+                print(f"  {diagram['vertices']} vertices, propagators: {lines}")
+                print(f"  TikZ-Feynman source: {writer.write(diagram, reaction_str)}")
             print()
+            if diagrams and shutil.which('pdflatex'):
+                if input("Compile the diagrams to PDF? (yes/no): ").strip().lower() == 'yes':
+                    tex_paths = [writer.write(diagram, reaction_str) for diagram in diagrams]
+                    for record in LatexCompiler().compile_many(tex_paths):
+                        if record.get('error'):
+                            print(f"  {record['tex']}: {record['error']} (see {record['log']})")
+                        else:
+                            print(f"  {record['tex']} -> {record['output']}")
+                    print()
         except Exception as e:
             print(f"Error generating diagram: {e}")
             print()
@@ -152,5 +158,100 @@ def main():
         print("Diagram generation skipped.")
         print()
 
+def batch_main(input_path, output_path, cache_path=None, workers=1, profile_ms=None):
+    """
+    Non-interactive mode: runs every reaction of a file (one per line, '-' for stdin) through the pipeline and writes one JSON Lines record per reaction.
+
+    Args:
+        input_path (str): file with one reaction per line, or '-' to read from stdin
+        output_path (str): file to write the records to, or '-' to write to stdout
+        cache_path (str, optional): file where the result cache is loaded from at startup and saved to at the end. Only with a single worker: the workers of a pool do not share a cache
+        workers (int, optional): number of worker processes (None for one per CPU)
+        profile_ms (float, optional): profile every reaction slower than this many milliseconds and save it to output/profiles/
+    """
+    if cache_path and workers != 1:
+        raise ValueError("A result cache can only be used with a single worker")
+    pipeline = None
+    if workers == 1:
+        pipeline = ReactionPipeline(cache=ReactionCache() if cache_path else None)
+        if cache_path:
+            pipeline.load_cache(cache_path)
+    infile = sys.stdin if input_path == '-' else open(input_path, encoding='utf-8')
+    outfile = sys.stdout if output_path == '-' else open(output_path, 'w', encoding='utf-8')
+    try:
+        if pipeline is not None:
+            profiler = SlowReactionProfiler(profile_ms) if profile_ms is not None else None
+            write_jsonl(pipeline.run_stream(infile, profiler), outfile)
+        else:
+            write_jsonl(classify_many(infile, workers=workers, profile_ms=profile_ms), outfile)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+    if pipeline is not None and cache_path:
+        pipeline.save_cache(cache_path)
+
+def phase_space_main(reaction_str, n_events, out_dir=EVENTS_DIR, sqrt_s=None, seed=None, batch_size=100000):
+    """
+    Non-interactive mode: generates phase-space events for the final state of an allowed reaction and streams them to numbered '.npy' chunks in out_dir (see 'PhaseSpaceGenerator.write').
+
+    Args:
+        reaction_str (str): reaction string (e.g. 'K+ -> pi+ pi0')
+        n_events (int): number of events to generate
+        out_dir (str, optional): directory to write the chunks and their manifest to
+        sqrt_s (float, optional): centre-of-mass energy, required for scattering reactions
+        seed (int, optional): seed of the random numbers
+        batch_size (int, optional): number of events per chunk
+    """
+    ElementalParticles_db = load_ElementalParticles()
+    ComplexParticles_db = load_ComplexParticles()
+    resolver = ParticleResolver(ElementalParticles_db, ComplexParticles_db)
+    try:
+        normalized = normalize_particles(parse_reaction(reaction_str), resolver)
+        generator = PhaseSpaceGenerator(normalized, ElementalParticles_db, ComplexParticles_db, sqrt_s)
+    except ValueError as e:
+        sys.exit(f"Cannot generate events for {reaction_str}: {e}")
+    paths = generator.write(out_dir, n_events, batch_size, seed)
+    print(f"{n_events} events of {reaction_str} written to {len(paths)} chunks in {out_dir}")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description="Feynman Diagrams Project")
+    arg_parser.add_argument('--batch', metavar='FILE', nargs='?', const='-',
+                            help="validate every reaction in FILE (one per line, '-' or nothing for stdin) and write JSON Lines")
+    arg_parser.add_argument('--output', metavar='FILE', default='-',
+                            help="where to write the JSON Lines records in batch mode (default: stdout)")
+    arg_parser.add_argument('--cache', metavar='FILE',
+                            help="result cache to load at startup and save at the end of batch mode (only with --workers 1)")
+    arg_parser.add_argument('--workers', metavar='N', type=int, default=1,
+                            help="number of worker processes in batch mode (0 for one per CPU)")
+    arg_parser.add_argument('--stats', metavar='FILE',
+                            help="record per-stage timings and counters and write them to FILE at the end (JSON if it ends in .json, Prometheus text otherwise)")
+    arg_parser.add_argument('--profile-slow', metavar='MS', type=float,
+                            help="in batch mode, profile every reaction slower than MS milliseconds and save its collapsed stacks and inputs to output/profiles/")
+    arg_parser.add_argument('--phase-space', metavar='REACTION',
+                            help="generate phase-space events for an allowed reaction and write them as .npy chunks to --events-dir")
+    arg_parser.add_argument('--events', metavar='N', type=int, default=1000000,
+                            help="number of phase-space events to generate (default: 1000000)")
+    arg_parser.add_argument('--events-dir', metavar='DIR', default=EVENTS_DIR,
+                            help=f"directory for the phase-space events (default: {EVENTS_DIR})")
+    arg_parser.add_argument('--sqrt-s', metavar='ENERGY', type=float,
+                            help="centre-of-mass energy of the phase-space events (default: the parent mass of a decay)")
+    arg_parser.add_argument('--seed', metavar='N', type=int,
+                            help="seed of the phase-space events")
+    args = arg_parser.parse_args()
+    if args.cache and args.workers != 1:
+        arg_parser.error("--cache can only be used with --workers 1")
+
+    if args.stats:
+        instrumentation.enable()
+    try:
+        if args.phase_space is not None:
+            phase_space_main(args.phase_space, args.events, args.events_dir, args.sqrt_s, args.seed)
+        elif args.batch is not None:
+            batch_main(args.batch, args.output, args.cache, args.workers or None, args.profile_slow)
+        else:
+            main()
+    finally:
+        if args.stats:
+            instrumentation.export(args.stats)
\ No newline at end of file
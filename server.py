@@ -0,0 +1,356 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+
+from src import pipeline
+from src.diagram_generator import generate_diagrams, TikzWriter
+
+# Long-running HTTP/JSON service: the particle databases are loaded once by every worker process, and the results of the pipeline stay cached between requests.
+#
+#   POST /validate   {"reaction": "e+ e- -> mu+ mu-"} or {"reactions": [...]}
+#   POST /identify   same body, returns the whole pipeline record
+#   POST /diagram    same body, plus "loops" (0 or 1) and "tikz" (true to include the TikZ-Feynman source)
+#   GET  /metrics    request counts and latency histograms
+#   GET  /health
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Largest request body accepted, in bytes
+MAX_BODY = 10 * 1024 * 1024
+
+# Default limits of a request: reactions in a batch, and particles in a reaction
+MAX_REACTIONS = 10000
+MAX_PARTICLES = 64
+# Largest diagram that /diagram draws, in legs (two more per loop): the number of topologies grows as (2n-5)!!
+MAX_DIAGRAM_LEGS = 8
+
+logger = logging.getLogger(__name__)
+
+# Fields of a pipeline record that /validate returns
+VALIDATE_FIELDS = ('reaction', 'initial', 'final', 'valid', 'errors', 'stage', 'error')
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large', 422: 'Unprocessable Entity', 500: 'Internal Server Error'}
+
+# TikZ writer of each worker process, created on the first /diagram request that asks for the source
+_worker_writer = None
+
+
+def particle_count(reaction_str):
+    """Returns the number of particles written in a reaction string, counting every token that is not an arrow or a separator. Used to reject oversized reactions before they reach the workers"""
+    tokens = reaction_str.replace(',', ' ').replace(';', ' ').split()
+    return sum(1 for token in tokens if token not in ('->', '+'))
+
+
+def _serve_chunk(task, reactions, options):
+    # Runs in a worker process, with the pipeline created by 'pipeline._init_worker'
+    global _worker_writer
+    if pipeline._worker_watcher is not None:
+        pipeline._worker_watcher.poll()
+    worker_pipeline = pipeline._worker_pipeline
+    if task == 'validate':
+        # Validated together, without identifying the interactions
+        return [{k: v for k, v in record.items() if k in VALIDATE_FIELDS}
+                for record in worker_pipeline.run_many(reactions, validate_only=True)]
+    records = []
+    for reaction_str in reactions:
+        record = worker_pipeline.run(reaction_str)
+        if task == 'diagram' and 'elemental' in record:
+            try:
+                diagrams = list(generate_diagrams(record['elemental'], worker_pipeline.ElementalParticles_db,
+                                                  record['interactions'], options.get('loops', 0), options.get('max_legs')))
+                if options.get('tikz'):
+                    if _worker_writer is None or _worker_writer.db is not worker_pipeline.ElementalParticles_db:
+                        _worker_writer = TikzWriter(worker_pipeline.ElementalParticles_db)
+                    for diagram in diagrams:
+                        diagram['tikz'] = _worker_writer.render(diagram, reaction_str)
+                record['diagrams'] = diagrams
+            except Exception as e:
+                record['stage'] = 'diagram'
+                record['error'] = str(e)
+        records.append(record)
+    return records
+
+
+class LatencyHistogram:
+    """
+    Cumulative histogram of request latencies, with the buckets of LATENCY_BUCKETS (in milliseconds).
+    """
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, milliseconds):
+        """Adds one request that took 'milliseconds'"""
+        self.counts[bisect_left(LATENCY_BUCKETS, milliseconds)] += 1
+        self.count += 1
+        self.total += milliseconds
+
+    def snapshot(self):
+        """Returns the histogram as a dictionary: number of requests, total and mean latency, and the cumulative count of every bucket"""
+        buckets = []
+        cumulative = 0
+        for bound, count in zip(list(LATENCY_BUCKETS) + ['+Inf'], self.counts):
+            cumulative += count
+            buckets.append([bound, cumulative])
+        return {
+            'count': self.count,
+            'sum_ms': round(self.total, 3),
+            'mean_ms': round(self.total / self.count, 3) if self.count else 0.0,
+            'buckets': buckets,
+        }
+
+
+class ReactionServer:
+    """
+    Asynchronous HTTP/JSON server for the reaction pipeline, over TCP or a Unix socket.
+    Requests are parsed on the event loop, and the reactions they carry are sent in chunks to a pool of worker processes, so that validating a large batch never blocks the other connections.
+    Every worker loads the particle databases once, when it starts, and keeps its own result cache for the whole life of the server.
+    With 'watch_interval', workers check the database files before every chunk (at most once per interval) and reload them when they change, dropping only the cached results of the particles that changed.
+    Batches of more than 'max_reactions' reactions are rejected with 413, and reactions with more than 'max_particles' particles with 400, since the cost of identifying and drawing a reaction grows quickly with its size. /diagram only draws diagrams of up to 'max_diagram_legs' legs: a single reaction with more is answered with 422, and in a batch its record gets the error. An unexpected error while answering a request is logged and answered with 500.
+
+    Args:
+        workers (int, optional): number of worker processes. Defaults to the number of CPUs
+        chunksize (int, optional): number of reactions sent to a worker at a time
+        cache_entries (int, optional): size of the result cache of every worker (0 to disable it)
+        elemental_path (str, optional): database of elemental particles
+        complex_path (str, optional): database of complex particles
+        watch_interval (float, optional): seconds between two checks of the database files (None to never reload them)
+        max_reactions (int, optional): largest number of reactions in a request
+        max_particles (int, optional): largest number of particles in a reaction
+        max_diagram_legs (int, optional): largest number of legs of a diagram drawn by /diagram
+    """
+    def __init__(self, workers=None, chunksize=64, cache_entries=100000,
+                 elemental_path="data/ElementalParticles.json", complex_path="data/ComplexParticles.json", watch_interval=1.0,
+                 max_reactions=MAX_REACTIONS, max_particles=MAX_PARTICLES, max_diagram_legs=MAX_DIAGRAM_LEGS):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunksize = chunksize
+        self.max_reactions = max_reactions
+        self.max_particles = max_particles
+        self.max_diagram_legs = max_diagram_legs
+        initargs = (os.path.abspath(elemental_path), os.path.abspath(complex_path), cache_entries, False, None, watch_interval)
+        # Workers are started from a clean process instead of being forked from this one, so that they never inherit the socket of an open connection (which would keep it from closing)
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                            initializer=pipeline._init_worker, initargs=initargs)
+        self.latency = {}
+        self.statuses = {}
+        self.started = time.time()
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=8000, unix_path=None):
+        """
+        Starts the worker processes, waits until they have loaded the particle databases, and starts listening, on a Unix socket if 'unix_path' is given and on host:port otherwise. Returns the asyncio server.
+
+        Args:
+            host (str, optional): address to listen on
+            port (int, optional): TCP port (0 for any free port)
+            unix_path (str, optional): path of a Unix socket
+        """
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, _serve_chunk, 'validate', [], {}) for _ in range(self.workers)))
+        if unix_path:
+            self.server = await asyncio.start_unix_server(self.handle, path=unix_path)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def close(self):
+        """Stops listening and shuts the worker processes down"""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown()
+
+    async def handle(self, reader, writer):
+        # One connection: requests are answered in order until the client closes it or asks to
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'Malformed request line'}, False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'Invalid Content-Length'}, False)
+                    break
+                if length > MAX_BODY:
+                    await self._respond(writer, 413, {'error': f'Request body over {MAX_BODY} bytes'}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                start = time.perf_counter()
+                path = target.split('?', 1)[0]
+                try:
+                    status, payload = await self.dispatch(method, path, body)
+                except Exception:
+                    logger.exception("Error answering %s %s", method, path)
+                    status, payload = 500, {'error': 'Internal server error'}
+                elapsed = (time.perf_counter() - start) * 1000
+                self.latency.setdefault(path if status != 404 else 'other', LatencyHistogram()).observe(elapsed)
+                self.statuses[status] = self.statuses.get(status, 0) + 1
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def dispatch(self, method, path, body):
+        """
+        Answers one request and returns (HTTP status, JSON-serializable payload).
+
+        Args:
+            method (str): HTTP method
+            path (str): path of the request, without the query string
+            body (bytes): request body
+        """
+        if path == '/health':
+            return 200, {'status': 'ok', 'workers': self.workers, 'uptime_s': round(time.time() - self.started, 3)}
+        if path == '/metrics':
+            return 200, self.metrics()
+        task = path.strip('/')
+        if task not in ('validate', 'identify', 'diagram'):
+            return 404, {'error': f'Unknown endpoint: {path}'}
+        if method != 'POST':
+            return 405, {'error': f'{path} only accepts POST'}
+
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError as e:
+            return 400, {'error': f'Invalid JSON: {e}'}
+        if not isinstance(request, dict):
+            return 400, {'error': 'The request body must be a JSON object'}
+        options = {'loops': request.get('loops', 0), 'tikz': bool(request.get('tikz', False)), 'max_legs': self.max_diagram_legs}
+        if options['loops'] not in (0, 1):
+            return 400, {'error': "'loops' must be 0 or 1"}
+
+        single = isinstance(request.get('reaction'), str)
+        if single:
+            reactions = [request['reaction']]
+        elif isinstance(request.get('reactions'), list) and all(isinstance(r, str) for r in request['reactions']):
+            reactions = request['reactions']
+            if len(reactions) > self.max_reactions:
+                return 413, {'error': f'{len(reactions)} reactions in one request, over the limit of {self.max_reactions}'}
+        else:
+            return 400, {'error': "The request needs a 'reaction' string or a 'reactions' list of strings"}
+        for reaction_str in reactions:
+            count = particle_count(reaction_str)
+            if count > self.max_particles:
+                return 400, {'error': f'Reaction with {count} particles, over the limit of {self.max_particles}: {reaction_str[:100]}'}
+
+        records = await self.run(task, reactions, options)
+        if single:
+            if task == 'diagram' and records[0].get('stage') == 'diagram':
+                return 422, records[0]
+            return 200, records[0]
+        return 200, {'records': records}
+
+    async def run(self, task, reactions, options):
+        """
+        Runs a task ('validate', 'identify' or 'diagram') on the worker processes and returns one record per reaction, in order.
+
+        Args:
+            task (str): endpoint name
+            reactions (list): reaction strings
+            options (dict): 'loops', 'tikz' and 'max_legs' options of /diagram
+        """
+        loop = asyncio.get_running_loop()
+        chunks = [reactions[i:i + self.chunksize] for i in range(0, len(reactions), self.chunksize)]
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self.executor, _serve_chunk, task, chunk, options) for chunk in chunks
+        ))
+        return [record for chunk in results for record in chunk]
+
+    def metrics(self):
+        """Returns the number of responses per status and the latency histogram of every endpoint"""
+        return {
+            'uptime_s': round(time.time() - self.started, 3),
+            'responses': {str(status): count for status, count in sorted(self.statuses.items())},
+            'latency_ms': {path: histogram.snapshot() for path, histogram in sorted(self.latency.items())},
+        }
+
+
+async def serve(host, port, unix_path=None, workers=None, watch_interval=1.0, max_reactions=MAX_REACTIONS, max_particles=MAX_PARTICLES,
+                max_diagram_legs=MAX_DIAGRAM_LEGS):
+    """
+    Runs the server until it is interrupted.
+
+    Args:
+        host (str): address to listen on
+        port (int): TCP port
+        unix_path (str, optional): path of a Unix socket, used instead of host:port
+        workers (int, optional): number of worker processes
+        watch_interval (float, optional): seconds between two checks of the database files (None to never reload them)
+        max_reactions (int, optional): largest number of reactions in a request
+        max_particles (int, optional): largest number of particles in a reaction
+        max_diagram_legs (int, optional): largest number of legs of a diagram drawn by /diagram
+    """
+    server = ReactionServer(workers=workers, watch_interval=watch_interval, max_reactions=max_reactions, max_particles=max_particles,
+                            max_diagram_legs=max_diagram_legs)
+    try:
+        listener = await server.start(host, port, unix_path)
+        where = unix_path or ', '.join(str(sock.getsockname()) for sock in listener.sockets)
+        print(f"Serving the Feynman Diagrams Project on {where} with {server.workers} workers")
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.close()
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Feynman Diagrams Project HTTP/JSON server")
+    arg_parser.add_argument('--host', default='127.0.0.1', help="address to listen on (default: 127.0.0.1)")
+    arg_parser.add_argument('--port', type=int, default=8000, help="TCP port (default: 8000)")
+    arg_parser.add_argument('--unix', metavar='PATH', help="listen on a Unix socket instead of a TCP port")
+    arg_parser.add_argument('--workers', metavar='N', type=int, default=0,
+                            help="number of worker processes (default: one per CPU)")
+    arg_parser.add_argument('--watch', metavar='SECONDS', type=float, default=1.0,
+                            help="how often workers check the particle databases for edits (default: 1, 0 to disable)")
+    arg_parser.add_argument('--max-reactions', metavar='N', type=int, default=MAX_REACTIONS,
+                            help=f"largest number of reactions in a request (default: {MAX_REACTIONS})")
+    arg_parser.add_argument('--max-particles', metavar='N', type=int, default=MAX_PARTICLES,
+                            help=f"largest number of particles in a reaction (default: {MAX_PARTICLES})")
+    arg_parser.add_argument('--max-diagram-legs', metavar='N', type=int, default=MAX_DIAGRAM_LEGS,
+                            help=f"largest number of legs of a diagram drawn by /diagram, two more per loop (default: {MAX_DIAGRAM_LEGS})")
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers or None, args.watch or None, args.max_reactions, args.max_particles,
+                          args.max_diagram_legs))
+    except KeyboardInterrupt:
+        pass
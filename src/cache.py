@@ -0,0 +1,165 @@
+# Caches pipeline results of reactions that have already been processed
+
+import json
+import os
+import time
+from collections import OrderedDict
+
+
+def canonical_key(resolved):
+    """
+    Returns the canonical form of a reaction: the sorted multiset of particle IDs on each side.
+    Reactions that only differ in the order of their particles (e.g. 'e- e+ -> mu- mu+' and 'e+ e- -> mu+ mu-') share the same key.
+
+    Args:
+        resolved (dict): reaction with 'initial' and 'final' lists of particle IDs (from 'resolve_particles')
+    """
+    return (tuple(sorted(resolved['initial'])), tuple(sorted(resolved['final'])))
+
+
+class ReactionCache:
+    """
+    Least-recently-used cache of pipeline results, keyed by the canonical form of the reaction.
+    Entries are evicted when there are more than 'max_entries' of them or when their total size goes over 'max_bytes' (measured as the size of their JSON form), and expire 'ttl' seconds after they were stored.
+    Values must be JSON-serializable so that the cache can be saved to disk and loaded again at startup.
+
+    Args:
+        max_entries (int, optional): maximum number of entries
+        max_bytes (int, optional): memory budget for the stored values, in bytes of JSON
+        ttl (float, optional): time to live of every entry, in seconds. Entries never expire if not given
+    """
+    def __init__(self, max_entries=100000, max_bytes=64 * 1024 * 1024, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # key -> (value, expiry time or None, size in bytes), least recently used first
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """Returns the value stored for a key and marks it as recently used, or None if there is no valid entry"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires, size = entry
+        if expires is not None and expires <= time.time():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, expires=None):
+        """
+        Stores a value, evicting the least recently used entries if the cache goes over its limits.
+        A value larger than the whole memory budget is not stored.
+
+        Args:
+            key (tuple): canonical key of the reaction (from 'canonical_key')
+            value (dict): JSON-serializable result
+            expires (float, optional): expiry time (as given by time.time()). Defaults to now + ttl
+        """
+        size = len(json.dumps(value, ensure_ascii=False))
+        if size > self.max_bytes:
+            return
+        if expires is None and self.ttl is not None:
+            expires = time.time() + self.ttl
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, expires, size)
+        self.size += size
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        value, expires, size = self._entries.pop(key)
+        self.size -= size
+
+    def clear(self):
+        """Removes every entry (the counters are kept)"""
+        self._entries.clear()
+        self.size = 0
+
+    def invalidate(self, particle_ids):
+        """
+        Removes the entries of every reaction that involves one of the given particles, and returns how many were removed.
+
+        Args:
+            particle_ids (set): particle IDs whose results are no longer valid
+        """
+        stale = [key for key in self._entries
+                 if not particle_ids.isdisjoint(key[0]) or not particle_ids.isdisjoint(key[1])]
+        for key in stale:
+            self._remove(key)
+        return len(stale)
+
+    def stats(self):
+        """Returns the counters of the cache"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def save(self, path, signature=None):
+        """
+        Writes the cache to a JSON file, least recently used entries first. Expired entries are left out.
+
+        Args:
+            path (str): file to write
+            signature (str, optional): fingerprint of the particle databases the results were computed with
+        """
+        now = time.time()
+        entries = [
+            [list(initial), list(final), expires, value]
+            for (initial, final), (value, expires, size) in self._entries.items()
+            if expires is None or expires > now
+        ]
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'signature': signature, 'entries': entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def load(self, path, signature=None):
+        """
+        Loads the entries of a file written by 'save' and returns how many were loaded.
+        Nothing is loaded if the file does not exist or was saved with a different database signature, since particle IDs would not match.
+
+        Args:
+            path (str): file to read
+            signature (str, optional): fingerprint of the current particle databases
+        """
+        if not os.path.exists(path):
+            return 0
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('signature') != signature:
+            return 0
+        now = time.time()
+        count = 0
+        for initial, final, expires, value in data['entries']:
+            if expires is not None and expires <= now:
+                continue
+            self.put((tuple(initial), tuple(final)), value, expires)
+            count += 1
+        return count
@@ -0,0 +1,238 @@
+# Simulates decay cascades: unstable particles are decayed recursively down to stable products, with the channels sampled from their branching fractions
+
+import random
+import warnings
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed to sample many cascades at once
+    np = None
+
+from src.validator import validate_process
+
+
+class AliasTable:
+    """
+    Walker's alias table (Vose's construction) for a discrete distribution: built once in O(n), then every sample costs one random number and one comparison, whatever the number of outcomes.
+
+    Args:
+        weights (list): non-negative weights of the outcomes (they do not have to add up to 1)
+    """
+    __slots__ = ('prob', 'alias', 'n')
+
+    def __init__(self, weights):
+        total = float(sum(weights))
+        if not weights or total <= 0:
+            raise ValueError("An alias table needs at least one positive weight")
+        n = len(weights)
+        scaled = [w * n / total for w in weights]
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        self.n = n
+        small = [i for i, w in enumerate(scaled) if w < 1]
+        large = [i for i, w in enumerate(scaled) if w >= 1]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            # The large outcome gives away what fills the column of the small one
+            scaled[l] -= 1 - scaled[s]
+            (small if scaled[l] < 1 else large).append(l)
+        # What is left is 1 up to rounding errors
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def sample(self, rng):
+        """
+        Returns the index of one outcome.
+
+        Args:
+            rng (random.Random): source of random numbers
+        """
+        u = rng.random() * self.n
+        i = int(u)
+        return i if u - i < self.prob[i] else self.alias[i]
+
+    def sample_array(self, size, rng):
+        """
+        Returns the indexes of 'size' outcomes as a numpy array. Requires numpy.
+
+        Args:
+            size (int): number of samples
+            rng (numpy.random.Generator): source of random numbers
+        """
+        u = rng.random(size) * self.n
+        i = u.astype(np.int64)
+        return np.where(u - i < np.asarray(self.prob)[i], i, np.asarray(self.alias)[i])
+
+
+class CascadeSimulator:
+    """
+    Follows unstable particles down to their stable products using the 'decays' of the particle databases.
+    Every channel is checked once with 'validate_process' the first time its parent is decayed, and the channels that break a conservation law are left out (see 'rejected') with a warning, since they point to an error in the databases, and the branching fractions of the others are renormalized. The alias table of every parent is built once, so every decay step is O(1).
+    The fully expanded decay tree of every particle, the probability of each of its stable final states, is also computed once ('final_states'), so that a whole cascade can be sampled in O(1) when only its final state is needed.
+
+    Args:
+        ElementalParticles_db (dict): database of elemental particles
+        ComplexParticles_db (dict, optional): database of complex particles
+        stable (iterable, optional): names of particles that are not decayed even if they have channels (e.g. the long-lived pions and kaons that reach a detector)
+    """
+    def __init__(self, ElementalParticles_db, ComplexParticles_db=None, stable=()):
+        self.ElementalParticles_db = ElementalParticles_db
+        self.ComplexParticles_db = ComplexParticles_db or {}
+        self.stable = frozenset(stable)
+        # (parent, products) -> errors of 'validate_process', computed once per channel
+        self.validated = {}
+        # parent -> channels that were left out, as (products, errors)
+        self.rejected = {}
+        # parent -> (products of the valid channels, their probabilities, alias table), or None for stable particles
+        self._tables = {}
+        # parent -> (final states, probabilities, alias table)
+        self._final_states = {}
+
+    def particle(self, name):
+        """Returns a particle from either database, by name"""
+        if name in self.ElementalParticles_db:
+            return self.ElementalParticles_db[name]
+        if name in self.ComplexParticles_db:
+            return self.ComplexParticles_db[name]
+        raise KeyError(f"Particle '{name}' not found in either database")
+
+    def validate(self, parent, products):
+        """Returns the errors of the decay of 'parent' into 'products', checked with 'validate_process' only the first time"""
+        key = (parent, products)
+        errors = self.validated.get(key)
+        if errors is None:
+            try:
+                errors = validate_process({'initial': [parent], 'final': list(products)},
+                                          self.ElementalParticles_db, self.ComplexParticles_db)
+            except KeyError as e:
+                errors = [str(e)]
+            self.validated[key] = errors
+        return errors
+
+    def _table(self, name):
+        if name in self._tables:
+            return self._tables[name]
+        table = None
+        if name not in self.stable:
+            channels = []
+            for products, branching in self.particle(name).decays:
+                errors = self.validate(name, products)
+                if errors:
+                    self.rejected.setdefault(name, []).append((products, errors))
+                elif branching > 0:
+                    channels.append((products, branching))
+            if name in self.rejected:
+                rejected = '; '.join(f"{' '.join(products)} ({', '.join(errors)})" for products, errors in self.rejected[name])
+                warnings.warn(f"Decay channels of '{name}' left out: {rejected}", RuntimeWarning)
+            if channels:
+                total = sum(b for _, b in channels)
+                table = ([products for products, _ in channels], [b / total for _, b in channels],
+                         AliasTable([b for _, b in channels]))
+        self._tables[name] = table
+        return table
+
+    def channels(self, name):
+        """Returns the valid decay channels of a particle as (products, probability) pairs, with the probabilities renormalized, or an empty list if it is stable"""
+        table = self._table(name)
+        if table is None:
+            return []
+        return list(zip(table[0], table[1]))
+
+    def is_stable(self, name):
+        """Returns True if the particle is not decayed: it is in 'stable', or it has no valid channel"""
+        return self._table(name) is None
+
+    def decay(self, name, rng):
+        """
+        Samples one decay channel of a particle and returns its products, or None if it is stable.
+
+        Args:
+            name (str): name of the particle
+            rng (random.Random): source of random numbers
+        """
+        table = self._table(name)
+        if table is None:
+            return None
+        products, _, alias = table
+        return products[alias.sample(rng)]
+
+    def sample_tree(self, name, rng):
+        """
+        Samples a full cascade step by step and returns it as nested (particle, children) pairs, where children is a tuple of the same pairs for every product, and empty for stable particles.
+
+        Args:
+            name (str): name of the first particle
+            rng (random.Random): source of random numbers
+        """
+        products = self.decay(name, rng)
+        if products is None:
+            return (name, ())
+        return (name, tuple(self.sample_tree(product, rng) for product in products))
+
+    def final_states(self, name):
+        """
+        Returns the fully expanded decay tree of a particle, as a dictionary of its stable final states (sorted tuples of names) and their probabilities.
+        It is computed once per particle, from the final states of its products, and kept for the next calls.
+
+        Args:
+            name (str): name of the particle
+        """
+        return dict(zip(*self._expanded(name)[:2]))
+
+    def _expanded(self, name):
+        if name in self._final_states:
+            return self._final_states[name]
+        if self.is_stable(name):
+            states = {(name,): 1.0}
+        else:
+            states = Counter()
+            for products, probability in self.channels(name):
+                # Combine the final states of every product, as independent decays
+                combined = {(): probability}
+                for product in products:
+                    product_states, product_probabilities, _ = self._expanded(product)
+                    merged = Counter()
+                    for state, p in combined.items():
+                        for product_state, q in zip(product_states, product_probabilities):
+                            merged[tuple(sorted(state + product_state))] += p * q
+                    combined = merged
+                for state, p in combined.items():
+                    states[state] += p
+        final = list(states)
+        probabilities = [states[state] for state in final]
+        self._final_states[name] = (final, probabilities, AliasTable(probabilities))
+        return self._final_states[name]
+
+    def sample_final_state(self, name, rng):
+        """
+        Returns the stable final state of one cascade of a particle, as a sorted tuple of names, in O(1) from its expanded decay tree.
+
+        Args:
+            name (str): name of the particle
+            rng (random.Random): source of random numbers
+        """
+        final, _, alias = self._expanded(name)
+        return final[alias.sample(rng)]
+
+    def simulate(self, name, n_cascades, seed=None):
+        """
+        Simulates n_cascades cascades of a particle and returns how many times every stable final state came out, as a Counter.
+        The final states are sampled from the expanded decay tree, all at once with numpy if it is installed.
+
+        Args:
+            name (str): name of the particle
+            n_cascades (int): number of cascades
+            seed (int, optional): seed of the random numbers
+        """
+        final, _, alias = self._expanded(name)
+        if np is not None:
+            counts = np.bincount(alias.sample_array(n_cascades, np.random.default_rng(seed)), minlength=len(final))
+            return Counter({state: int(count) for state, count in zip(final, counts) if count})
+        rng = random.Random(seed)
+        sample = alias.sample
+        counts = Counter(sample(rng) for _ in range(n_cascades))
+        return Counter({final[i]: count for i, count in counts.items()})
@@ -0,0 +1,304 @@
+# Compiles TikZ-Feynman files to PDF or PNG, in parallel and with a cache of the results
+
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+ENGINES = ('pdflatex', 'lualatex')
+FORMATS = ('pdf', 'png')
+CACHE_DIR = os.path.join('output', 'diagrams')
+LOG_DIR = os.path.join('output', 'logs')
+
+BEGIN_DOCUMENT = '\\begin{document}'
+END_DOCUMENT = '\\end{document}'
+
+
+@lru_cache(maxsize=None)
+def toolchain_version(engine):
+    """
+    Returns the version line of a LaTeX engine (e.g. 'pdfTeX 3.141592653-2.6-1.40.25 (TeX Live 2023)'). Compiled files are cached per version, so that updating TeX Live invalidates them.
+    Raises FileNotFoundError if the engine is not installed.
+
+    Args:
+        engine (str): 'pdflatex' or 'lualatex'
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown LaTeX engine: {engine}")
+    if shutil.which(engine) is None:
+        raise FileNotFoundError(f"LaTeX engine not found: {engine}")
+    result = subprocess.run([engine, '--version'], capture_output=True, text=True, timeout=30)
+    return result.stdout.splitlines()[0].strip() if result.stdout else engine
+
+
+def cache_key(source, version, output_format='pdf'):
+    """
+    Returns the name under which the result of compiling a source is cached: the SHA-256 of the source, the engine version and the output format.
+
+    Args:
+        source (str): LaTeX source
+        version (str): version of the engine (from 'toolchain_version')
+        output_format (str, optional): 'pdf' or 'png'
+    """
+    digest = hashlib.sha256()
+    for part in (version, output_format, source):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()[:24]
+
+
+def split_document(source):
+    """
+    Splits a LaTeX document into its preamble and its body (the part between \\begin{document} and \\end{document}).
+
+    Args:
+        source (str): LaTeX source of a whole document
+    """
+    start = source.index(BEGIN_DOCUMENT)
+    end = source.rindex(END_DOCUMENT)
+    return source[:start], source[start + len(BEGIN_DOCUMENT):end]
+
+
+def preamble_key(preamble):
+    """
+    Returns a preamble without its comment lines, which is what documents must share to be compiled together.
+
+    Args:
+        preamble (str): preamble of a document (from 'split_document')
+    """
+    return ''.join(line for line in preamble.splitlines(keepends=True) if not line.lstrip().startswith('%'))
+
+
+def batch_document(sources):
+    """
+    Joins documents that share the same preamble into a single document, one page per document (the 'standalone' class of the TikZ-Feynman template starts a new page for every tikzpicture).
+    Comment lines are left out of the preambles, so they may differ. Raises ValueError if the rest of the preambles differ.
+
+    Args:
+        sources (list): LaTeX sources of whole documents
+    """
+    preamble = None
+    bodies = []
+    for source in sources:
+        head, body = split_document(source)
+        head = preamble_key(head)
+        if preamble is None:
+            preamble = head
+        elif head != preamble:
+            raise ValueError("Only documents with the same preamble can be compiled together")
+        bodies.append(body.strip('\n'))
+    return preamble + BEGIN_DOCUMENT + '\n' + '\n'.join(bodies) + '\n' + END_DOCUMENT + '\n'
+
+
+class LatexCompiler:
+    """
+    Compiles a queue of .tex files with a bounded pool of LaTeX processes.
+
+    Every result is stored in 'cache_dir' under a name made from the source, the engine version and the format (see 'cache_key'), so a file that was already compiled with the same toolchain is never compiled again.
+    A file compiled as a page of a batch PDF gets a '.page' entry under its own key, with the key of the batch document and its page, so it is found again whatever batch it comes in next.
+    The output of every run is kept in 'log_dir', named after the same key, whether it succeeded or not. A run that takes longer than 'timeout' seconds is stopped and reported as failed.
+
+    Args:
+        engine (str, optional): 'pdflatex' or 'lualatex'
+        workers (int, optional): number of LaTeX processes run at the same time. Defaults to the number of CPUs
+        output_format (str, optional): 'pdf', or 'png' (which needs 'pdftoppm')
+        timeout (float, optional): time limit of every run, in seconds
+        cache_dir (str, optional): directory of the compiled files
+        log_dir (str, optional): directory of the logs
+        dpi (int, optional): resolution of the PNG files
+    """
+    def __init__(self, engine='pdflatex', workers=None, output_format='pdf', timeout=60,
+                 cache_dir=CACHE_DIR, log_dir=LOG_DIR, dpi=300):
+        if output_format not in FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+        if output_format == 'png' and shutil.which('pdftoppm') is None:
+            raise FileNotFoundError("PNG output needs pdftoppm (poppler-utils)")
+        self.engine = engine
+        self.version = toolchain_version(engine)
+        self.workers = workers or os.cpu_count() or 1
+        self.output_format = output_format
+        self.timeout = timeout
+        self.cache_dir = cache_dir
+        self.log_dir = log_dir
+        self.dpi = dpi
+        self.compiled = 0
+        self.cached = 0
+        self.failed = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        os.makedirs(log_dir, exist_ok=True)
+
+    def _output_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.{self.output_format}")
+
+    def _page_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.page")
+
+    def _lookup(self, tex_path, key):
+        # Record of a file whose result is in the cache, on its own or as a page of a batch PDF, or None
+        output = self._output_path(key)
+        if os.path.exists(output):
+            return {'tex': tex_path, 'output': output, 'cached': True}
+        if self.output_format != 'pdf':
+            return None
+        try:
+            with open(self._page_path(key), encoding='utf-8') as f:
+                batch_key, page = f.read().split()
+        except (OSError, ValueError):
+            return None
+        output = self._output_path(batch_key)
+        if not os.path.exists(output):
+            return None
+        return {'tex': tex_path, 'output': output, 'page': int(page), 'cached': True}
+
+    def _store_pages(self, jobs, batch_key):
+        # Writes the '.page' entry of every file of a batch PDF, through a temporary file so that readers never see a partial entry
+        for page, (tex_path, source, key) in enumerate(jobs, 1):
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(f"{batch_key} {page}\n")
+            os.replace(tmp_path, self._page_path(key))
+
+    def _run(self, source, key):
+        # Compiles one document in a scratch directory and returns (PDF path in the scratch directory or None, error, scratch directory)
+        scratch = tempfile.mkdtemp(prefix='feynman-')
+        tex_path = os.path.join(scratch, 'diagram.tex')
+        with open(tex_path, 'w', encoding='utf-8') as f:
+            f.write(source)
+        command = [self.engine, '-interaction=nonstopmode', '-halt-on-error', '-output-directory', scratch, tex_path]
+        error = None
+        try:
+            result = subprocess.run(command, cwd=scratch, capture_output=True, text=True, errors='replace', timeout=self.timeout)
+            output = result.stdout + result.stderr
+            if result.returncode != 0:
+                error = f"{self.engine} exited with status {result.returncode}"
+        except subprocess.TimeoutExpired as e:
+            output = e.stdout or ''
+            if isinstance(output, bytes):
+                output = output.decode('utf-8', 'replace')
+            error = f"{self.engine} timed out after {self.timeout} s"
+        log_path = os.path.join(self.log_dir, f"{key}.log")
+        with open(log_path, 'w', encoding='utf-8') as f:
+            f.write(output)
+        pdf_path = os.path.join(scratch, 'diagram.pdf')
+        if error is None and not os.path.exists(pdf_path):
+            error = f"{self.engine} did not produce a PDF"
+        return (None if error else pdf_path), error, scratch, log_path
+
+    def _store(self, pdf_path, key, page=None):
+        # Moves a compiled PDF (or one of its pages, rasterized) into the cache, through a temporary file of its own so that workers storing the same key never write to the same file
+        target = self._output_path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            if self.output_format == 'pdf':
+                shutil.copyfile(pdf_path, tmp_path)
+            else:
+                command = ['pdftoppm', '-png', '-r', str(self.dpi), '-singlefile']
+                if page is not None:
+                    command += ['-f', str(page), '-l', str(page)]
+                subprocess.run(command + [pdf_path, tmp_path], check=True, capture_output=True, timeout=self.timeout)
+                os.replace(tmp_path + '.png', tmp_path)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, target)
+        except BaseException:
+            for path in (tmp_path, tmp_path + '.png'):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        return target
+
+    def _compile_one(self, tex_path, source, key):
+        pdf_path, error, scratch, log_path = self._run(source, key)
+        try:
+            if error:
+                return {'tex': tex_path, 'output': None, 'cached': False, 'log': log_path, 'error': error}
+            return {'tex': tex_path, 'output': self._store(pdf_path, key), 'cached': False, 'log': log_path}
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    def _compile_batch(self, jobs):
+        # Compiles several documents as the pages of one document. A PDF result is the whole document, with the page of every diagram; a PNG result is one file per diagram
+        source = batch_document([source for tex_path, source, key in jobs])
+        batch_key = cache_key(source, self.version, self.output_format)
+        if self.output_format == 'pdf' and os.path.exists(self._output_path(batch_key)):
+            self._store_pages(jobs, batch_key)
+            return [{'tex': tex_path, 'output': self._output_path(batch_key), 'page': page, 'cached': True}
+                    for page, (tex_path, source, key) in enumerate(jobs, 1)]
+        pdf_path, error, scratch, log_path = self._run(source, batch_key)
+        try:
+            if error:
+                return [{'tex': tex_path, 'output': None, 'cached': False, 'log': log_path, 'error': error}
+                        for tex_path, source, key in jobs]
+            if self.output_format == 'pdf':
+                output = self._store(pdf_path, batch_key)
+                self._store_pages(jobs, batch_key)
+                return [{'tex': tex_path, 'output': output, 'page': page, 'cached': False, 'log': log_path}
+                        for page, (tex_path, source, key) in enumerate(jobs, 1)]
+            return [{'tex': tex_path, 'output': self._store(pdf_path, key, page), 'cached': False, 'log': log_path}
+                    for page, (tex_path, source, key) in enumerate(jobs, 1)]
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    def compile_many(self, tex_paths, batch=False, batch_size=64):
+        """
+        Compiles .tex files and returns one record per file, in order: 'tex' (the input), 'output' (the compiled file, or None if it failed), 'cached' (True if it was not compiled again), 'log' (output of the engine) and 'error' when it failed.
+
+        With 'batch', files that share the same preamble are compiled together, up to 'batch_size' per run, which pays the startup of the engine once per batch instead of once per file. In PDF format, the records then point to the multi-page document and give the 'page' of every file.
+        Every file is looked up in the cache first, also as a page of an earlier batch, and only the files that are not there are compiled.
+
+        Args:
+            tex_paths (iterable): .tex files to compile
+            batch (bool, optional): compile several files per run
+            batch_size (int, optional): maximum number of files per run
+        """
+        records = []
+        jobs = []
+        for tex_path in tex_paths:
+            with open(tex_path, encoding='utf-8') as f:
+                source = f.read()
+            key = cache_key(source, self.version, self.output_format)
+            records.append(self._lookup(tex_path, key))
+            if records[-1] is None:
+                jobs.append((len(records) - 1, tex_path, source, key))
+
+        if batch:
+            groups = {}
+            for job in jobs:
+                groups.setdefault(preamble_key(split_document(job[2])[0]), []).append(job)
+            units = [group[i:i + batch_size] for group in groups.values() for i in range(0, len(group), batch_size)]
+        else:
+            units = [[job] for job in jobs]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = []
+            for unit in units:
+                work = [(tex_path, source, key) for i, tex_path, source, key in unit]
+                if len(unit) > 1:
+                    futures.append((unit, executor.submit(self._compile_batch, work)))
+                else:
+                    futures.append((unit, executor.submit(self._compile_one, *work[0])))
+            for unit, future in futures:
+                results = future.result()
+                for (i, tex_path, source, key), record in zip(unit, results if len(unit) > 1 else [results]):
+                    records[i] = record
+
+        for record in records:
+            if record.get('error'):
+                self.failed += 1
+            elif record['cached']:
+                self.cached += 1
+            else:
+                self.compiled += 1
+        return records
+
+    def compile(self, tex_path):
+        """
+        Compiles a single .tex file and returns its record (see 'compile_many').
+
+        Args:
+            tex_path (str): .tex file to compile
+        """
+        return self.compile_many([tex_path])[0]
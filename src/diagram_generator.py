@@ -0,0 +1,625 @@
+# Generates the Feynman diagrams of a reaction as graphs of vertices and propagators
+
+import hashlib
+import os
+from collections import Counter
+from functools import lru_cache
+from itertools import combinations, permutations, product
+from string import Template
+
+# Diagrams are graphs whose nodes 0..n-1 are the external legs (initial particles first, then final ones) and whose nodes n, n+1, ... are the vertices.
+# Every vertex joins three lines. Edges are (u, v) pairs, and an external leg is always the first node of its edge.
+# A particle on an edge is stored as the particle that travels from u to v. At a vertex, every line is read as outgoing: the line (u, v) carries that particle out of u and its antiparticle out of v.
+
+# Bosons that can be exchanged for every type of interaction found by 'identify_interactions'
+INTERACTION_BOSONS = {
+    'flavor_change': ('W+', 'W-'),
+    'strong': ('gluon',),
+    'em': ('gamma',),
+    'weak': ('Z', 'W+', 'W-'),
+}
+
+# Vertices with three gauge bosons
+BOSON_VERTICES = {
+    ('W+', 'W-', 'gamma'),
+    ('W+', 'W-', 'Z'),
+    ('gluon', 'gluon', 'gluon'),
+}
+
+# Template of the TikZ-Feynman files, and where they are written
+TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), 'templates', 'feynman_template.tex')
+OUTPUT_DIR = os.path.join('output', 'diagrams')
+
+# TikZ-Feynman style of the lines of every boson (fermions are drawn with arrows)
+LINE_STYLES = {
+    'gamma': 'photon',
+    'gluon': 'gluon',
+    'W+': 'boson',
+    'W-': 'boson',
+    'Z': 'boson',
+    'Higgs': 'scalar',
+}
+
+# Distance between neighbouring legs, in cm
+SPACING = 1.5
+
+# Number of spectator particles that can be pulled into the diagram when the interacting particles alone cannot form one
+MAX_BORROWED = 2
+
+# Largest number of legs whose topologies are kept in the cache, counting the two extra legs of the trees that one-loop topologies are built from. There are (2n-5)!! trees with n legs: 10395 with 8 legs, but 2027025 with 10
+MAX_CACHED_LEGS = 8
+
+
+def _trees(n_legs):
+    # Trees with more legs than MAX_CACHED_LEGS are built again on every call, from the cached ones
+    if n_legs <= MAX_CACHED_LEGS:
+        return _cached_trees(n_legs)
+    return _grow_trees(_trees(n_legs - 1), n_legs)
+
+
+@lru_cache(maxsize=None)
+def _cached_trees(n_legs):
+    if n_legs == 3:
+        return (((0, 3), (1, 3), (2, 3)),)
+    return _grow_trees(_cached_trees(n_legs - 1), n_legs)
+
+
+def _grow_trees(smaller, n_legs):
+    # Every tree with 'n_legs' labelled legs is found once by adding the last leg in the middle of every edge of the trees with one leg less
+    trees = []
+    new_leg = n_legs - 1
+    new_vertex = 2 * n_legs - 3
+    for tree in smaller:
+        # The previous vertices move up by one to leave room for the new leg
+        shifted = [(u if u < new_leg else u + 1, v + 1) for u, v in tree]
+        for i, (u, v) in enumerate(shifted):
+            edges = shifted[:i] + [(u, new_vertex), (v, new_vertex), (new_leg, new_vertex)] + shifted[i + 1:]
+            trees.append(tuple(sorted(edges)))
+    return tuple(trees)
+
+
+@lru_cache(maxsize=None)
+def _cached_one_loop(n_legs):
+    return _one_loop(n_legs)
+
+
+def _one_loop(n_legs):
+    # Joining the two last legs of every tree with two more legs closes exactly one loop; graphs found more than once are merged through their canonical form
+    skeletons = {}
+    first, second = n_legs, n_legs + 1
+    for tree in _trees(n_legs + 2):
+        ends = [v for u, v in tree if u in (first, second)]
+        if ends[0] == ends[1]:
+            # Both legs on the same vertex would close a tadpole
+            continue
+        edges = [(u if u < n_legs else u - 2, v - 2) for u, v in tree if u not in (first, second)]
+        a, b = sorted(v - 2 for v in ends)
+        edges = tuple(sorted(edges + [(a, b)]))
+        skeletons.setdefault(_canonical_form(n_legs, edges, [''] * len(edges), {'': ''}), edges)
+    return tuple(skeletons.values())
+
+
+def topologies(n_legs, loops=0):
+    """
+    Returns every topology of a diagram with 'n_legs' external legs and three lines per vertex, each one as a tuple of (u, v) edges (see the top of this module for the numbering of the nodes).
+    Topologies only depend on the number of legs, so 2 -> 2 scatterings and 1 -> 3 decays share the same ones. They are computed once and cached up to MAX_CACHED_LEGS legs, and the trees are built incrementally from the trees with one leg less.
+    Loop topologies include the self-energies of the legs and propagators but not the tadpoles.
+
+    Args:
+        n_legs (int): number of external legs (initial and final particles)
+        loops (int, optional): number of loops, 0 (tree level) or 1
+    """
+    if loops not in (0, 1):
+        raise ValueError(f"Only tree-level and one-loop diagrams can be generated, not {loops} loops")
+    if n_legs < 3:
+        return ()
+    if loops == 0:
+        return _trees(n_legs)
+    return _cached_one_loop(n_legs) if n_legs + 2 <= MAX_CACHED_LEGS else _one_loop(n_legs)
+
+
+def _canonical_form(n_legs, edges, flows, conjugates):
+    """
+    Returns a form of a diagram that does not depend on how its vertices are numbered, so that two diagrams are isomorphic if and only if they have the same form.
+    Every edge that is not part of the loop splits the legs in two groups: it is described by the legs on the side away from the loop (or from leg 0 for trees) and the particle coming out of that side.
+    The loop is described by the legs hanging from each of its vertices and the particles going around it, starting from the smallest rotation in either direction.
+
+    Args:
+        n_legs (int): number of external legs
+        edges (list): (u, v) edges of the diagram
+        flows (list): particle travelling from u to v on every edge ('' for a bare topology)
+        conjugates (dict): antiparticle of every particle
+    """
+    neighbours = {}
+    for i, (u, v) in enumerate(edges):
+        neighbours.setdefault(u, []).append((i, v))
+        neighbours.setdefault(v, []).append((i, u))
+
+    # Pruning the legs, and then every node left with a single line, leaves only the loop
+    degree = {node: len(links) for node, links in neighbours.items()}
+    pruned = set()
+    queue = list(range(n_legs))
+    while queue:
+        node = queue.pop()
+        pruned.add(node)
+        for i, other in neighbours[node]:
+            if other not in pruned:
+                degree[other] -= 1
+                if degree[other] == 1:
+                    queue.append(other)
+    loop = {node for node in neighbours if node not in pruned}
+
+    def flow(i, source):
+        # Particle travelling along edge i away from 'source'
+        return flows[i] if edges[i][0] == source else conjugates[flows[i]]
+
+    splits = []
+
+    def hanging_legs(node, parent_edge):
+        # Legs reached from 'node' without going back through 'parent_edge' or into the loop
+        if node < n_legs and parent_edge is not None:
+            return (node,)
+        legs = []
+        for i, other in neighbours[node]:
+            if i == parent_edge or other in loop:
+                continue
+            side = hanging_legs(other, i)
+            splits.append((side, flow(i, other)))
+            legs.extend(side)
+        return tuple(sorted(legs))
+
+    if not loop:
+        hanging_legs(0, None)
+        return tuple(sorted(splits)), ()
+
+    hanging = {node: hanging_legs(node, None) for node in loop}
+
+    # Walk around the loop once: nodes[k] -> nodes[k + 1] through edge path[k]
+    start = min(loop)
+    nodes, path = [start], []
+    previous, node = None, start
+    while True:
+        i, other = next((i, other) for i, other in neighbours[node] if other in loop and i != previous)
+        path.append(i)
+        if other == start:
+            break
+        nodes.append(other)
+        previous, node = i, other
+    size = len(nodes)
+    forward = [(hanging[nodes[k]], flow(path[k], nodes[k])) for k in range(size)]
+    backward = [(hanging[nodes[k]], flow(path[k - 1], nodes[k])) for k in range(size)][::-1]
+    rotations = [tuple(forward[k:] + forward[:k]) for k in range(size)]
+    rotations += [tuple(backward[k:] + backward[:k]) for k in range(size)]
+    return tuple(sorted(splits)), min(rotations)
+
+
+def _charge3(particle):
+    # Electric charge in units of e/3
+    return round(3 * particle.charge)
+
+
+def _conjugate_key(particle):
+    if particle.supcategory == 'fermion':
+        return (particle.category, particle.lepton_flavour, particle.generation, abs(_charge3(particle))), particle.sign
+    return (particle.category, particle.family, abs(_charge3(particle))), _charge3(particle)
+
+
+def antiparticles(ElementalParticles_db):
+    """
+    Returns the antiparticle of every elemental particle, as a dictionary of names. Bosons without charge are their own antiparticle.
+
+    Args:
+        ElementalParticles_db (dict): database of elemental particles
+    """
+    by_key = {}
+    for name, p in ElementalParticles_db.items():
+        key, sign = _conjugate_key(p)
+        by_key.setdefault(key, {})[sign] = name
+    conjugates = {}
+    for name, p in ElementalParticles_db.items():
+        key, sign = _conjugate_key(p)
+        conjugates[name] = by_key[key].get(-sign, name)
+    return conjugates
+
+
+def allowed_vertex(a, b, c, conjugates):
+    """
+    Checks if three particles, all read as outgoing, can meet at a vertex of the Standard Model: a fermion and an antifermion of the same flavour with a photon (charged fermions), a gluon (quarks), a Z or a Higgs (massive fermions); a fermion and the antiparticle of its weak partner with a W; or three gauge bosons.
+
+    Args:
+        a, b, c (ElementalParticle): particles leaving the vertex
+        conjugates (dict): antiparticle of every particle (see 'antiparticles')
+    """
+    if _charge3(a) + _charge3(b) + _charge3(c) != 0:
+        return False
+    fermions = [p for p in (a, b, c) if p.supcategory == 'fermion']
+    if not fermions:
+        return tuple(sorted((a.name, b.name, c.name))) in BOSON_VERTICES
+    if len(fermions) != 2 or fermions[0].sign + fermions[1].sign != 0:
+        return False
+    boson = next(p for p in (a, b, c) if p.supcategory != 'fermion')
+    fermion, antifermion = fermions if fermions[0].sign > 0 else fermions[::-1]
+    partner = conjugates[antifermion.name]
+    if boson.name in ('W+', 'W-'):
+        if partner == fermion.name or antifermion.category != fermion.category:
+            return False
+        return fermion.category == 'quark' or antifermion.lepton_flavour == fermion.lepton_flavour
+    if partner != fermion.name:
+        return False
+    if boson.name == 'gamma':
+        return _charge3(fermion) != 0
+    if boson.name == 'gluon':
+        return fermion.category == 'quark'
+    if boson.name == 'Higgs':
+        return fermion.mass > 0
+    return boson.name == 'Z'
+
+
+class _Rules:
+    # Vertex rules of one database and one set of exchanged bosons, with the third line of every vertex memoized
+    def __init__(self, ElementalParticles_db, mediators):
+        self.db = ElementalParticles_db
+        self.conjugates = antiparticles(ElementalParticles_db)
+        # Particles that can run on an internal line: every fermion, and the exchanged bosons
+        self.internal = [name for name, p in ElementalParticles_db.items()
+                         if p.supcategory == 'fermion' or name in mediators]
+        self._third = {}
+
+    def allowed(self, a, b, c):
+        return allowed_vertex(self.db[a], self.db[b], self.db[c], self.conjugates)
+
+    def third(self, a, b):
+        # Internal particles that can leave a vertex where 'a' and 'b' also leave
+        key = (a, b)
+        if key not in self._third:
+            self._third[key] = [c for c in self.internal if self.allowed(a, b, c)]
+        return self._third[key]
+
+
+def _assignments(n_legs, edges, leg_flows, rules):
+    # Yields every choice of particles for the internal lines of a topology that makes every vertex allowed
+    flows = list(leg_flows) + [None] * (len(edges) - n_legs)
+    at_vertex = {}
+    for i, (u, v) in enumerate(edges):
+        for node in (u, v):
+            if node >= n_legs:
+                at_vertex.setdefault(node, []).append(i)
+    conjugates = rules.conjugates
+
+    def outgoing(node, i):
+        return flows[i] if edges[i][0] == node else conjugates[flows[i]]
+
+    def consistent(i):
+        for node in edges[i]:
+            if node >= n_legs and all(flows[j] is not None for j in at_vertex[node]):
+                if not rules.allowed(*(outgoing(node, j) for j in at_vertex[node])):
+                    return False
+        return True
+
+    def solve():
+        # A vertex with a single free line fixes that line up to the choice of boson; otherwise a free line of the loop is tried with every particle
+        for node, lines in at_vertex.items():
+            free = [i for i in lines if flows[i] is None]
+            if len(free) == 1:
+                i = free[0]
+                known = [outgoing(node, j) for j in lines if j != i]
+                candidates = [c if edges[i][0] == node else conjugates[c] for c in rules.third(*known)]
+                break
+        else:
+            free = [i for i, f in enumerate(flows) if f is None]
+            if not free:
+                yield list(flows)
+                return
+            i = free[0]
+            candidates = rules.internal
+        for particle in candidates:
+            flows[i] = particle
+            if consistent(i):
+                yield from solve()
+            flows[i] = None
+
+    yield from solve()
+
+
+def _split_spectators(elemental_reaction):
+    # Particles found on both sides are paired one for one; the unpaired ones are the external legs
+    remaining = Counter(elemental_reaction['final'])
+    initial, spectators = [], []
+    for p in elemental_reaction['initial']:
+        if remaining[p]:
+            remaining[p] -= 1
+            spectators.append(p)
+        else:
+            initial.append(p)
+    paired = Counter(spectators)
+    final = []
+    for p in elemental_reaction['final']:
+        if paired[p]:
+            paired[p] -= 1
+        else:
+            final.append(p)
+    return initial, final, spectators
+
+
+def _mediators(interactions):
+    # Bosons of the interactions that were found, or every boson if none was
+    if interactions:
+        found = [kind for kind, pairs in interactions.items() if any(pairs.values())]
+        if found:
+            return frozenset(boson for kind in found for boson in INTERACTION_BOSONS[kind])
+    return frozenset(boson for bosons in INTERACTION_BOSONS.values() for boson in bosons)
+
+
+def _relabellings(initial, final):
+    # Every renumbering of the legs that only exchanges identical particles on the same side
+    legs = list(initial) + list(final)
+    groups = {}
+    for leg, name in enumerate(legs):
+        groups.setdefault((leg < len(initial), name), []).append(leg)
+    relabellings = []
+    for choice in product(*(permutations(group) for group in groups.values())):
+        mapping = list(range(len(legs)))
+        for group, permuted in zip(groups.values(), choice):
+            for old, new in zip(group, permuted):
+                mapping[old] = new
+        relabellings.append(mapping)
+    return relabellings
+
+
+def _diagrams_for_legs(initial, final, rules, loops, seen):
+    n_legs = len(initial) + len(final)
+    # Lines of the legs, from the leg to its vertex: incoming particles as they are, outgoing ones as antiparticles
+    leg_flows = list(initial) + [rules.conjugates[p] for p in final]
+    relabellings = _relabellings(initial, final)
+    for n_loops in range(loops + 1):
+        for edges in topologies(n_legs, n_loops):
+            for flows in _assignments(n_legs, edges, leg_flows, rules):
+                form = min(
+                    _canonical_form(n_legs, [(m[u] if u < n_legs else u, v) for u, v in edges], flows, rules.conjugates)
+                    for m in relabellings
+                )
+                if form in seen:
+                    continue
+                seen.add(form)
+                yield n_loops, edges, flows
+
+
+def generate_diagrams(elemental_reaction, ElementalParticles_db, interactions=None, loops=0, max_legs=None):
+    """
+    Yields the Feynman diagrams of an elemental reaction, up to 'loops' loops. Diagrams that only differ by the numbering of their vertices or by the exchange of identical particles are yielded once.
+
+    Particles found on both sides of the reaction are spectators and are left out of the diagrams. If the other particles alone cannot form a diagram (e.g. 'e- gamma -> e- gamma', where everything is a spectator), up to two spectators are brought into the diagram, as few as possible.
+    Internal lines can be any fermion and the bosons of the interactions found by 'identify_interactions' (see INTERACTION_BOSONS), or every boson if none was found.
+
+    Every diagram is a dictionary with:
+    - 'initial', 'final': the particles of the external legs, which are the nodes 0, 1, ... of the graph
+    - 'spectators': the particles that go through the reaction untouched
+    - 'loops': number of loops
+    - 'vertices': number of vertices, which are the nodes after the legs
+    - 'edges': [u, v, particle] lines, with the particle travelling from u to v (internal lines are oriented so that they carry a particle rather than an antifermion)
+
+    Args:
+        elemental_reaction (dict): dictionary with 'initial' and 'final' lists of elemental particle names (from 'analyze_complex_particles')
+        ElementalParticles_db (dict): database of elemental particles
+        interactions (dict, optional): interactions of the reaction (from 'identify_interactions')
+        loops (int, optional): maximum number of loops, 0 (tree level) or 1
+        max_legs (int, optional): largest number of legs, counting two more for one-loop diagrams, since the number of topologies grows as (2n-5)!!. A ValueError is raised before the topologies of a larger diagram are built
+    """
+    rules = _Rules(ElementalParticles_db, _mediators(interactions))
+    initial, final, spectators = _split_spectators(elemental_reaction)
+    borrowable = list(dict.fromkeys(spectators))
+    seen = set()
+
+    for n_borrowed in range(min(MAX_BORROWED, len(borrowable)) + 1):
+        found = False
+        for borrowed in combinations(borrowable, n_borrowed):
+            left = list(spectators)
+            for p in borrowed:
+                left.remove(p)
+            legs_initial = initial + list(borrowed)
+            legs_final = final + list(borrowed)
+            n_initial = len(legs_initial)
+            n_legs = n_initial + len(legs_final)
+            if max_legs is not None and n_legs + 2 * loops > max_legs:
+                raise ValueError(f"Diagram with {n_legs + 2 * loops} legs (counting two per loop), over the limit of {max_legs}")
+            for n_loops, edges, flows in _diagrams_for_legs(legs_initial, legs_final, rules, loops, seen):
+                found = True
+                lines = []
+                for (u, v), particle in zip(edges, flows):
+                    # Outgoing legs are written in the direction the particle travels, towards the leg
+                    if n_initial <= u < n_legs or (u >= n_legs and ElementalParticles_db[particle].sign < 0):
+                        lines.append([v, u, rules.conjugates[particle]])
+                    else:
+                        lines.append([u, v, particle])
+                yield {
+                    'initial': legs_initial,
+                    'final': legs_final,
+                    'spectators': left,
+                    'loops': n_loops,
+                    'vertices': n_legs - 2 + 2 * n_loops,
+                    'edges': lines,
+                }
+        if found:
+            return
+
+
+def propagators(diagram):
+    """
+    Returns the internal lines of a diagram (from 'generate_diagrams'), as [u, v, particle] lines between two vertices.
+
+    Args:
+        diagram (dict): diagram from 'generate_diagrams'
+    """
+    n_legs = len(diagram['initial']) + len(diagram['final'])
+    return [line for line in diagram['edges'] if line[0] >= n_legs and line[1] >= n_legs]
+
+
+@lru_cache(maxsize=None)
+def load_template(path=TEMPLATE_PATH):
+    """
+    Reads and compiles the TikZ-Feynman template. The template is only read once per path, however many diagrams are rendered.
+
+    Args:
+        path (str, optional): template file, with $reaction, $vertices and $lines placeholders
+    """
+    with open(path, encoding='utf-8') as f:
+        return Template(f.read())
+
+
+def latex_label(particle):
+    """
+    Returns the LaTeX form of a particle from its 'LaTeX' field, with the escaped backslashes of the database turned into single ones (e.g. '\\\\mu^-' -> '\\mu^-'). Antiquarks stored as 'antiu', 'antid', ... get a bar.
+
+    Args:
+        particle (ElementalParticle): particle to label
+    """
+    latex = (particle.LaTeX or particle.name).replace('\\\\', '\\')
+    if latex.startswith('anti') and '\\' not in latex:
+        return '\\bar{' + latex[len('anti'):] + '}'
+    return latex
+
+
+def layout(diagram):
+    """
+    Places the nodes of a diagram: initial legs on the left, final legs on the right and every vertex at the average position of its neighbours, which spreads the vertices between the legs without crossings for trees.
+    Returns a dictionary node -> (x, y), in cm.
+
+    Args:
+        diagram (dict): diagram from 'generate_diagrams'
+    """
+    n_initial = len(diagram['initial'])
+    n_final = len(diagram['final'])
+    n_legs = n_initial + n_final
+    width = SPACING * (diagram['vertices'] + 1)
+    positions = {}
+    for i in range(n_initial):
+        positions[i] = (0.0, SPACING * ((n_initial - 1) / 2 - i))
+    for i in range(n_final):
+        positions[n_initial + i] = (width, SPACING * ((n_final - 1) / 2 - i))
+
+    neighbours = {}
+    for u, v, particle in diagram['edges']:
+        neighbours.setdefault(u, []).append(v)
+        neighbours.setdefault(v, []).append(u)
+    vertices = sorted(node for node in neighbours if node >= n_legs)
+    for k, node in enumerate(vertices):
+        # Slightly different starting points, so that vertices with the same neighbours do not end up on top of each other
+        positions[node] = (width / 2, 0.1 * k)
+    for _ in range(200):
+        for node in vertices:
+            xs, ys = zip(*(positions[other] for other in neighbours[node]))
+            positions[node] = (sum(xs) / len(xs), sum(ys) / len(ys))
+    return positions
+
+
+class TikzWriter:
+    """
+    Writes diagrams (from 'generate_diagrams') as TikZ-Feynman files, for many diagrams in one pass.
+    The template is compiled once and the LaTeX labels of the particles are looked up once, when the writer is built.
+    Every file is named after the hash of its contents, so a diagram that did not change keeps its file and is never written again; the files already in the output directory are listed once, instead of being checked one by one.
+
+    Args:
+        ElementalParticles_db (dict): database of elemental particles
+        out_dir (str, optional): directory where the files are written
+        template_path (str, optional): TikZ-Feynman template
+    """
+    def __init__(self, ElementalParticles_db, out_dir=OUTPUT_DIR, template_path=TEMPLATE_PATH):
+        self.template = load_template(template_path)
+        self.labels = {name: latex_label(p) for name, p in ElementalParticles_db.items()}
+        self.db = ElementalParticles_db
+        self.out_dir = out_dir
+        self.written = 0
+        self.unchanged = 0
+        # Files of the output directory, listed on the first write
+        self._existing = None
+
+    def _style(self, particle):
+        if particle in LINE_STYLES:
+            return LINE_STYLES[particle]
+        return 'anti fermion' if self.db[particle].sign < 0 else 'fermion'
+
+    def render(self, diagram, reaction=None):
+        """
+        Returns the TikZ-Feynman source of a diagram.
+
+        Args:
+            diagram (dict): diagram from 'generate_diagrams'
+            reaction (str, optional): reaction written in the header of the file. Defaults to the legs of the diagram
+        """
+        legs = diagram['initial'] + diagram['final']
+        positions = layout(diagram)
+
+        def name(node):
+            return f"l{node}" if node < len(legs) else f"v{node}"
+
+        vertices = []
+        for node, (x, y) in sorted(positions.items()):
+            label = f" {{\\({self.labels[legs[node]]}\\)}}" if node < len(legs) else ""
+            vertices.append(f"\\vertex ({name(node)}) at ({x:.2f}, {y:.2f}){label};")
+
+        lines = []
+        # Lines between the same two vertices (a loop of two propagators) are bent apart
+        parallel = Counter(frozenset((u, v)) for u, v, particle in diagram['edges'])
+        drawn = Counter()
+        for u, v, particle in diagram['edges']:
+            options = [self._style(particle)]
+            if u >= len(legs) and v >= len(legs):
+                options.append(f"edge label=\\({self.labels[particle]}\\)")
+                pair = frozenset((u, v))
+                if parallel[pair] > 1:
+                    drawn[pair] += 1
+                    options.append('half left' if drawn[pair] == 1 else 'half right')
+            lines.append(f"({name(u)}) -- [{', '.join(options)}] ({name(v)})")
+
+        # Spectators go straight through, below the diagram
+        bottom = min(y for x, y in positions.values()) - SPACING
+        width = max(x for x, y in positions.values())
+        for k, particle in enumerate(diagram['spectators']):
+            y = bottom - SPACING * k / 2
+            label = f"{{\\({self.labels[particle]}\\)}}"
+            vertices.append(f"\\vertex (s{k}a) at (0.00, {y:.2f}) {label};")
+            vertices.append(f"\\vertex (s{k}b) at ({width:.2f}, {y:.2f}) {label};")
+            lines.append(f"(s{k}a) -- [{self._style(particle)}] (s{k}b)")
+
+        if reaction is None:
+            reaction = f"{' '.join(diagram['initial'])} -> {' '.join(diagram['final'])}"
+        return self.template.substitute(
+            reaction=reaction,
+            vertices='\n'.join(vertices),
+            lines=',\n'.join(lines),
+        )
+
+    def write(self, diagram, reaction=None):
+        """
+        Writes a diagram to '<hash of the contents>.tex' in the output directory, unless that file already exists, and returns its path.
+
+        Args:
+            diagram (dict): diagram from 'generate_diagrams'
+            reaction (str, optional): reaction written in the header of the file
+        """
+        tex = self.render(diagram, reaction)
+        filename = hashlib.sha256(tex.encode('utf-8')).hexdigest()[:16] + '.tex'
+        path = os.path.join(self.out_dir, filename)
+        if self._existing is None:
+            os.makedirs(self.out_dir, exist_ok=True)
+            self._existing = set(os.listdir(self.out_dir))
+        if filename in self._existing:
+            self.unchanged += 1
+            return path
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(tex)
+        os.replace(tmp_path, path)
+        self._existing.add(filename)
+        self.written += 1
+        return path
+
+    def write_all(self, diagrams, reaction=None):
+        """
+        Writes every diagram of an iterable (see 'write') and returns the paths, in order.
+
+        Args:
+            diagrams (iterable): diagrams from 'generate_diagrams'
+            reaction (str, optional): reaction written in the header of the files
+        """
+        return [self.write(diagram, reaction) for diagram in diagrams]
@@ -0,0 +1,88 @@
+# Enumerates every reaction allowed by the conservation laws
+
+from itertools import combinations_with_replacement
+
+from src.resolver import ParticleResolver
+from src.validator import quantum_numbers
+
+
+def enumerate_reactions(ElementalParticles_db, ComplexParticles_db=None, max_initial=2, max_final=3,
+                        particles=None, include_trivial=False):
+    """
+    Yields every reaction with 1 to 'max_initial' initial particles and 1 to 'max_final' final particles that passes the checks of 'validate_process': charge, baryon number, the three lepton numbers and, for decays, the mass threshold.
+    Reactions are multisets: every combination of particles is yielded once, with the particles sorted by mass.
+
+    Final states are built one particle at a time, and a branch is dropped as soon as the particles still to be added cannot bring the partial sums of the quantum numbers back to the initial ones, or as soon as a decay product is too heavy.
+    Quantum numbers are compared in exact integer units (see 'quantum_numbers'). The final states of scattering reactions only depend on the total quantum numbers of the initial state, so they are searched once per distinct total and reused.
+    Reactions are yielded as they are found, so the output can be consumed as a stream.
+
+    Args:
+        ElementalParticles_db (dict): database of elemental particles
+        ComplexParticles_db (dict, optional): database of complex particles
+        max_initial (int, optional): maximum number of initial particles
+        max_final (int, optional): maximum number of final particles
+        particles (list, optional): names of the particles to draw from. Defaults to every particle of the databases
+        include_trivial (bool, optional): also yield reactions whose final state is the same as the initial state
+    """
+    resolver = ParticleResolver(ElementalParticles_db, ComplexParticles_db)
+    pool = resolver.particles if particles is None else [resolver.particles[resolver.resolve(p)] for p in particles]
+    # Lightest first: when a decay product is too heavy, every particle after it is too
+    pool = sorted(pool, key=lambda p: p.mass)
+
+    names = [p.name for p in pool]
+    masses = [p.mass for p in pool]
+    numbers = [quantum_numbers(p) for p in pool]
+    n_numbers = len(numbers[0]) if numbers else 0
+
+    # lowest[i][c] and highest[i][c]: smallest and largest value of quantum number c among the particles i, i+1, ...
+    lowest = [None] * (len(pool) + 1)
+    highest = [None] * (len(pool) + 1)
+    lowest[len(pool)] = highest[len(pool)] = (0,) * n_numbers
+    for i in range(len(pool) - 1, -1, -1):
+        if i == len(pool) - 1:
+            lowest[i] = highest[i] = numbers[i]
+        else:
+            lowest[i] = tuple(min(a, b) for a, b in zip(numbers[i], lowest[i + 1]))
+            highest[i] = tuple(max(a, b) for a, b in zip(numbers[i], highest[i + 1]))
+
+    def reachable(sums, target, start, slots):
+        # Can up to 'slots' more particles, taken from 'start' on, turn 'sums' into 'target'?
+        for c in range(n_numbers):
+            missing = target[c] - sums[c]
+            if missing < min(0, slots * lowest[start][c]) or missing > max(0, slots * highest[start][c]):
+                return False
+        return True
+
+    def final_states(target, mass_limit, start, chosen, sums, mass):
+        if chosen and sums == target:
+            yield chosen
+        slots = max_final - len(chosen)
+        if not slots:
+            return
+        for i in range(start, len(pool)):
+            if mass_limit is not None and mass + masses[i] > mass_limit:
+                break
+            new_sums = tuple(s + q for s, q in zip(sums, numbers[i]))
+            if not reachable(new_sums, target, i, slots - 1):
+                continue
+            yield from final_states(target, mass_limit, i, chosen + [i], new_sums, mass + masses[i])
+
+    zero = (0,) * n_numbers
+    # Without a mass threshold, the final states only depend on the quantum numbers to reach, which many initial states share
+    unbounded_finals = {}
+    for n_initial in range(1, max_initial + 1):
+        for initial in combinations_with_replacement(range(len(pool)), n_initial):
+            target = tuple(sum(numbers[i][c] for i in initial) for c in range(n_numbers))
+            if n_initial == 1:
+                finals = final_states(target, masses[initial[0]], 0, [], zero, 0.0)
+            else:
+                if target not in unbounded_finals:
+                    unbounded_finals[target] = list(final_states(target, None, 0, [], zero, 0.0))
+                finals = unbounded_finals[target]
+            for final in finals:
+                if not include_trivial and tuple(final) == initial:
+                    continue
+                yield {
+                    'initial': [names[i] for i in initial],
+                    'final': [names[i] for i in final]
+                }
@@ -1,4 +1,6 @@
-import re
+from collections import Counter, deque
+
+from src import instrumentation
 
 # Identifies which interaction is happening in the reaction. For that, we need to:
 # 1 - Rule out espectator particles
@@ -40,10 +42,7 @@ def identify_flavor_change(interacting_particles, ElementalParticles_db):
         ElementalParticles_db (_type_): _description_
     """
     initial = interacting_particles['initial']
-    initial_copy = initial.copy()
     final = interacting_particles['final']
-    final_copy = final.copy()
-    
     
     quark_flavor_pairs = []
     lepton_flavor_pairs = []
@@ -63,52 +62,99 @@ def identify_flavor_change(interacting_particles, ElementalParticles_db):
     final_leptons, final_quarks = extract_type(final)
     
     # Quarks
-    used_final_quarks = set()
+    # Final quarks are grouped by (baryon number, charge): an initial quark can only change into a quark from a bucket with the same baryon number and a different charge.
+    # Every final quark can only be used once, so each bucket only keeps the distinct names, in order of first appearance.
+    quark_buckets = {}
+    for position, p in _first_appearances(final_quarks):
+        particle = ElementalParticles_db[p]
+        quark_buckets.setdefault(particle.baryon_number, {}).setdefault(particle.charge, [0, []])[1].append((position, p))
+
+    used_final = set()
+    paired_initial = Counter()
+    paired_final = Counter()
+    examined = 0
     for p1 in initial_quarks:
-        for p2 in final_quarks:
-            # For every pair of two quarks in initial and final states
-            if p2 in used_final_quarks:
-                # If the quark has already been used in a flavor change, skip it
+        particle = ElementalParticles_db[p1]
+        best = None
+        for charge, bucket in quark_buckets.get(particle.baryon_number, {}).items():
+            if charge == particle.charge:
                 continue
-            if ElementalParticles_db[p1].baryon_number == ElementalParticles_db[p2].baryon_number:
-                # Only pairs of particle/particle and antiparticle/antiparticle go through
-                if ElementalParticles_db[p1].charge != ElementalParticles_db[p2].charge:
-                    # If there they have different charge, they can have a flavor change
-                    if ElementalParticles_db[p1].symbol != ElementalParticles_db[p2].symbol:
-                        # If they have different symbols, they have a flavor change
-                        quark_flavor_pairs.append((p1, p2))
-                        used_final_quarks.add(p2)
-                        if p1 in initial_copy: initial_copy.remove(p1)
-                        if p2 in final_copy: final_copy.remove(p2)
-                        break
+            examined += 1
+            candidate = _first_candidate(bucket, used_final, particle.symbol, ElementalParticles_db)
+            if candidate is not None and (best is None or candidate < best):
+                best = candidate
+        if best is not None:
+            # The first unused final quark (in the original order) with a different charge and symbol
+            p2 = best[1]
+            quark_flavor_pairs.append((p1, p2))
+            used_final.add(p2)
+            paired_initial[p1] += 1
+            paired_final[p2] += 1
     
     # Leptons
-    used_final_leptons = set()
+    # Final leptons are grouped by family (e, mu, tau): an initial lepton can only change into a lepton of the same family with a different symbol
+    lepton_buckets = {}
+    for position, p in _first_appearances(final_leptons):
+        lepton_buckets.setdefault(ElementalParticles_db[p].lepton_flavour, [0, []])[1].append((position, p))
+
     for p1 in initial_leptons:
-        for p2 in final_leptons:
-            # For every pair of two leptons in initial and final states
-            if p2 in used_final_leptons:
-                # If the lepton has already been used in a flavor change, skip it
-                continue
-            
-            # Only pairs of particle/particle and antiparticle/antiparticle go through
-            fam1 = re.sub(r'[^a-z]', '', str(ElementalParticles_db[p1].family))
-            fam2 = re.sub(r'[^a-z]', '', str(ElementalParticles_db[p2].family))
-            if fam1 == fam2 and ElementalParticles_db[p1].symbol != ElementalParticles_db[p2].symbol:
-                # If they are from the same family and have different symbols, they have a flavor change
-                lepton_flavor_pairs.append((p1, p2))
-                used_final_leptons.add(p2)
-                if p1 in initial_copy: initial_copy.remove(p1)
-                if p2 in final_copy: final_copy.remove(p2)
-                break
+        particle = ElementalParticles_db[p1]
+        bucket = lepton_buckets.get(particle.lepton_flavour)
+        if bucket is None:
+            continue
+        examined += 1
+        candidate = _first_candidate(bucket, used_final, particle.symbol, ElementalParticles_db)
+        if candidate is not None:
+            p2 = candidate[1]
+            lepton_flavor_pairs.append((p1, p2))
+            used_final.add(p2)
+            paired_initial[p1] += 1
+            paired_final[p2] += 1
     
     interacting_particles = {
-            'initial' : initial_copy,
-            'final' : final_copy
+            'initial' : _remove_first(initial, paired_initial),
+            'final' : _remove_first(final, paired_final)
     }
+    if instrumentation.enabled:
+        # Candidate buckets looked up
+        instrumentation.count('identify_flavor_change.pairs', examined)
     
     return quark_flavor_pairs, lepton_flavor_pairs, interacting_particles
 
+def _first_appearances(particles):
+    """Yields (position, particle) for the first appearance of every distinct particle of the list"""
+    seen = set()
+    for position, p in enumerate(particles):
+        if p not in seen:
+            seen.add(p)
+            yield position, p
+
+def _first_candidate(bucket, used, symbol, ElementalParticles_db):
+    """
+    Returns the first (position, particle) of a bucket that has not been used yet and has a different symbol, or None.
+    A bucket is a list [start, entries]: 'start' skips the entries at the front that are already used, so they are only looked at once.
+    """
+    start, entries = bucket
+    while start < len(entries) and entries[start][1] in used:
+        start += 1
+    bucket[0] = start
+    for i in range(start, len(entries)):
+        position, p = entries[i]
+        if p not in used and ElementalParticles_db[p].symbol != symbol:
+            return position, p
+    return None
+
+def _remove_first(particles, removed):
+    """Returns a copy of the list without the first 'removed[p]' appearances of every particle p (the same result as calling list.remove that many times)"""
+    removed = dict(removed)
+    remaining = []
+    for p in particles:
+        if removed.get(p):
+            removed[p] -= 1
+        else:
+            remaining.append(p)
+    return remaining
+
 def identify_strong(interacting_particles, ElementalParticles_db):
     """
     Checks if the interaction is a strong interaction based on whether there's a quark particle/antiparticle pair generated in the final particles. 
@@ -128,19 +174,23 @@ def identify_strong(interacting_particles, ElementalParticles_db):
 
     final_quarks = [p for p in final if is_quark(p)]
     used_final_quarks = set()
+    examined = 0
 
     for p1 in final_quarks:
         if p1 in used_final_quarks:
             continue
+        q1 = ElementalParticles_db[p1]
         for p2 in final_quarks:
             # For every pair of two quarks in final states
             if p2 in used_final_quarks or p1 == p2:
                 # Check if they are unused
                 continue
+            examined += 1
+            q2 = ElementalParticles_db[p2]
             if (
-                ElementalParticles_db[p1].baryon_number == -ElementalParticles_db[p2].baryon_number
-                and abs(ElementalParticles_db[p1].charge) == abs(ElementalParticles_db[p2].charge)
-                and abs(ElementalParticles_db[p1].family) == abs(ElementalParticles_db[p2].family)
+                q1.baryon_number == -q2.baryon_number
+                and abs(q1.charge) == abs(q2.charge)
+                and q1.generation == q2.generation
             ):
                 # If they are a particle/antiparticle pair, they can have a strong interaction
                 quark_pairs.append((p1, p2))
@@ -154,6 +204,8 @@ def identify_strong(interacting_particles, ElementalParticles_db):
         'initial': initial,
         'final': final_copy
     }
+    if instrumentation.enabled:
+        instrumentation.count('identify_strong.pairs', examined)
 
     return quark_pairs, interacting_particles
 
@@ -180,19 +232,25 @@ def identify_em(interacting_particles, ElementalParticles_db):
     def check_pairs(particles):
         em_pairs = []
         used = set()
+        examined = 0
+        # Particle objects looked up once, instead of once for every candidate pair
+        props = [ElementalParticles_db[p] for p in particles]
         for i, p1 in enumerate(particles):
             if p1 in used:
                 # If the particle has already been used, skip it
                 continue
+            a = props[i]
             for j, p2 in enumerate(particles):
                 if i == j or p2 in used:
                     # If they are the same particle or it has been already used, skip it
                     continue
+                examined += 1
+                b = props[j]
                 # LEPTONS
                 if (
-                    ElementalParticles_db[p1].baryon_number == 0 and ElementalParticles_db[p2].baryon_number == 0
-                    and re.sub(r'[^a-z]', '', str(ElementalParticles_db[p1].family)) == re.sub(r'[^a-z]', '', str(ElementalParticles_db[p2].family))
-                    and ElementalParticles_db[p1].charge + ElementalParticles_db[p2].charge == 0
+                    a.baryon_number == 0 and b.baryon_number == 0
+                    and a.lepton_flavour == b.lepton_flavour
+                    and a.charge + b.charge == 0
                     ):
                     # If both particles are leptons, are from the same family and their charges cancel each other
                     em_pairs.append((p1, p2))
@@ -201,9 +259,9 @@ def identify_em(interacting_particles, ElementalParticles_db):
                 
                 # QUARKS
                 if (
-                    ElementalParticles_db[p1].baryon_number != 0 and ElementalParticles_db[p2].baryon_number != 0
-                    and abs(ElementalParticles_db[p1].family) == abs(ElementalParticles_db[p2].family)
-                    and ElementalParticles_db[p1].charge + ElementalParticles_db[p2].charge == 0
+                    a.baryon_number != 0 and b.baryon_number != 0
+                    and a.generation == b.generation
+                    and a.charge + b.charge == 0
                     ):
                     # If both particles are quarks, are from the same family and their charges cancel each other
                     em_pairs.append((p1, p2))
@@ -213,10 +271,12 @@ def identify_em(interacting_particles, ElementalParticles_db):
         
         # Look for remaining particles
         remaining = [p for p in particles if p not in used]
-        return em_pairs, remaining
+        return em_pairs, remaining, examined
 
-    initial_em, initial_remaining = check_pairs(initial_charged)
-    final_em, final_remaining = check_pairs(final_charged)
+    initial_em, initial_remaining, initial_examined = check_pairs(initial_charged)
+    final_em, final_remaining, final_examined = check_pairs(final_charged)
+    if instrumentation.enabled:
+        instrumentation.count('identify_em.pairs', initial_examined + final_examined)
     
     interacting_particles = {
         'initial': initial_remaining,
@@ -240,50 +300,129 @@ def identify_weak(interacting_particles, ElementalParticles_db):
     final = interacting_particles['final']
     
     weak_pairs = []
-    initial_copy = initial.copy()
-    final_copy = final.copy()
-    
+    examined = 0
+    remaining_initial = Counter(initial)
+    remaining_final = Counter(final)
+
+    # Final particles grouped by the key that decides if two particles can pair, in their original order
+    buckets = {}
+    for p in final:
+        key = _weak_key(ElementalParticles_db[p])
+        if key is not None:
+            buckets.setdefault(key, deque()).append(p)
+
     for p1 in initial:
-        for p2 in final:
-            if p1 not in initial_copy or p2 not in final_copy:
-                # If the particle has already been used, skip it
+        if not remaining_initial[p1]:
+            # If the particle has already been used, skip it
+            continue
+        bucket = buckets.get(_weak_key(ElementalParticles_db[p1]))
+        if not bucket:
+            continue
+        # Pair with the compatible final particles in order, while there are copies of both left.
+        # Particles with no copies left are dropped from the bucket for good; the ones still available go back to the front.
+        kept = []
+        while bucket and remaining_initial[p1]:
+            p2 = bucket.popleft()
+            examined += 1
+            if not remaining_final[p2]:
                 continue
-            
-            # For every pair of two particles in initial and final states
-            ## BARYONS
-            if (
-                ElementalParticles_db[p1].baryon_number != 0 
-                and ElementalParticles_db[p2].baryon_number != 0
-            ):
-                # If both particles are baryons
-                if (
-                    ElementalParticles_db[p1].family * ElementalParticles_db[p2].family > 0
-                    and (ElementalParticles_db[p1].charge == ElementalParticles_db[p2].charge)
-                ):
-                    # If both particles are either particles or antiparticles
-                    initial_copy.remove(p1)
-                    final_copy.remove(p2)
-                    weak_pairs.append((p1, p2))
-            
-            ## LEPTONS
-            if (
-                ElementalParticles_db[p1].baryon_number == 0
-                and ElementalParticles_db[p2].baryon_number == 0
-            ):
-                # If both particles are leptons
-                if (
-                    str(ElementalParticles_db[p1].family.startswith('-')) == str(ElementalParticles_db[p2].family.startswith('-'))
-                    and (ElementalParticles_db[p1].charge == ElementalParticles_db[p2].charge)
-                ):
-                    # If both particles are leptons and are either particles or antiparticles
-                    initial_copy.remove(p1)
-                    final_copy.remove(p2)
-                    weak_pairs.append((p1, p2))
-    
+            remaining_initial[p1] -= 1
+            remaining_final[p2] -= 1
+            weak_pairs.append((p1, p2))
+            kept.append(p2)
+        bucket.extendleft(reversed(kept))
+
+    paired_initial = Counter(p1 for p1, p2 in weak_pairs)
+    paired_final = Counter(p2 for p1, p2 in weak_pairs)
     interacting_particles = {
-        'initial': initial_copy,
-        'final': final_copy
+        'initial': _remove_first(initial, paired_initial),
+        'final': _remove_first(final, paired_final)
     }
+    if instrumentation.enabled:
+        instrumentation.count('identify_weak.pairs', examined)
     return weak_pairs, interacting_particles
 
+def _weak_key(particle):
+    """
+    Returns the key that decides which particles can form a weak pair: two particles pair if their keys are equal.
+    - Baryons: both must be either particles or antiparticles (same sign of family) and have the same charge
+    - Leptons: the same check on the family string, and the same charge
+    """
+    if particle.baryon_number != 0:
+        if particle.sign == 0:
+            return None
+        return ('baryon', particle.sign > 0, particle.charge)
+    return ('lepton', str(particle.family).startswith('-'), particle.charge)
+
+
+def identify_interactions(elemental_reaction, ElementalParticles_db):
+    """
+    Runs the whole identification chain on an elemental reaction: spectators are set aside first, and then flavor change, strong, EM and weak interactions are checked in that order on the particles that are still unassigned.
+    Returns the interactions found (in the layout used to generate diagrams) and the particles that no interaction could account for.
+
+    Args:
+        elemental_reaction (dict): Dictionary with 'initial' and 'final' lists of elemental particle names (from 'analyze_complex_particles')
+        ElementalParticles_db (dict): Database of elemental particles
+    """
+    spectator, interacting = process_particles(elemental_reaction)
+
+    quark_pairs = []
+    initial_em = []
+    final_em = []
+    weak_pairs = []
+
+    quark_flavor_pairs, lepton_flavor_pairs, updated_interacting = identify_flavor_change(interacting, ElementalParticles_db)
+    if updated_interacting['initial'] or updated_interacting['final']:
+        quark_pairs, updated_interacting = identify_strong(updated_interacting, ElementalParticles_db)
+    if updated_interacting['initial'] or updated_interacting['final']:
+        initial_em, final_em, updated_interacting = identify_em(updated_interacting, ElementalParticles_db)
+    if updated_interacting['initial'] or updated_interacting['final']:
+        weak_pairs, updated_interacting = identify_weak(updated_interacting, ElementalParticles_db)
+
+    interactions = {
+        'flavor_change': {
+            'quark_pairs': quark_flavor_pairs,
+            'lepton_pairs': lepton_flavor_pairs
+        },
+        'strong': {
+            'quark_pairs': quark_pairs
+        },
+        'em': {
+            'initial_pairs': initial_em,
+            'final_pairs': final_em
+        },
+        'weak': {
+            'pairs': weak_pairs
+        }
+    }
+    return interactions, updated_interacting
+
+def sorted_reaction(elemental_reaction):
+    """
+    Returns a copy of a reaction with the particles of each side sorted by name.
+    Identifying the sorted reaction gives the same result for every ordering of the same particles, which is what results cached by the canonical key of a reaction need.
+
+    Args:
+        elemental_reaction (dict): Dictionary with 'initial' and 'final' lists of particle names
+    """
+    return {'initial': sorted(elemental_reaction['initial']), 'final': sorted(elemental_reaction['final'])}
+
+def identify_branches(elemental_reactions, ElementalParticles_db):
+    """
+    Runs 'identify_interactions' on every elemental reaction of an iterable (e.g. every composition from 'iter_complex_expansions') and yields (elemental_reaction, interactions, remaining) for each one.
+    Every reaction is identified with its particles sorted (see 'sorted_reaction'), like in the pipeline. The identification only depends on the particles left once the spectators are removed, so branches that leave the same interacting particles share one result (the returned objects are shared and must not be modified).
+
+    Args:
+        elemental_reactions (iterable): dictionaries with 'initial' and 'final' lists of elemental particle names
+        ElementalParticles_db (dict): Database of elemental particles
+    """
+    results = {}
+    for elemental_reaction in elemental_reactions:
+        reaction = sorted_reaction(elemental_reaction)
+        spectator, interacting = process_particles(reaction)
+        key = (tuple(interacting['initial']), tuple(interacting['final']))
+        if key not in results:
+            results[key] = identify_interactions(reaction, ElementalParticles_db)
+        interactions, remaining = results[key]
+        yield elemental_reaction, interactions, remaining
 
@@ -0,0 +1,167 @@
+# Index of particle properties: interaction bit flags, mass range queries, inverted indexes and autocomplete
+
+from bisect import bisect_left, bisect_right
+from types import MappingProxyType
+
+from src.resolver import ParticleResolver
+
+# Bits of the interactions, in this order. Other interactions found in the databases get the next bits
+INTERACTIONS = ('strong', 'EM', 'weak')
+
+# Properties with an inverted index (value -> IDs of the particles that have it)
+INDEXED_FIELDS = ('category', 'supcategory', 'family', 'charge', 'baryon_number', 'strangeness', 'charm', 'beauty', 'truth')
+
+
+class ParticleIndex:
+    """
+    Read-only index over the particles of a 'ParticleResolver', built once, for queries that would otherwise scan the databases:
+    - the interactions of every particle as an integer of bit flags (see 'interaction_mask')
+    - the particle IDs sorted by mass, for range queries with bisect
+    - inverted indexes from every value of the INDEXED_FIELDS to the IDs that have it
+    - the sorted names, symbols and aliases, for autocomplete
+    Particles removed by a reload are left out.
+
+    Args:
+        ElementalParticles_db (dict): database of elemental particles
+        ComplexParticles_db (dict, optional): database of complex particles
+        resolver (ParticleResolver, optional): index of both databases, if one was already built
+    """
+    def __init__(self, ElementalParticles_db, ComplexParticles_db=None, resolver=None):
+        self.resolver = resolver or ParticleResolver(ElementalParticles_db, ComplexParticles_db)
+        particles = self.resolver.particles
+        ids = [i for i in range(len(particles)) if i not in self.resolver.removed]
+
+        bits = {name: 1 << b for b, name in enumerate(INTERACTIONS)}
+        for i in ids:
+            for interaction in particles[i].interactions:
+                if interaction not in bits:
+                    bits[interaction] = 1 << len(bits)
+        self.bits = MappingProxyType(bits)
+        interactions = [0] * len(particles)
+        for i in ids:
+            for interaction in particles[i].interactions:
+                interactions[i] |= bits[interaction]
+        self.interactions = tuple(interactions)
+
+        by_mass = sorted(ids, key=lambda i: particles[i].mass)
+        self.by_mass = tuple(by_mass)
+        self.masses = tuple(particles[i].mass for i in by_mass)
+        # Position of every ID in 'by_mass', to sort the results of the inverted indexes by mass
+        rank = [len(by_mass)] * len(particles)
+        for position, i in enumerate(by_mass):
+            rank[i] = position
+        self._rank = tuple(rank)
+
+        inverted = {}
+        for field in INDEXED_FIELDS:
+            buckets = {}
+            for i in by_mass:
+                value = getattr(particles[i], field, None)
+                if value is not None:
+                    buckets.setdefault(value, []).append(i)
+            inverted[field] = MappingProxyType({value: frozenset(bucket) for value, bucket in buckets.items()})
+        self.inverted = MappingProxyType(inverted)
+
+        # Every token the resolver accepts, folded to lower case for the lookups
+        self._tokens = tuple(sorted((token.casefold(), token) for token in self.resolver.tokens()))
+        self._folded = tuple(folded for folded, _ in self._tokens)
+
+    def interaction_mask(self, *interactions):
+        """
+        Returns the bit flags of some interactions, to compare with 'interactions' (e.g. index.interactions[i] & index.interaction_mask('strong')).
+
+        Args:
+            interactions (str): names of the interactions (e.g. 'strong', 'EM')
+        """
+        mask = 0
+        for interaction in interactions:
+            try:
+                mask |= self.bits[interaction]
+            except KeyError:
+                raise ValueError(f"Unknown interaction: {interaction}") from None
+        return mask
+
+    def values(self, field):
+        """Returns the values of an indexed property found in the databases"""
+        return list(self.inverted[field])
+
+    def _positions(self, low, high):
+        start = 0 if low is None else bisect_left(self.masses, low)
+        end = len(self.masses) if high is None else bisect_right(self.masses, high)
+        return start, end
+
+    def mass_range(self, low=None, high=None):
+        """
+        Returns the IDs of the particles with low <= mass <= high, lightest first.
+
+        Args:
+            low (float, optional): smallest mass (no lower bound if not given)
+            high (float, optional): largest mass (no upper bound if not given)
+        """
+        start, end = self._positions(low, high)
+        return list(self.by_mass[start:end])
+
+    def _matching(self, field, condition):
+        buckets = self.inverted[field]
+        if callable(condition):
+            keys = [value for value in buckets if condition(value)]
+        elif isinstance(condition, (list, tuple, set, frozenset)):
+            keys = condition
+        else:
+            keys = (condition,)
+        found = [buckets[key] for key in keys if key in buckets]
+        return found[0] if len(found) == 1 else frozenset().union(*found)
+
+    def select(self, mass_min=None, mass_max=None, interactions=(), **conditions):
+        """
+        Returns the IDs of the particles that meet every condition, lightest first.
+        A condition on an indexed property can be a value, a collection of accepted values, or a function of the value (it is only called once per distinct value), e.g. all neutral strange baryons under 1.5 GeV:
+        index.select(category='baryons', charge=0, strangeness=lambda s: s != 0, mass_max=1500)
+
+        Args:
+            mass_min (float, optional): smallest mass
+            mass_max (float, optional): largest mass
+            interactions (iterable, optional): interactions that the particles must all take part in
+            conditions: conditions on the INDEXED_FIELDS
+        """
+        candidates = None
+        for field, condition in conditions.items():
+            if field not in self.inverted:
+                raise ValueError(f"Not an indexed property: {field}")
+            matching = self._matching(field, condition)
+            candidates = matching if candidates is None else candidates & matching
+            if not candidates:
+                return []
+        mask = self.interaction_mask(*interactions)
+        if candidates is None:
+            ids = self.mass_range(mass_min, mass_max)
+        else:
+            start, end = self._positions(mass_min, mass_max)
+            rank = self._rank
+            ids = sorted((i for i in candidates if start <= rank[i] < end), key=rank.__getitem__)
+        if mask:
+            ids = [i for i in ids if self.interactions[i] & mask == mask]
+        return ids
+
+    def names(self, ids):
+        """Returns the names of the particles with the given IDs"""
+        names = self.resolver.names
+        return [names[i] for i in ids]
+
+    def complete(self, prefix, limit=10):
+        """
+        Returns up to 'limit' (token, name) pairs for the names, symbols and aliases that start with 'prefix' (ignoring case), in alphabetical order.
+
+        Args:
+            prefix (str): start of a particle name, symbol or alias
+            limit (int, optional): maximum number of suggestions
+        """
+        folded = prefix.casefold()
+        names = self.resolver.names
+        suggestions = []
+        for position in range(bisect_left(self._folded, folded), len(self._tokens)):
+            if len(suggestions) == limit or not self._folded[position].startswith(folded):
+                break
+            token = self._tokens[position][1]
+            suggestions.append((token, names[self.resolver.get(token)]))
+        return suggestions
@@ -0,0 +1,254 @@
+# Optional timers and counters for the pipeline stages, exported as JSON or in the Prometheus text format
+
+import json
+import re
+import time
+
+# Off by default. Instrumented code checks this flag once per call and does nothing else when it is False, so the switch costs nothing measurable
+enabled = False
+
+# (stage, reaction shape) -> [calls, wall seconds, CPU seconds]
+_timers = {}
+# counter name -> value
+_counters = {}
+
+PROMETHEUS_PREFIX = 'feyndiag'
+
+
+def enable():
+    """Starts recording timers and counters"""
+    global enabled
+    enabled = True
+
+def disable():
+    """Stops recording. What was recorded so far is kept until 'reset'"""
+    global enabled
+    enabled = False
+
+def reset():
+    """Clears every timer and counter"""
+    _timers.clear()
+    _counters.clear()
+
+
+def reaction_shape(reaction):
+    """
+    Returns the shape of a reaction as 'initial->final' particle counts (e.g. '2->3'), which is the label the stage timers are grouped by.
+
+    Args:
+        reaction (dict): reaction with 'initial' and 'final' lists
+    """
+    return f"{len(reaction['initial'])}->{len(reaction['final'])}"
+
+
+def add_time(stage, wall, cpu, shape=''):
+    """
+    Adds one call of a stage to its timer.
+
+    Args:
+        stage (str): stage name (e.g. 'validate')
+        wall (float): wall time of the call, in seconds
+        cpu (float): CPU time of the calling thread, in seconds
+        shape (str, optional): shape of the reaction (from 'reaction_shape')
+    """
+    entry = _timers.get((stage, shape))
+    if entry is None:
+        entry = _timers[(stage, shape)] = [0, 0.0, 0.0]
+    entry[0] += 1
+    entry[1] += wall
+    entry[2] += cpu
+
+def count(name, value=1):
+    """
+    Adds 'value' to a counter. Counters named '<source>.hits' and '<source>.misses' are also reported as the hit rate of '<source>'.
+
+    Args:
+        name (str): counter name (e.g. 'identify_em.pairs')
+        value (int, optional): amount to add
+    """
+    _counters[name] = _counters.get(name, 0) + value
+
+
+class timer:
+    """
+    Context manager that adds the time spent in its block to the timer of a stage, if instrumentation is enabled when the block starts.
+
+        with instrumentation.timer('diagram'):
+            diagrams = list(generate_diagrams(...))
+
+    Args:
+        stage (str): stage name
+        shape (str, optional): shape of the reaction
+    """
+    __slots__ = ('stage', 'shape', 'start')
+
+    def __init__(self, stage, shape=''):
+        self.stage = stage
+        self.shape = shape
+        self.start = None
+
+    def __enter__(self):
+        if enabled:
+            self.start = (time.perf_counter(), time.thread_time())
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            wall, cpu = self.start
+            add_time(self.stage, time.perf_counter() - wall, time.thread_time() - cpu, self.shape)
+        return False
+
+
+class StageClock:
+    """
+    Times consecutive stages of one reaction: 'start' ends the stage that is running and starts the next one, and 'close' ends the last one.
+    'pause' ends the running stage without starting another one, for reactions whose stages are interleaved with the ones of other reactions, and 'add' records the share of a stage that was run for many reactions at once.
+    The times are only added to the timers by 'close', under the shape of the reaction, which is usually known after the first stage.
+
+    Args:
+        stage (str): name of the first stage
+    """
+    __slots__ = ('shape', 'stage', 'laps', 'wall', 'cpu')
+
+    def __init__(self, stage):
+        self.shape = ''
+        self.stage = stage
+        self.laps = []
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+
+    def start(self, stage):
+        """Ends the running stage and starts timing 'stage'"""
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        if self.stage is not None:
+            self.laps.append((self.stage, wall - self.wall, cpu - self.cpu))
+        self.stage = stage
+        self.wall = wall
+        self.cpu = cpu
+
+    def pause(self):
+        """Ends the running stage. The next one is started with 'start'"""
+        self.start(None)
+
+    def add(self, stage, wall, cpu):
+        """Records a stage that was timed elsewhere (e.g. its share of a batch)"""
+        self.laps.append((stage, wall, cpu))
+
+    def close(self):
+        """Ends the running stage (finished or failed) and adds every stage to the timers"""
+        self.start(None)
+        for stage, wall, cpu in self.laps:
+            add_time(stage, wall, cpu, self.shape)
+
+
+def drain():
+    """Returns everything recorded in this process, in the form 'merge' takes, and clears it. Used to collect the statistics of worker processes"""
+    state = {'timers': dict(_timers), 'counters': dict(_counters)}
+    reset()
+    return state
+
+def merge(state):
+    """
+    Adds the timers and counters returned by 'drain' (in another process) to the ones of this process.
+
+    Args:
+        state (dict): result of 'drain'
+    """
+    for (stage, shape), (calls, wall, cpu) in state['timers'].items():
+        entry = _timers.setdefault((stage, shape), [0, 0.0, 0.0])
+        entry[0] += calls
+        entry[1] += wall
+        entry[2] += cpu
+    for name, value in state['counters'].items():
+        count(name, value)
+
+
+def hit_rates():
+    """Returns the hit rate of every source that has '<source>.hits' or '<source>.misses' counters, as {source: {'hits', 'misses', 'hit_rate'}}"""
+    sources = {}
+    for name, value in _counters.items():
+        source, _, kind = name.rpartition('.')
+        if kind in ('hits', 'misses'):
+            sources.setdefault(source, {'hits': 0, 'misses': 0})[kind] = value
+    for entry in sources.values():
+        lookups = entry['hits'] + entry['misses']
+        entry['hit_rate'] = entry['hits'] / lookups if lookups else 0.0
+    return dict(sorted(sources.items()))
+
+
+def stats():
+    """
+    Returns a snapshot of the statistics: 'stages' (calls, wall and CPU time of every stage, in total and by reaction shape), 'counters' and 'hit_rates'.
+    """
+    stages = {}
+    for (stage, shape), (calls, wall, cpu) in sorted(_timers.items()):
+        entry = stages.setdefault(stage, {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'shapes': {}})
+        entry['calls'] += calls
+        entry['wall_s'] += wall
+        entry['cpu_s'] += cpu
+        if shape:
+            entry['shapes'][shape] = {'calls': calls, 'wall_s': wall, 'cpu_s': cpu}
+    for entry in stages.values():
+        entry['mean_wall_us'] = entry['wall_s'] / entry['calls'] * 1e6 if entry['calls'] else 0.0
+    return {
+        'enabled': enabled,
+        'stages': stages,
+        'counters': dict(sorted(_counters.items())),
+        'hit_rates': hit_rates(),
+    }
+
+
+def _metric_name(name):
+    return PROMETHEUS_PREFIX + '_' + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text():
+    """Returns the statistics in the Prometheus text exposition format"""
+    lines = []
+    timer_metrics = (
+        ('stage_calls_total', 'Calls of every pipeline stage', 0),
+        ('stage_wall_seconds_total', 'Wall time spent in every pipeline stage', 1),
+        ('stage_cpu_seconds_total', 'CPU time spent in every pipeline stage', 2),
+    )
+    for suffix, description, column in timer_metrics:
+        name = _metric_name(suffix)
+        lines.append(f"# HELP {name} {description}, by reaction shape")
+        lines.append(f"# TYPE {name} counter")
+        for (stage, shape), entry in sorted(_timers.items()):
+            lines.append(f'{name}{{stage="{_label(stage)}",shape="{_label(shape)}"}} {entry[column]}')
+    for counter, value in sorted(_counters.items()):
+        name = _metric_name(counter) + '_total'
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {value}")
+    rates = hit_rates()
+    if rates:
+        name = _metric_name('hit_rate')
+        lines.append(f"# HELP {name} Fraction of lookups that were hits")
+        lines.append(f"# TYPE {name} gauge")
+        for source, entry in rates.items():
+            lines.append(f'{name}{{source="{_label(source)}"}} {entry["hit_rate"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def export(path, fmt=None):
+    """
+    Writes the statistics to a file, as JSON (from 'stats') or in the Prometheus text format. The format is taken from the extension when not given: '.json' is JSON, anything else is Prometheus text.
+
+    Args:
+        path (str): file to write
+        fmt (str, optional): 'json' or 'prometheus'
+    """
+    if fmt is None:
+        fmt = 'json' if path.endswith('.json') else 'prometheus'
+    if fmt not in ('json', 'prometheus'):
+        raise ValueError(f"Unknown export format: {fmt}")
+    with open(path, 'w', encoding='utf-8') as f:
+        if fmt == 'json':
+            json.dump(stats(), f, indent=2)
+            f.write('\n')
+        else:
+            f.write(prometheus_text())
@@ -0,0 +1,204 @@
+# Relativistic kinematics of many reactions at once: Q-values, thresholds, two-body momenta and maximum kinetic energies
+
+try:
+    import numpy as np
+except ImportError:  # numpy is needed by everything in this module
+    np = None
+
+from src.resolver import ParticleResolver
+
+# Energies and masses are in the units of the 'mass' fields of the databases (MeV), with c = 1
+
+
+class MassTable:
+    """
+    Masses of every particle of the databases, indexed like 'ParticleResolver' (row i is the particle with ID i), used to turn batches of reactions into padded mass arrays.
+    After a reload the rows follow the IDs of the reloaded resolver: new particles are at the end, and the rows of removed particles are holes that keep their old mass and are never looked up.
+    Requires numpy.
+
+    Args:
+        ElementalParticles_db (dict): database of elemental particles
+        ComplexParticles_db (dict, optional): database of complex particles
+        resolver (ParticleResolver, optional): index of both databases, if one was already built
+    """
+    def __init__(self, ElementalParticles_db, ComplexParticles_db=None, resolver=None):
+        if np is None:
+            raise ImportError("numpy is required by the kinematics module")
+        self.resolver = resolver or ParticleResolver(ElementalParticles_db, ComplexParticles_db)
+        # One extra row of mass 0 at the end, used to pad the shorter sides
+        self.mass = np.array([p.mass for p in self.resolver.particles] + [0.0], dtype=np.float64)
+        self.padding = len(self.resolver)
+
+    def _side(self, reactions, side):
+        resolve = self.resolver.resolve
+        ids = []
+        lengths = []
+        for reaction in reactions:
+            particles = reaction[side]
+            ids.extend([resolve(p) for p in particles])
+            lengths.append(len(particles))
+        lengths = np.array(lengths, dtype=np.int64)
+        width = int(lengths.max()) if len(lengths) else 0
+        padded = np.full((len(reactions), width), self.padding, dtype=np.int64)
+        # Row and column of every particle of the flat list
+        rows = np.repeat(np.arange(len(reactions)), lengths)
+        starts = np.cumsum(lengths) - lengths
+        columns = np.arange(len(ids)) - np.repeat(starts, lengths)
+        padded[rows, columns] = ids
+        return self.mass[padded], lengths
+
+    def encode(self, reactions):
+        """
+        Returns the masses of the initial and final particles of every reaction, as two arrays of shape (len(reactions), largest side) padded with zeros, and the number of particles of each side.
+        Particles may be given by name, symbol or alias.
+
+        Args:
+            reactions (list): dictionaries with 'initial' and 'final' lists of particles
+        """
+        initial, n_initial = self._side(reactions, 'initial')
+        final, n_final = self._side(reactions, 'final')
+        return initial, final, n_initial, n_final
+
+
+def q_values(initial_masses, final_masses):
+    """
+    Returns the Q-value of every reaction, the mass (rest energy) released: the sum of the initial masses minus the sum of the final masses. A decay is only allowed with Q >= 0.
+
+    Args:
+        initial_masses (ndarray): padded initial masses, shape (N, k) (from 'MassTable.encode')
+        final_masses (ndarray): padded final masses, shape (N, m)
+    """
+    return initial_masses.sum(axis=1) - final_masses.sum(axis=1)
+
+
+def threshold_sqrt_s(final_masses):
+    """
+    Returns the production threshold of every reaction: the smallest centre-of-mass energy √s that can create the final state, which is the sum of the final masses (all of them produced at rest in the centre-of-mass frame).
+
+    Args:
+        final_masses (ndarray): padded final masses, shape (N, m)
+    """
+    return final_masses.sum(axis=1)
+
+
+def fixed_target_threshold(initial_masses, final_masses, n_initial):
+    """
+    Returns the smallest total energy of the beam particle (the first initial particle) that reaches the production threshold when the second initial particle is at rest: E = (s_th - m_beam² - m_target²) / (2 m_target).
+    The result is NaN for reactions without exactly two initial particles, or with a massless target.
+
+    Args:
+        initial_masses (ndarray): padded initial masses, shape (N, k)
+        final_masses (ndarray): padded final masses, shape (N, m)
+        n_initial (ndarray): number of initial particles of every reaction, shape (N,)
+    """
+    if initial_masses.shape[1] < 2:
+        return np.full(len(initial_masses), np.nan)
+    beam = initial_masses[:, 0]
+    target = initial_masses[:, 1]
+    s_threshold = threshold_sqrt_s(final_masses) ** 2
+    two_particles = (np.asarray(n_initial) == 2) & (target > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        energy = (s_threshold - beam ** 2 - target ** 2) / (2 * target)
+    # Below the rest energy of the beam means any beam energy is enough
+    return np.where(two_particles, np.maximum(energy, beam), np.nan)
+
+
+def two_body_momentum(sqrt_s, m1, m2):
+    """
+    Returns the momentum of each of two particles of masses m1 and m2 produced with total energy sqrt_s in their centre-of-mass frame: p = √λ(s, m1², m2²) / (2√s), with the Källén function λ.
+    The result is NaN where sqrt_s is below m1 + m2. Arguments are broadcast together.
+
+    Args:
+        sqrt_s (ndarray or float): centre-of-mass energy (the parent mass for a decay)
+        m1 (ndarray or float): mass of the first particle
+        m2 (ndarray or float): mass of the second particle
+    """
+    sqrt_s = np.asarray(sqrt_s, dtype=np.float64)
+    s = sqrt_s ** 2
+    # λ(s, m1², m2²) factorized, which stays accurate near the threshold
+    kallen = (s - (m1 + m2) ** 2) * (s - (m1 - m2) ** 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        momentum = np.sqrt(kallen) / (2 * sqrt_s)
+    return np.where((sqrt_s >= m1 + m2) & (sqrt_s > 0), momentum, np.nan)
+
+
+def max_kinetic_energy(sqrt_s, final_masses, n_final):
+    """
+    Returns the largest kinetic energy that every final particle can carry, with shape (N, m) like 'final_masses'.
+    A particle gets the most energy when all the others recoil together as a single body of mass M_rest (the sum of their masses), which gives E_max = (s + m² - M_rest²) / (2√s) and T_max = E_max - m.
+    Entries are NaN for the padding and for reactions below their threshold.
+
+    Args:
+        sqrt_s (ndarray): centre-of-mass energy of every reaction, shape (N,)
+        final_masses (ndarray): padded final masses, shape (N, m)
+        n_final (ndarray): number of final particles of every reaction, shape (N,)
+    """
+    sqrt_s = np.asarray(sqrt_s, dtype=np.float64)[:, None]
+    total = final_masses.sum(axis=1, keepdims=True)
+    recoil = total - final_masses
+    with np.errstate(divide='ignore', invalid='ignore'):
+        energy = (sqrt_s ** 2 + final_masses ** 2 - recoil ** 2) / (2 * sqrt_s)
+    present = np.arange(final_masses.shape[1])[None, :] < np.asarray(n_final)[:, None]
+    return np.where(present & (sqrt_s >= total) & (sqrt_s > 0), energy - final_masses, np.nan)
+
+
+def analyze_kinematics(reactions, mass_table, sqrt_s=None):
+    """
+    Computes the kinematics of a batch of reactions in one vectorized pass, and returns a dictionary of arrays with one entry per reaction:
+    - 'q_value': mass released (negative when energy must be supplied)
+    - 'threshold': production threshold in √s
+    - 'fixed_target': beam energy threshold on a target at rest (NaN unless there are two initial particles)
+    - 'sqrt_s': centre-of-mass energy used for the rest: the parent mass for decays, and the given 'sqrt_s' for scattering (NaN if not given)
+    - 'allowed': True if 'sqrt_s' reaches the threshold
+    - 'momentum': centre-of-mass momentum of two-body final states (NaN for other final states)
+    - 'max_kinetic': largest kinetic energy of every final particle, shape (N, largest final state), NaN-padded
+
+    Args:
+        reactions (list): dictionaries with 'initial' and 'final' lists of particles
+        mass_table (MassTable): masses of the particle databases
+        sqrt_s (float or ndarray, optional): centre-of-mass energy of the scattering reactions, one value or one per reaction
+    """
+    initial, final, n_initial, n_final = mass_table.encode(reactions)
+    decay = n_initial == 1
+    collision = np.nan if sqrt_s is None else np.broadcast_to(np.asarray(sqrt_s, dtype=np.float64), decay.shape)
+    energy = np.where(decay, initial.sum(axis=1), collision)
+    threshold = threshold_sqrt_s(final)
+
+    momentum = np.full(len(reactions), np.nan)
+    two_body = n_final == 2
+    if final.shape[1] >= 2 and two_body.any():
+        momentum[two_body] = two_body_momentum(energy[two_body], final[two_body, 0], final[two_body, 1])
+
+    return {
+        'q_value': q_values(initial, final),
+        'threshold': threshold,
+        'fixed_target': fixed_target_threshold(initial, final, n_initial),
+        'sqrt_s': energy,
+        'allowed': energy >= threshold,
+        'momentum': momentum,
+        'max_kinetic': max_kinetic_energy(energy, final, n_final),
+    }
+
+
+def scan_energies(thresholds, energies):
+    """
+    Screens reactions against a grid of centre-of-mass energies, without building the (reactions x energies) matrix. Returns:
+    - for every reaction, the index in 'energies' of the lowest energy that reaches its threshold (len(energies) if none does)
+    - for every energy, the number of reactions it opens
+    Both come from binary searches over sorted arrays, so large reaction lists and fine grids cost O((N + E) log(N + E)).
+
+    Args:
+        thresholds (ndarray): production thresholds in √s (from 'threshold_sqrt_s'), NaN for reactions to leave out
+        energies (ndarray): grid of √s values, in any order (e.g. np.linspace(0, 14000, 1401))
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    energies = np.asarray(energies, dtype=np.float64)
+    order = np.argsort(energies, kind='stable')
+    position = np.searchsorted(energies[order], thresholds, side='left')
+    # NaN thresholds sort after every energy, so they are never opened
+    first = np.full(len(thresholds), len(energies), dtype=np.int64)
+    found = position < len(energies)
+    first[found] = order[position[found]]
+    known = np.sort(thresholds[~np.isnan(thresholds)])
+    open_count = np.searchsorted(known, energies, side='right')
+    return first, open_count
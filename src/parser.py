@@ -1,84 +1,213 @@
 # Tokenizes and interprets user imput
 
 import re
+from itertools import product
+
+from src.resolver import ParticleResolver
+
+# Separator of the steps of a decay chain (e.g. 'K- p -> lambda0 pi0, lambda0 -> p pi-')
+_STEP_SEPARATOR = re.compile(r'[,;]')
+
+def _split_side(side):
+    # Particles of one side of a step, without the optional '+' separators
+    particles = side.split()
+    if '+' in particles:
+        particles = [p for p in particles if p != '+']
+    return particles
+
+def _parse_step(step_str):
+    left, arrow, right = step_str.partition('->')
+    if not arrow:
+        raise ValueError("Reaction string must contain '->' to separate reactants and products.")
+    if '->' in right:
+        raise ValueError("Every step of a reaction must contain a single '->'. Steps of a decay chain are separated by ','")
+    return {
+        'initial': _split_side(left),
+        'final': _split_side(right),
+    }
 
 def parse_reaction(reaction_str):
     """
     Parses a string reaction into initial and final particles. Determines the objective of the reaction, and the steps can be deduced from it.
-    It also checks for the presence of tokens like '->' or '+' to separate reactants and products.
+    It also checks for the presence of tokens like '->' or '+' to separate reactants and products: particles are separated by whitespace, and a standalone '+' between them is optional (e.g. 'p + p -> p + p + pi0').
+    Decay chains are parsed by 'parse_decay_chain'.
 
     Args:
         reaction_str (str): input reaction string
-    """    
-    if '->' not in reaction_str:
+    """
+    if ',' in reaction_str or ';' in reaction_str:
+        raise ValueError("Decay chains must be parsed with 'parse_decay_chain'.")
+    return _parse_step(reaction_str)
+
+def parse_decay_chain(chain_str):
+    """
+    Parses a reaction followed by the decays of some of its products, separated by ',' or ';' (e.g. 'K- p -> lambda0 pi0, lambda0 -> p pi-, pi0 -> gamma gamma').
+    Returns the first reaction as 'initial' and 'final', like 'parse_reaction', and the next steps in 'decays', each with a single initial particle. Decays can be nested: a step can decay a product of any earlier step.
+
+    Args:
+        chain_str (str): input decay chain string
+    """
+    steps = [_parse_step(step_str) for step_str in _STEP_SEPARATOR.split(chain_str) if step_str.strip()]
+    if not steps:
         raise ValueError("Reaction string must contain '->' to separate reactants and products.")
+    for step in steps[1:]:
+        if len(step['initial']) != 1:
+            raise ValueError(f"Every decay of a chain must have a single initial particle: {' '.join(step['initial'])}")
+    return {
+        'initial': steps[0]['initial'],
+        'final': steps[0]['final'],
+        'decays': steps[1:],
+    }
+
+def parse_input(reaction_str):
+    """
+    Parses a line of input: a decay chain with 'parse_decay_chain' if it has ',' or ';' between steps, and a single reaction with 'parse_reaction' otherwise.
+
+    Args:
+        reaction_str (str): input reaction or decay chain string
+    """
+    if ',' in reaction_str or ';' in reaction_str:
+        return parse_decay_chain(reaction_str)
+    return parse_reaction(reaction_str)
+
+def decay_tree(chain, resolver):
+    """
+    Resolves a parsed decay chain into a compact tree of particle IDs: a pair (initial IDs, final nodes), where every node is a pair (ID, children) and the children are the nodes of its decay products, or empty if it does not decay.
+    Every decay is attached to the first product with the same ID that has not decayed yet, in the order the products appear.
+
+    Args:
+        chain (dict): decay chain from the 'parse_decay_chain' function (a reaction from 'parse_reaction' is a chain without decays)
+        resolver (ParticleResolver): index of the particle databases (from resolver.py)
+    """
+    resolve = resolver.resolve
+    # Nodes are built as [ID, children] lists while the decays are attached, and frozen into tuples at the end
+    undecayed = []
+
+    def nodes(particles):
+        created = [[resolve(p), None] for p in particles]
+        undecayed.extend(created)
+        return created
+
+    final = nodes(chain['final'])
+    for step in chain.get('decays', ()):
+        parent = step['initial'][0]
+        parent_id = resolve(parent)
+        position = next((i for i, node in enumerate(undecayed) if node[0] == parent_id), None)
+        if position is None:
+            raise ValueError(f"'{parent}' decays but is not a product of an earlier step")
+        node = undecayed.pop(position)
+        node[1] = nodes(step['final'])
+
+    def freeze(node):
+        return (node[0], tuple(freeze(child) for child in node[1]) if node[1] is not None else ())
+
+    return tuple(resolve(p) for p in chain['initial']), tuple(freeze(node) for node in final)
 
-    # Split the reaction string into reactants and products
-    left, right = reaction_str.split('->')
-    initial = re.findall(r'\S+', left.strip())
-    final = re.findall(r'\S+', right.strip())
+def parse_many(text):
+    """
+    Parses a whole buffer of reactions at once, one per line, and returns a list of (reaction_str, parsed) pairs, with 'parsed' as returned by 'parse_input', or None if the line cannot be parsed.
+    Blank lines and lines starting with '#' are skipped, like in 'ReactionPipeline.run_batch'.
+    The buffer is split into lines once, and every line with a single '->' and no decay chain is split into particles by the string methods, without calling 'parse_reaction'.
+
+    Args:
+        text (str): reactions, one per line
+    """
+    results = []
+    append = results.append
+    # Comments and decay chains are looked for once in the whole buffer: without them, every line with a single '->' takes the fast path
+    plain = '#' not in text and ',' not in text and ';' not in text
+    for line in text.split('\n'):
+        left, arrow, right = line.partition('->')
+        if arrow and '->' not in right and (plain or ('#' not in left and ',' not in line and ';' not in line)):
+            initial = left.split()
+            final = right.split()
+            if '+' in initial:
+                initial = [p for p in initial if p != '+']
+            if '+' in final:
+                final = [p for p in final if p != '+']
+            append((line.strip(), {'initial': initial, 'final': final}))
+            continue
+        reaction_str = line.strip()
+        if not reaction_str or reaction_str.startswith('#'):
+            continue
+        try:
+            append((reaction_str, parse_input(reaction_str)))
+        except ValueError:
+            append((reaction_str, None))
+    return results
 
+def iter_parsed(stream, block_size=1 << 16):
+    """
+    Reads a text stream (an open file, stdin...) in blocks of about 'block_size' characters and yields the (reaction_str, parsed) pairs of 'parse_many', so that large inputs are parsed in bulk without being held in memory. Lines are never cut between two blocks.
+
+    Args:
+        stream (file): text stream with one reaction per line
+        block_size (int, optional): number of characters read at a time
+    """
+    rest = ''
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        block = rest + block
+        end = block.rfind('\n') + 1
+        rest = block[end:]
+        yield from parse_many(block[:end])
+    if rest:
+        yield from parse_many(rest)
+
+def resolve_particles(parsed, resolver):
+    """
+    Resolves every particle of a parsed reaction to its integer ID.
+
+    Args:
+        parsed (dict): parsed reaction from the 'parse_reaction' function
+        resolver (ParticleResolver): index of the particle databases (from resolver.py)
+    """
     return {
-        'initial': initial,
-        'final': final,
+        'initial': [resolver.resolve(p) for p in parsed['initial']],
+        'final': [resolver.resolve(p) for p in parsed['final']]
     }
 
-def normalize_particles(parsed, ElementalParticles_db, ComplexParticles_db):
+def normalize_particles(parsed, resolver, ComplexParticles_db=None):
     """
     Normalizes a reaction by converting particle symbols or names to canonical names.
     If a particle is already given by name (i.e., it exists in the database keys), it is left unchanged.
        
     Args:
         parsed (dict): parsed reaction from the 'parse_reaction' function
-        ElementalParticles_db (dict): database where keys are particle names (i.e. 'electron') and values are particle objects (from particles.py)
+        resolver (ParticleResolver): index of the particle databases (from resolver.py). The elemental and complex databases can also be given instead, in which case the index is built on every call
+        ComplexParticles_db (dict, optional): database of complex particles, only when the elemental database is given instead of a resolver
     """    
-    
-    elemental_SymbolToName = {p.symbol: name for name, p in ElementalParticles_db.items()}
-    complex_SymbolToName = {p.symbol: name for name, p in ComplexParticles_db.items()}
-    
-
-    def resolve(particle_id):
-        # If it's already a name in either DB, return as is
-        if particle_id in ElementalParticles_db or particle_id in ComplexParticles_db:
-            return particle_id
-        # If it's a known symbol in elemental particles
-        if particle_id in elemental_SymbolToName:
-            return elemental_SymbolToName[particle_id]
-        # If it's a known symbol in complex particles
-        if particle_id in complex_SymbolToName:
-            return complex_SymbolToName[particle_id]
-        raise ValueError(f"Unknown particle: {particle_id}")
+    if not isinstance(resolver, ParticleResolver):
+        resolver = ParticleResolver(resolver, ComplexParticles_db)
 
+    names = resolver.names
     return {
-        'initial': [resolve(p) for p in parsed['initial']],
-        'final': [resolve(p) for p in parsed['final']]
+        'initial': [names[resolver.resolve(p)] for p in parsed['initial']],
+        'final': [names[resolver.resolve(p)] for p in parsed['final']]
     }
     
-def analyze_complex_particles(parsed, ComplexParticles_db, ElementalParticles_db=None):
+def analyze_complex_particles(parsed, resolver, ElementalParticles_db=None):
     """
     Translates the complex particles into their elemental components.
 
     Args:
         parsed (dict): parsed reaction from the 'parse_reaction' function
-        ComplexParticles_db (dict): database where keys are complex particle names (i.e. 'kaon-') and values are lists of elemental particles
-        ElementalParticles_db (dict, optional): database of elemental particles for symbol-to-name mapping
+        resolver (ParticleResolver): index of the particle databases (from resolver.py). The complex database can also be given instead, in which case the index is built on every call
+        ElementalParticles_db (dict, optional): database of elemental particles for symbol-to-name mapping, only when the complex database is given instead of a resolver
     """
-    # Create symbol-to-name mapping for elemental particles if database is provided
-    symbol_to_name = {}
-    if ElementalParticles_db:
-        symbol_to_name = {p.symbol: name for name, p in ElementalParticles_db.items()}
+    if not isinstance(resolver, ParticleResolver):
+        resolver = ParticleResolver(ElementalParticles_db or {}, resolver)
+
+    index = resolver.index
+    contents = resolver.contents
 
     def translate(particle):
-        if particle in ComplexParticles_db:
+        particle_id = index.get(particle)
+        if particle_id is not None and resolver.is_complex(particle_id):
             # Use the first possible composition
-            components = ComplexParticles_db[particle].content[0]
-            component_list = components.split()
-
-            # Map symbols to full names if possible
-            if symbol_to_name:
-                component_list = [symbol_to_name.get(comp, comp) for comp in component_list]
-
-            return component_list
+            return contents[particle_id][0]
         else:
             return [particle]
 
@@ -93,4 +222,53 @@ def analyze_complex_particles(parsed, ComplexParticles_db, ElementalParticles_db
         "initial": expanded_initial,
         "final": expanded_final
     }
-        
\ No newline at end of file
+
+def iter_complex_expansions(parsed, resolver):
+    """
+    Translates the complex particles into their elemental components, like 'analyze_complex_particles', but for every possible composition: mixed states such as 'pion0' or 'eta' have several.
+    Yields one elemental reaction per combination of compositions across the reaction, starting with the one 'analyze_complex_particles' gives (first composition everywhere).
+
+    Combinations are generated lazily and every distinct elemental reaction is yielded once. Each side is expanded on its own, and the expansions of the final state are computed once and reused for every expansion of the initial state.
+
+    Args:
+        parsed (dict): normalized reaction from the 'normalize_particles' function
+        resolver (ParticleResolver): index of the particle databases (from resolver.py)
+    """
+    final_cache = []
+    final_expansions = _side_expansions(parsed["final"], resolver)
+    for initial in _side_expansions(parsed["initial"], resolver):
+        for final in _replay(final_expansions, final_cache):
+            yield {
+                "initial": list(initial),
+                "final": list(final)
+            }
+
+def _side_expansions(particles, resolver):
+    # Every distinct elemental expansion of one side of a reaction
+    index = resolver.index
+    options = []
+    for p in particles:
+        particle_id = index.get(p)
+        if particle_id is not None and resolver.is_complex(particle_id):
+            options.append(resolver.contents[particle_id])
+        else:
+            options.append(((p,),))
+    seen = set()
+    for choice in product(*options):
+        expanded = tuple(component for composition in choice for component in composition)
+        if expanded not in seen:
+            seen.add(expanded)
+            yield expanded
+
+def _replay(iterator, cache):
+    # Yields the items already pulled from the iterator (stored in 'cache'), then keeps pulling and storing new ones
+    i = 0
+    while True:
+        if i == len(cache):
+            try:
+                cache.append(next(iterator))
+            except StopIteration:
+                return
+        yield cache[i]
+        i += 1
+
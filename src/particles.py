@@ -1,8 +1,57 @@
 # Loads particle data, handles lookup
 
 import json
+import re
+import sys
+
+def _shared(value):
+    # Strings repeated across many particles (category, family, interactions...) are stored once
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, list):
+        return [_shared(item) for item in value]
+    return value
+
+# Generation of every lepton flavour
+LEPTON_GENERATIONS = {"e": 1, "mu": 2, "tau": 3}
+
+def family_keys(family):
+    """
+    Normalizes the 'family' field of an elemental particle, which is an int for quarks (generation, negative for antiquarks) and a string for leptons (e.g. '1mu', ' -1mu') and bosons.
+    Returns:
+    - lepton_flavour: lower-case letters of the family (the lepton flavour 'e', 'mu' or 'tau' for leptons, '' for quarks, a tag like 'weak' for bosons)
+    - generation: 1, 2 or 3 for quarks and leptons, 0 for bosons
+    - sign: +1 for particles, -1 for antiparticles, 0 for bosons
+
+    Args:
+        family (int or str): 'family' field of the particle
+    """
+    lepton_flavour = re.sub(r'[^a-z]', '', str(family))
+    if isinstance(family, int):
+        return lepton_flavour, abs(family), (family > 0) - (family < 0)
+    if lepton_flavour in LEPTON_GENERATIONS:
+        return lepton_flavour, LEPTON_GENERATIONS[lepton_flavour], -1 if '-' in family else 1
+    return lepton_flavour, 0, 0
+
+def decay_channels(decays):
+    """
+    Normalizes the 'decays' field of a particle, a list of {"products": [names], "branching": fraction}, into a tuple of (products, branching) pairs, with the products as a tuple of particle names. Stable particles have no channels.
+
+    Args:
+        decays (list): 'decays' field of the particle, or None
+    """
+    return tuple((tuple(_shared(decay["products"])), float(decay["branching"])) for decay in decays or ())
 
 class ElementalParticle:
+    # Fixed attributes: no per-instance __dict__, which keeps large catalogues small and attribute lookups fast.
+    # The values are copied from the JSON data into every object when it is built
+    __slots__ = (
+        "name", "symbol", "LaTeX", "mass", "spin", "charge", "baryon_number",
+        "le_number", "lmu_number", "tau_number", "strangeness", "charm", "beauty", "truth",
+        "interactions", "family", "category", "supcategory", "decays",
+        "lepton_flavour", "generation", "sign",
+    )
+
     def __init__(self, name, data):
         self.name = name
         self.symbol = data.get("symbol")
@@ -18,12 +67,31 @@ class ElementalParticle:
         self.charm = int(data.get("charm", 0))
         self.beauty = int(data.get("beauty", 0))
         self.truth = int(data.get("truth", 0))
-        self.interactions = data.get("interactions", [])
-        self.family = data.get("family")
-        self.category = data.get("category")
-        self.supcategory = data.get("supcategory")
+        self.interactions = _shared(data.get("interactions", []))
+        self.family = _shared(data.get("family"))
+        self.category = _shared(data.get("category"))
+        self.supcategory = _shared(data.get("supcategory"))
+        self.decays = decay_channels(data.get("decays"))
+        # Precomputed once so that the identifier does not normalize 'family' for every candidate pair
+        lepton_flavour, self.generation, self.sign = family_keys(self.family)
+        self.lepton_flavour = _shared(lepton_flavour)
+
+    # Particles are identified by their name, which is unique in the database
+    def __eq__(self, other):
+        return type(other) is type(self) and other.name == self.name
+
+    def __hash__(self):
+        return hash((type(self).__name__, self.name))
+
+    def __repr__(self):
+        return f"<Particle({self.name}, (symbol={self.symbol})>"
     
 class ComplexParticle:
+    __slots__ = (
+        "name", "symbol", "LaTeX", "content", "mass", "spin", "charge", "baryon_number",
+        "strangeness", "charm", "beauty", "truth", "interactions", "category", "supcategory", "family", "decays",
+    )
+
     def __init__(self, name, data):
         self.name = name
         self.symbol = data.get("symbol")
@@ -37,9 +105,17 @@ class ComplexParticle:
         self.charm = int(data.get("charm", 0))
         self.beauty = int(data.get("beauty", 0))
         self.truth = int(data.get("truth", 0))
-        self.interactions = data.get("interactions", [])
-        self.category = data.get("category")
-        self.family = data.get("family")
+        self.interactions = _shared(data.get("interactions", []))
+        self.category = _shared(data.get("category"))
+        self.supcategory = _shared(data.get("supcategory"))
+        self.family = _shared(data.get("family"))
+        self.decays = decay_channels(data.get("decays"))
+
+    def __eq__(self, other):
+        return type(other) is type(self) and other.name == self.name
+
+    def __hash__(self):
+        return hash((type(self).__name__, self.name))
 
     def __repr__(self):
         return f"<Particle({self.name}, (symbol={self.symbol})>"
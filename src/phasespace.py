@@ -0,0 +1,223 @@
+# Monte Carlo generation of N-body phase-space events for allowed reactions (RAMBO), in large numpy batches
+
+import json
+import math
+import os
+
+try:
+    import numpy as np
+except ImportError:  # numpy is needed by everything in this module
+    np = None
+
+from src.validator import validate_process
+
+EVENTS_DIR = 'output/events'
+
+# Tolerance of the Newton iteration that puts the massless momenta on their mass shell, relative to sqrt_s
+_XI_TOLERANCE = 1e-12
+_XI_MAX_ITERATIONS = 50
+
+
+def massless_volume(sqrt_s, n):
+    """
+    Returns the volume of the phase space of n massless particles with total energy sqrt_s, which is the (constant) weight of every massless RAMBO event:
+    V = (2π)^(4-3n) (π/2)^(n-1) s^(n-2) / ((n-1)! (n-2)!), with the (2π) factors of the Lorentz-invariant phase space.
+
+    Args:
+        sqrt_s (float): centre-of-mass energy
+        n (int): number of particles (at least 2)
+    """
+    log_volume = ((4 - 3 * n) * math.log(2 * math.pi) + (n - 1) * math.log(math.pi / 2)
+                  + (2 * n - 4) * math.log(sqrt_s) - math.lgamma(n) - math.lgamma(n - 1))
+    return math.exp(log_volume)
+
+
+def rambo(sqrt_s, masses, n_events, rng):
+    """
+    Generates phase-space events with the RAMBO algorithm (Kleiss, Stirling and Ellis), all of them at once, and returns:
+    - the four-momenta (E, px, py, pz) of every particle in the centre-of-mass frame, shape (n_events, len(masses), 4)
+    - the weight of every event, shape (n_events,): the massless volume times the mass correction, so that the mean weight estimates the phase-space volume
+    Massless momenta are drawn isotropically, boosted and scaled so that they add up to (sqrt_s, 0, 0, 0), and then put on their mass shell with a common scale factor, found by Newton iteration.
+
+    Args:
+        sqrt_s (float): centre-of-mass energy, at least the sum of the masses
+        masses (list): masses of the final particles (at least two)
+        n_events (int): number of events to generate
+        rng (numpy.random.Generator): source of random numbers
+    """
+    masses = np.asarray(masses, dtype=np.float64)
+    n = len(masses)
+    if n < 2:
+        raise ValueError("Phase space needs at least two final particles")
+    if sqrt_s < masses.sum():
+        raise ValueError(f"Energy below threshold: {sqrt_s} < {masses.sum()}")
+
+    # 1. Isotropic massless momenta with energies distributed as E exp(-E)
+    r = rng.random((4, n_events, n))
+    cos_theta = 2 * r[0] - 1
+    sin_theta = np.sqrt(1 - cos_theta ** 2)
+    phi = 2 * math.pi * r[1]
+    q0 = -np.log(r[2] * r[3])
+    q = np.stack([q0, q0 * sin_theta * np.cos(phi), q0 * sin_theta * np.sin(phi), q0 * cos_theta], axis=-1)
+
+    # 2. Boost and scale them to the centre-of-mass frame of the total energy
+    total = q.sum(axis=1)
+    invariant = np.sqrt(total[:, 0] ** 2 - (total[:, 1:] ** 2).sum(axis=1))
+    b = -total[:, 1:] / invariant[:, None]
+    gamma = total[:, 0] / invariant
+    a = 1 / (1 + gamma)
+    x = sqrt_s / invariant
+    bq = (b[:, None, :] * q[:, :, 1:]).sum(axis=2)
+    p = np.empty_like(q)
+    p[:, :, 0] = x[:, None] * (gamma[:, None] * q[:, :, 0] + bq)
+    p[:, :, 1:] = x[:, None, None] * (q[:, :, 1:] + b[:, None, :] * (q[:, :, :1] + a[:, None, None] * bq[:, :, None]))
+
+    weights = np.full(n_events, massless_volume(sqrt_s, n))
+    if not masses.any():
+        return p, weights
+
+    # 3. Common factor xi of the momenta that makes the energies of the massive particles add up to sqrt_s
+    m2 = masses ** 2
+    e2 = p[:, :, 0] ** 2
+    xi = np.full(n_events, math.sqrt(max(1 - (masses.sum() / sqrt_s) ** 2, 0.0)))
+    for _ in range(_XI_MAX_ITERATIONS):
+        energies = np.sqrt(m2 + xi[:, None] ** 2 * e2)
+        f = energies.sum(axis=1) - sqrt_s
+        if np.abs(f).max() <= _XI_TOLERANCE * sqrt_s:
+            break
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = f / (xi * (e2 / energies).sum(axis=1))
+        xi = np.where(np.isfinite(step), xi - step, xi)
+
+    k = xi[:, None] * p[:, :, 0]
+    energies = np.sqrt(m2 + k ** 2)
+    momenta = np.empty_like(p)
+    momenta[:, :, 0] = energies
+    momenta[:, :, 1:] = xi[:, None, None] * p[:, :, 1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correction = (xi ** (2 * n - 3) * np.prod(k / energies, axis=1) * sqrt_s
+                      / (k ** 2 / energies).sum(axis=1))
+    weights *= np.nan_to_num(correction)
+    return momenta, weights
+
+
+def event_dtype(n):
+    """Returns the structured dtype of the events of n particles saved in the '.npy' chunks: the 'momenta' (n, 4) and the 'weight' of every event"""
+    return np.dtype([('momenta', np.float64, (n, 4)), ('weight', np.float64)])
+
+
+class PhaseSpaceGenerator:
+    """
+    Generates phase-space events for the final state of an allowed reaction, in the centre-of-mass frame (the rest frame of the parent in decays).
+    The reaction is checked once with 'validate_process', and the masses of the final particles are taken from the databases.
+    Requires numpy.
+
+    Args:
+        reaction (dict): dictionary with 'initial' and 'final' lists of particle names (from 'normalize_particles')
+        ElementalParticles_db (dict): database of elemental particles
+        ComplexParticles_db (dict, optional): database of complex particles
+        sqrt_s (float, optional): centre-of-mass energy. Required for scattering, and the parent mass by default for decays
+    """
+    def __init__(self, reaction, ElementalParticles_db, ComplexParticles_db=None, sqrt_s=None):
+        if np is None:
+            raise ImportError("numpy is required by the phasespace module")
+        errors = validate_process(reaction, ElementalParticles_db, ComplexParticles_db)
+        if errors:
+            raise ValueError("; ".join(errors))
+
+        def mass(name):
+            if name in ElementalParticles_db:
+                return ElementalParticles_db[name].mass
+            return ComplexParticles_db[name].mass
+
+        self.reaction = {'initial': list(reaction['initial']), 'final': list(reaction['final'])}
+        self.masses = [mass(name) for name in reaction['final']]
+        if sqrt_s is None:
+            if len(reaction['initial']) != 1:
+                raise ValueError("The centre-of-mass energy is required for scattering reactions")
+            sqrt_s = mass(reaction['initial'][0])
+        if len(self.masses) < 2:
+            raise ValueError("Phase space needs at least two final particles")
+        if sqrt_s < sum(self.masses):
+            raise ValueError(f"Energy below threshold: {sqrt_s} < {sum(self.masses)}")
+        self.sqrt_s = float(sqrt_s)
+
+    def generate(self, n_events, rng):
+        """
+        Returns the four-momenta, shape (n_events, final particles, 4), and the weights of n_events events (see 'rambo').
+
+        Args:
+            n_events (int): number of events
+            rng (numpy.random.Generator): source of random numbers
+        """
+        return rambo(self.sqrt_s, self.masses, n_events, rng)
+
+    def iter_batches(self, n_events, batch_size=100000, seed=None):
+        """
+        Yields the events in batches of at most batch_size, as structured arrays of 'event_dtype', so that only one batch is in memory at a time.
+        Every batch has its own random stream, derived from 'seed', so the same seed and batch_size give the same events.
+
+        Args:
+            n_events (int): total number of events
+            batch_size (int, optional): number of events per batch
+            seed (int, optional): seed of the random numbers (random if not given)
+        """
+        n_batches = -(-n_events // batch_size)
+        streams = np.random.SeedSequence(seed).spawn(n_batches)
+        dtype = event_dtype(len(self.masses))
+        for i, stream in enumerate(streams):
+            size = min(batch_size, n_events - i * batch_size)
+            momenta, weights = self.generate(size, np.random.default_rng(stream))
+            events = np.empty(size, dtype=dtype)
+            events['momenta'] = momenta
+            events['weight'] = weights
+            yield events
+
+    def write(self, out_dir, n_events, batch_size=100000, seed=None):
+        """
+        Generates n_events events and streams them to 'out_dir' as numbered '.npy' chunks (one per batch), with a 'manifest.json' that describes them. Returns the paths of the chunks.
+        The chunks and the manifest of an earlier run in the same directory are removed first, so that no stale chunk is left next to the new ones. Other files are left alone.
+
+        Args:
+            out_dir (str): directory to write to (created if needed)
+            n_events (int): total number of events
+            batch_size (int, optional): number of events per chunk
+            seed (int, optional): seed of the random numbers (random if not given)
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        for name in os.listdir(out_dir):
+            if name == 'manifest.json' or (name.startswith('events-') and name.endswith('.npy')):
+                os.remove(os.path.join(out_dir, name))
+        if seed is None:
+            # Saved in the manifest so that the events can be generated again
+            seed = np.random.SeedSequence().entropy
+        paths = []
+        for i, events in enumerate(self.iter_batches(n_events, batch_size, seed)):
+            path = os.path.join(out_dir, f'events-{i:05d}.npy')
+            np.save(path, events)
+            paths.append(path)
+        manifest = {
+            'reaction': self.reaction,
+            'masses': self.masses,
+            'sqrt_s': self.sqrt_s,
+            'events': n_events,
+            'batch_size': batch_size,
+            'seed': seed,
+            'chunks': [os.path.basename(path) for path in paths],
+        }
+        with open(os.path.join(out_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        return paths
+
+
+def load_events(out_dir):
+    """
+    Yields the chunks of events written by 'PhaseSpaceGenerator.write', in order, memory-mapped so that they are only read when used.
+
+    Args:
+        out_dir (str): directory with the 'manifest.json' and the chunks
+    """
+    with open(os.path.join(out_dir, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    for name in manifest['chunks']:
+        yield np.load(os.path.join(out_dir, name), mmap_mode='r')
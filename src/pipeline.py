@@ -0,0 +1,415 @@
+# Runs the whole reaction pipeline on one or many reactions
+
+import copy
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from src.particles import load_ElementalParticles, load_ComplexParticles
+from src.parser import parse_input, decay_tree, normalize_particles, resolve_particles, analyze_complex_particles, iter_complex_expansions, iter_parsed
+from src.validator import validate_process, validate_decays, validate_batch, QuantumNumberMatrix
+from src.identifier import identify_interactions, identify_branches, sorted_reaction
+from src.resolver import ParticleResolver
+from src.index import ParticleIndex
+from src.reload import diff_particles, affected_ids, DatabaseWatcher
+from src.cache import canonical_key, ReactionCache
+from src import instrumentation
+from src.profiling import SlowReactionProfiler
+
+# Number of reactions that 'run_batch' and 'run_stream' validate at once
+BATCH_SIZE = 256
+
+# Fields of a record that are stored in the cache: the ones that do not depend on the order of the particles
+CACHED_FIELDS = ('valid', 'errors', 'interactions', 'remaining')
+
+
+class ReactionPipeline:
+    """
+    Runs the parse -> normalize -> validate -> analyze -> identify chain on reaction strings.
+    The particle databases are loaded and indexed once when the pipeline is created, so a batch of reactions only pays for the loading once.
+
+    The interactions are identified on the elemental particles sorted by name (see 'sorted_reaction'), so every ordering of the same particles gets the same result.
+    If a cache is given, the result of every reaction is stored under its canonical form (the sorted particle IDs on each side), so repeated reactions and reorderings of the same particles skip validation and identification. Only the results that do not depend on the order of the particles are stored, as copies; 'elemental' is derived again from the reaction as written.
+
+    Args:
+        ElementalParticles_db (dict, optional): database of elemental particles. Loaded from 'data/' if not given
+        ComplexParticles_db (dict, optional): database of complex particles. Loaded from 'data/' if not given
+        cache (ReactionCache, optional): cache for the results of the pipeline
+    """
+    def __init__(self, ElementalParticles_db=None, ComplexParticles_db=None, cache=None):
+        if ElementalParticles_db is None:
+            ElementalParticles_db = load_ElementalParticles()
+        if ComplexParticles_db is None:
+            ComplexParticles_db = load_ComplexParticles()
+        self.ElementalParticles_db = ElementalParticles_db
+        self.ComplexParticles_db = ComplexParticles_db
+        self.resolver = ParticleResolver(ElementalParticles_db, ComplexParticles_db)
+        self.cache = cache
+        self._index = None
+        self._qn_matrix = None
+
+    @property
+    def index(self):
+        """Index of the particle properties (see 'ParticleIndex'), built the first time it is used after the databases are loaded"""
+        if self._index is None:
+            self._index = ParticleIndex(self.ElementalParticles_db, self.ComplexParticles_db, resolver=self.resolver)
+        return self._index
+
+    @property
+    def qn_matrix(self):
+        """Quantum numbers of the particles for 'validate_batch' (see 'QuantumNumberMatrix'), built the first time they are used after the databases are loaded, or None if numpy is not installed"""
+        if self._qn_matrix is None:
+            try:
+                self._qn_matrix = QuantumNumberMatrix(self.ElementalParticles_db, self.ComplexParticles_db, resolver=self.resolver)
+            except ImportError:
+                return None
+        return self._qn_matrix
+
+    def run(self, reaction_str, all_compositions=False, parsed=None):
+        """
+        Runs the pipeline on a single reaction and returns a JSON-serializable record with the result of every step.
+        If a step fails, the record gets the name of that step in 'stage' and the message in 'error', and the remaining steps are skipped.
+        A reaction that breaks a conservation law is not an error: the record has 'valid' set to False and the reasons in 'errors'.
+        Decay chains (e.g. 'K- p -> lambda0 pi0, lambda0 -> p pi-') are run on their first reaction, and every decay of the chain is validated on its own, in 'decays' ('initial', 'final', 'valid' and 'errors' of every step).
+
+        Args:
+            reaction_str (str): reaction string (e.g. 'e+ e- -> mu+ mu-')
+            all_compositions (bool, optional): also identify the interactions for every other composition of the mixed states (e.g. 'pion0'), in 'branches'. These records are not cached
+            parsed (dict, optional): the reaction already parsed (e.g. by 'parse_many'), to skip the parse step
+        """
+        record, pending = self._begin(reaction_str, parsed, all_compositions)
+        if pending is not None:
+            self._finish(record, pending, all_compositions)
+        return record
+
+    def run_many(self, reactions, parsed=None, validate_only=False):
+        """
+        Runs the pipeline on a list of reactions and returns one record per reaction, in the same order, like 'run' on every one of them.
+        The reactions that reach the validate step are validated all at once with 'validate_batch' if numpy is installed.
+
+        Args:
+            reactions (list): reaction strings
+            parsed (list, optional): the reactions already parsed (e.g. by 'parse_many'), with None for the ones that go through the parse step
+            validate_only (bool, optional): stop after the validate step, without analyzing the valid reactions and identifying their interactions. Cached records may still have them
+        """
+        if parsed is None:
+            parsed = [None] * len(reactions)
+        records = []
+        pending = []
+        for reaction_str, reaction in zip(reactions, parsed):
+            record, state = self._begin(reaction_str, reaction, False)
+            records.append(record)
+            if state is not None:
+                pending.append((record, state))
+        if not pending:
+            return records
+
+        all_errors = [None] * len(pending)
+        qn_matrix = self.qn_matrix
+        if qn_matrix is not None:
+            wall = time.perf_counter()
+            cpu = time.thread_time()
+            try:
+                all_errors = validate_batch([state[0] for _, state in pending], qn_matrix)
+            except KeyError:
+                # Validated one by one below, so that only the reactions with the unknown particle fail
+                pass
+            else:
+                # Every reaction gets an equal share of the time of the batch
+                wall = (time.perf_counter() - wall) / len(pending)
+                cpu = (time.thread_time() - cpu) / len(pending)
+                for _, (_, _, clock) in pending:
+                    if clock is not None:
+                        clock.add('validate', wall, cpu)
+        for (record, state), errors in zip(pending, all_errors):
+            self._finish(record, state, False, errors, validate_only)
+        return records
+
+    def _begin(self, reaction_str, parsed, all_compositions):
+        # Parse, normalize and cache lookup. Returns the record and what '_finish' needs to complete it: the normalized reaction, its cache key and the clock of its stages, or None if the record is already complete (failed or cached)
+        record = {'reaction': reaction_str}
+        stage = 'parse'
+        clock = instrumentation.StageClock(stage) if instrumentation.enabled else None
+        try:
+            if parsed is None:
+                parsed = parse_input(reaction_str)
+
+            stage = 'normalize'
+            if clock is not None:
+                clock.shape = instrumentation.reaction_shape(parsed)
+                clock.start(stage)
+            normalized = normalize_particles(parsed, self.resolver)
+            record['initial'] = normalized['initial']
+            record['final'] = normalized['final']
+            if parsed.get('decays'):
+                # Checks that every decay has a parent produced by an earlier step
+                decay_tree(parsed, self.resolver)
+                steps = [normalize_particles(step, self.resolver) for step in parsed['decays']]
+                stage = 'decays'
+                if clock is not None:
+                    clock.start(stage)
+                record['decays'] = validate_decays(steps, self.ElementalParticles_db, self.ComplexParticles_db)
+
+            key = None
+            if self.cache is not None and not all_compositions:
+                if clock is not None:
+                    clock.start('cache')
+                key = canonical_key(resolve_particles(normalized, self.resolver))
+                cached = self.cache.get(key)
+                if clock is not None:
+                    instrumentation.count('cache.hits' if cached is not None else 'cache.misses')
+                if cached is not None:
+                    stage = 'analyze'
+                    self._restore(record, cached, normalized)
+                    self._close(record, stage, clock)
+                    return record, None
+        except Exception as e:
+            self._fail(record, stage, e, clock)
+            self._close(record, stage, clock)
+            return record, None
+        if clock is not None:
+            clock.pause()
+        return record, (normalized, key, clock)
+
+    def _finish(self, record, pending, all_compositions, errors=None, validate_only=False):
+        # Validate (unless the errors are given), analyze and identify, and store the result in the cache. With 'validate_only', valid reactions stop after the validate step and are not cached, since their record is incomplete
+        normalized, key, clock = pending
+        stage = 'validate'
+        try:
+            if errors is None:
+                if clock is not None:
+                    clock.start(stage)
+                errors = validate_process(normalized, self.ElementalParticles_db, self.ComplexParticles_db)
+            record['valid'] = not errors
+            record['errors'] = errors
+            if errors:
+                self._store(key, record)
+                return
+            if validate_only:
+                return
+
+            stage = 'analyze'
+            if clock is not None:
+                clock.start(stage)
+            elemental = analyze_complex_particles(normalized, self.resolver)
+            record['elemental'] = elemental
+
+            stage = 'identify'
+            if clock is not None:
+                clock.start(stage)
+            interactions, remaining = identify_interactions(sorted_reaction(elemental), self.ElementalParticles_db)
+            record['interactions'] = interactions
+            record['remaining'] = remaining
+
+            if all_compositions:
+                expansions = iter_complex_expansions(normalized, self.resolver)
+                record['branches'] = [
+                    {'elemental': branch, 'interactions': branch_interactions, 'remaining': branch_remaining}
+                    for branch, branch_interactions, branch_remaining in identify_branches(expansions, self.ElementalParticles_db)
+                ]
+            self._store(key, record)
+        except Exception as e:
+            self._fail(record, stage, e, clock)
+        finally:
+            self._close(record, stage, clock)
+
+    @staticmethod
+    def _fail(record, stage, error, clock):
+        record['stage'] = stage
+        record['error'] = str(error)
+        if clock is not None:
+            instrumentation.count(f'errors.{stage}')
+
+    @staticmethod
+    def _close(record, stage, clock):
+        if clock is None:
+            return
+        clock.close()
+        instrumentation.count('reactions')
+        if 'initial' in record:
+            instrumentation.count('resolver.hits', len(record['initial']) + len(record['final']))
+        elif stage == 'normalize':
+            instrumentation.count('resolver.misses')
+
+    def _store(self, key, record):
+        # Only the results that depend on the particles, not on how the reaction was written, go to the cache. They are copied, so that changing the record does not change the cache
+        if key is None:
+            return
+        self.cache.put(key, {k: copy.deepcopy(record[k]) for k in CACHED_FIELDS if k in record})
+
+    def _restore(self, record, cached, normalized):
+        # Completes a record from a cache entry, in the same field order as a record that was not cached
+        record['valid'] = cached['valid']
+        record['errors'] = list(cached['errors'])
+        if record['valid']:
+            record['elemental'] = analyze_complex_particles(normalized, self.resolver)
+            record['interactions'] = copy.deepcopy(cached['interactions'])
+            record['remaining'] = copy.deepcopy(cached['remaining'])
+
+    def reload(self, ElementalParticles_db, ComplexParticles_db):
+        """
+        Replaces the particle databases with new versions of them (e.g. after a data edit), keeping what is still valid: the index is rebuilt with the same ID for every particle that is still there, and only the cached results of reactions that involve a removed or changed particle (or a complex particle made of one) are dropped.
+        Returns the names of the 'added', 'removed' and 'changed' particles, and the number of cache entries 'invalidated'.
+
+        Args:
+            ElementalParticles_db (dict): new database of elemental particles
+            ComplexParticles_db (dict): new database of complex particles
+        """
+        summary = {'added': [], 'removed': [], 'changed': []}
+        for old_db, new_db in ((self.ElementalParticles_db, ElementalParticles_db), (self.ComplexParticles_db, ComplexParticles_db)):
+            for kind, names in diff_particles(old_db, new_db).items():
+                summary[kind] += names
+        resolver = ParticleResolver(ElementalParticles_db, ComplexParticles_db, previous=self.resolver)
+        stale = affected_ids(self.resolver, resolver, summary['removed'] + summary['changed'])
+
+        self.ElementalParticles_db = ElementalParticles_db
+        self.ComplexParticles_db = ComplexParticles_db
+        self.resolver = resolver
+        self._index = None
+        self._qn_matrix = None
+        summary['invalidated'] = self.cache.invalidate(stale) if self.cache is not None and stale else 0
+        return summary
+
+    def load_cache(self, path):
+        """Loads a cache saved by 'save_cache' and returns the number of entries loaded. Entries computed with different particle databases are ignored"""
+        return self.cache.load(path, self.resolver.signature())
+
+    def save_cache(self, path):
+        """Saves the cache to a file, tagged with the signature of the particle databases"""
+        self.cache.save(path, self.resolver.signature())
+
+    def run_batch(self, reactions, profiler=None):
+        """
+        Runs the pipeline on every reaction of an iterable (a list, an open file, stdin...) and yields one record per reaction, in the same order.
+        Blank lines and lines starting with '#' are skipped. The reactions are run in groups of BATCH_SIZE with 'run_many', so they are validated together.
+
+        Args:
+            reactions (iterable): reaction strings, one per item
+            profiler (SlowReactionProfiler, optional): profiles the reactions that are slower than its threshold (from profiling.py)
+        """
+        reactions = iter_reactions(reactions)
+        if profiler is not None:
+            for reaction_str in reactions:
+                yield profiler.run(self, reaction_str)
+            return
+        while True:
+            chunk = list(islice(reactions, BATCH_SIZE))
+            if not chunk:
+                break
+            yield from self.run_many(chunk)
+
+    def run_stream(self, stream, profiler=None):
+        """
+        Runs the pipeline on every reaction of a text stream (an open file, stdin...), one per line, and yields one record per reaction, in the same order, like 'run_batch'.
+        The stream is read and parsed in large blocks (see 'iter_parsed') instead of line by line.
+
+        Args:
+            stream (file): text stream with one reaction per line
+            profiler (SlowReactionProfiler, optional): profiles the reactions that are slower than its threshold (from profiling.py)
+        """
+        items = iter_parsed(stream)
+        if profiler is not None:
+            for reaction_str, _ in items:
+                yield profiler.run(self, reaction_str)
+            return
+        while True:
+            chunk = list(islice(items, BATCH_SIZE))
+            if not chunk:
+                break
+            # Lines that could not be parsed go through the parse step again, which records the error
+            yield from self.run_many([reaction_str for reaction_str, _ in chunk], [parsed for _, parsed in chunk])
+
+def iter_reactions(lines):
+    """Yields the reaction strings of an iterable of lines, stripped, skipping blank lines and lines starting with '#'"""
+    for line in lines:
+        reaction_str = line.strip()
+        if reaction_str and not reaction_str.startswith('#'):
+            yield reaction_str
+
+
+# Pipeline of each worker process, created once by the pool initializer, its profiler of slow reactions and the watcher that reloads its databases
+_worker_pipeline = None
+_worker_profiler = None
+_worker_watcher = None
+
+def _init_worker(elemental_path, complex_path, cache_entries=0, instrument=False, profile_ms=None, watch_interval=None):
+    global _worker_pipeline, _worker_profiler, _worker_watcher
+    if instrument:
+        instrumentation.enable()
+    if profile_ms is not None:
+        _worker_profiler = SlowReactionProfiler(profile_ms)
+    cache = ReactionCache(max_entries=cache_entries) if cache_entries else None
+    _worker_pipeline = ReactionPipeline(load_ElementalParticles(elemental_path), load_ComplexParticles(complex_path), cache)
+    if watch_interval is not None:
+        _worker_watcher = DatabaseWatcher(_worker_pipeline, elemental_path, complex_path, watch_interval)
+
+def _run_chunk(reactions):
+    if _worker_watcher is not None:
+        _worker_watcher.poll()
+    records = list(_worker_pipeline.run_batch(reactions, _worker_profiler))
+    # The statistics of the chunk go back with its records, to be merged in the parent process
+    return records, instrumentation.drain() if instrumentation.enabled else None
+
+def _collect(future):
+    records, state = future.result()
+    if state is not None:
+        instrumentation.merge(state)
+    return records
+
+def classify_many(reactions, workers=None, chunksize=256,
+                  elemental_path="data/ElementalParticles.json", complex_path="data/ComplexParticles.json", profile_ms=None):
+    """
+    Runs the pipeline on many reactions in parallel and yields one record per reaction, in the same order as the input.
+    Reactions are sent to a pool of worker processes in chunks; every worker loads the particle databases once, when it starts.
+    Records are yielded as soon as the chunk they belong to and all the chunks before it are done, and only a few chunks per worker are in flight at any time, so the input can be an arbitrarily long stream.
+    Blank lines and lines starting with '#' are skipped, as in 'ReactionPipeline.run_batch'.
+    If instrumentation is enabled, the workers record their statistics too, and they are merged into the ones of this process.
+
+    Args:
+        reactions (iterable): reaction strings, one per item
+        workers (int, optional): number of worker processes. Defaults to the number of CPUs. With 1 worker, everything runs in this process
+        chunksize (int, optional): number of reactions sent to a worker at a time
+        elemental_path (str, optional): database of elemental particles loaded by the workers
+        complex_path (str, optional): database of complex particles loaded by the workers
+        profile_ms (float, optional): profile the reactions slower than this many milliseconds (see 'SlowReactionProfiler')
+    """
+    workers = workers or os.cpu_count() or 1
+    reactions = iter_reactions(reactions)
+    if workers == 1:
+        pipeline = ReactionPipeline(load_ElementalParticles(elemental_path), load_ComplexParticles(complex_path))
+        profiler = SlowReactionProfiler(profile_ms) if profile_ms is not None else None
+        yield from pipeline.run_batch(reactions, profiler)
+        return
+
+    initargs = (os.path.abspath(elemental_path), os.path.abspath(complex_path), 0, instrumentation.enabled, profile_ms)
+    max_pending = 2 * workers
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+        pending = deque()
+        while True:
+            chunk = list(islice(reactions, chunksize))
+            if not chunk:
+                break
+            pending.append(executor.submit(_run_chunk, chunk))
+            if len(pending) >= max_pending:
+                yield from _collect(pending.popleft())
+        while pending:
+            yield from _collect(pending.popleft())
+
+
+def write_jsonl(records, out):
+    """
+    Writes every record as one JSON line to an open text stream and returns the number of records written.
+
+    Args:
+        records (iterable): JSON-serializable records (e.g. from 'ReactionPipeline.run_batch')
+        out (file): text stream to write to
+    """
+    count = 0
+    for record in records:
+        out.write(json.dumps(record, ensure_ascii=False))
+        out.write('\n')
+        count += 1
+    return count
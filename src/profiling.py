@@ -0,0 +1,160 @@
+# Captures the reactions that run slower than a threshold, with a flamegraph-ready profile and the inputs of every identification step
+
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+from src import identifier, instrumentation
+
+PROFILE_DIR = os.path.join('output', 'profiles')
+
+# Identification steps whose input ('interacting_particles') is saved with the profile
+CAPTURED_FUNCTIONS = {
+    getattr(identifier, name).__code__: name
+    for name in ('identify_flavor_change', 'identify_strong', 'identify_em', 'identify_weak')
+}
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _builtin_label(function):
+    module = getattr(function, '__module__', None) or 'builtins'
+    return f"{module}.{getattr(function, '__qualname__', repr(function))}"
+
+
+class StackRecorder:
+    """
+    Deterministic profiler based on 'sys.setprofile': records the time spent in every call stack, excluding the time of the calls it makes, and the input of every identification step.
+    Used as a context manager around the code to profile. The result is written in the collapsed-stack format read by flamegraph.pl, speedscope and similar tools, one 'caller;callee;... microseconds' line per stack.
+    """
+    def __init__(self):
+        self.stack = []
+        self.totals = Counter()
+        self.captured = []
+
+    def _profile(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == 'call' or event == 'c_call':
+            if event == 'call':
+                code = frame.f_code
+                label = _frame_label(code)
+                step = CAPTURED_FUNCTIONS.get(code)
+                if step is not None:
+                    interacting = frame.f_locals.get('interacting_particles')
+                    if interacting is not None:
+                        self.captured.append({'step': step, 'interacting': {
+                            'initial': list(interacting['initial']), 'final': list(interacting['final'])}})
+            else:
+                label = _builtin_label(arg)
+            path = self.stack[-1][0] + ';' + label if self.stack else label
+            self.stack.append([path, now, 0.0])
+        elif self.stack:
+            # 'return', 'c_return' and 'c_exception'. Returns from frames that were entered before the recorder started have no entry and are ignored
+            path, start, children = self.stack.pop()
+            elapsed = now - start
+            self.totals[path] += elapsed - children
+            if self.stack:
+                self.stack[-1][2] += elapsed
+
+    def __enter__(self):
+        sys.setprofile(self._profile)
+        return self
+
+    def __exit__(self, *exc):
+        sys.setprofile(None)
+        # Calls still open (the 'with' block itself) are closed at the time the recorder stopped
+        now = time.perf_counter()
+        while self.stack:
+            path, start, children = self.stack.pop()
+            elapsed = now - start
+            self.totals[path] += elapsed - children
+            if self.stack:
+                self.stack[-1][2] += elapsed
+        return False
+
+    def collapsed(self):
+        """Returns the profile in the collapsed-stack format, with the time of every stack in microseconds (stacks under 1 µs are left out)"""
+        lines = []
+        for path, seconds in sorted(self.totals.items()):
+            microseconds = round(seconds * 1e6)
+            if microseconds > 0:
+                lines.append(f"{path} {microseconds}")
+        return '\n'.join(lines) + '\n'
+
+
+class SlowReactionProfiler:
+    """
+    Runs reactions through a pipeline and, when one takes longer than 'threshold_ms', runs it again under a 'StackRecorder' and saves what it recorded in 'out_dir':
+    - '<name>.folded': collapsed stacks of the second run, ready for a flamegraph
+    - '<name>.json': the reaction string, both latencies, the pipeline record and the 'interacting' dictionary given to every identify_* function
+
+    The second run skips the result cache (so it does the same work as the first one) and is left out of the instrumentation statistics. Every reaction is captured at most once, and at most 'max_profiles' are saved.
+
+    Args:
+        threshold_ms (float): latency above which a reaction is profiled, in milliseconds
+        out_dir (str, optional): directory of the profiles
+        max_profiles (int, optional): maximum number of profiles saved
+    """
+    def __init__(self, threshold_ms, out_dir=PROFILE_DIR, max_profiles=100):
+        self.threshold_ms = threshold_ms
+        self.out_dir = out_dir
+        self.max_profiles = max_profiles
+        self.captured = set()
+        self.paths = []
+
+    def run(self, pipeline, reaction_str):
+        """
+        Runs one reaction through 'pipeline' (a ReactionPipeline) and returns its record, profiling it if it is slow.
+
+        Args:
+            pipeline (ReactionPipeline): pipeline to run the reaction with
+            reaction_str (str): reaction string
+        """
+        start = time.perf_counter()
+        record = pipeline.run(reaction_str)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms > self.threshold_ms and reaction_str not in self.captured and len(self.paths) < self.max_profiles:
+            self.captured.add(reaction_str)
+            self.paths.append(self.profile(pipeline, reaction_str, elapsed_ms))
+        return record
+
+    def profile(self, pipeline, reaction_str, elapsed_ms=None):
+        """
+        Runs a reaction again under the profiler, saves the profile and returns the path of its '.folded' file.
+
+        Args:
+            pipeline (ReactionPipeline): pipeline to run the reaction with
+            reaction_str (str): reaction string
+            elapsed_ms (float, optional): latency of the run that triggered the profile
+        """
+        cache, pipeline.cache = pipeline.cache, None
+        instrumented = instrumentation.enabled
+        instrumentation.enabled = False
+        try:
+            start = time.perf_counter()
+            with StackRecorder() as recorder:
+                record = pipeline.run(reaction_str)
+            profiled_ms = (time.perf_counter() - start) * 1000
+        finally:
+            pipeline.cache = cache
+            instrumentation.enabled = instrumented
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        name = time.strftime('%Y%m%d-%H%M%S') + '-' + hashlib.sha256(reaction_str.encode('utf-8')).hexdigest()[:12]
+        folded_path = os.path.join(self.out_dir, name + '.folded')
+        with open(folded_path, 'w', encoding='utf-8') as f:
+            f.write(recorder.collapsed())
+        with open(os.path.join(self.out_dir, name + '.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'reaction': reaction_str,
+                'elapsed_ms': elapsed_ms,
+                'profiled_ms': profiled_ms,
+                'threshold_ms': self.threshold_ms,
+                'record': record,
+                'interacting': recorder.captured,
+            }, f, indent=2, ensure_ascii=False)
+        return folded_path
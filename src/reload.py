@@ -0,0 +1,104 @@
+# Reloads the particle databases when their files change, keeping the results that are still valid
+
+import os
+import time
+
+from src.particles import load_ElementalParticles, load_ComplexParticles
+
+
+def particle_state(particle):
+    """Returns every attribute of a particle as a tuple, so that two versions of it can be compared"""
+    return tuple(getattr(particle, attribute, None) for attribute in particle.__slots__)
+
+
+def diff_particles(old_db, new_db):
+    """
+    Compares two versions of a particle database and returns the names of the particles that were 'added', 'removed' and 'changed' (any property differs), each in database order.
+
+    Args:
+        old_db (dict): database before the edit
+        new_db (dict): database after the edit
+    """
+    return {
+        'added': [name for name in new_db if name not in old_db],
+        'removed': [name for name in old_db if name not in new_db],
+        'changed': [name for name, p in new_db.items()
+                    if name in old_db and particle_state(old_db[name]) != particle_state(p)],
+    }
+
+
+def affected_ids(old_resolver, new_resolver, names):
+    """
+    Returns the IDs of the particles whose results are no longer valid after a reload: the particles in 'names' (removed or changed), the complex particles whose composition changed, and the complex particles made of any of them.
+
+    Args:
+        old_resolver (ParticleResolver): index before the reload
+        new_resolver (ParticleResolver): index after the reload, built with 'previous=old_resolver'
+        names (iterable): names of the removed and changed particles
+    """
+    affected = {old_resolver.index[name] for name in names if name in old_resolver.index}
+    for i in range(len(old_resolver)):
+        if old_resolver.contents[i] != new_resolver.contents[i]:
+            affected.add(i)
+    affected_names = {old_resolver.names[i] for i in affected}
+    for i in range(len(old_resolver)):
+        for compositions in (old_resolver.contents[i], new_resolver.contents[i]):
+            if any(name in affected_names for components in compositions for name in components):
+                affected.add(i)
+    return affected
+
+
+class DatabaseWatcher:
+    """
+    Polls the particle database files of a pipeline and reloads them into it when they change (see 'ReactionPipeline.reload').
+    Polling is done by the caller, between reactions, so a reload never happens in the middle of one: 'poll' only looks at the files once every 'interval' seconds, and only compares their modification time and size.
+    A file that cannot be read (e.g. it is being written) is left for the next poll and the pipeline keeps the old data.
+
+    Args:
+        pipeline (ReactionPipeline): pipeline to reload
+        elemental_path (str, optional): database of elemental particles
+        complex_path (str, optional): database of complex particles
+        interval (float, optional): minimum time between two checks of the files, in seconds
+    """
+    def __init__(self, pipeline, elemental_path="data/ElementalParticles.json", complex_path="data/ComplexParticles.json", interval=1.0):
+        self.pipeline = pipeline
+        self.paths = (elemental_path, complex_path)
+        self.interval = interval
+        self.stamps = self._stamps()
+        self.checked = time.monotonic()
+        self.reloads = 0
+        self.last_error = None
+
+    def _stamps(self):
+        stamps = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                stamps.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stamps.append(None)
+        return stamps
+
+    def poll(self):
+        """Reloads the databases if a file changed since the last reload, at most once every 'interval' seconds. Returns the summary of the reload, or None"""
+        now = time.monotonic()
+        if now - self.checked < self.interval:
+            return None
+        self.checked = now
+        return self.check()
+
+    def check(self):
+        """Reloads the databases if a file changed since the last reload, and returns the summary of the reload, or None"""
+        stamps = self._stamps()
+        if stamps == self.stamps:
+            return None
+        try:
+            ElementalParticles_db = load_ElementalParticles(self.paths[0])
+            ComplexParticles_db = load_ComplexParticles(self.paths[1])
+        except (OSError, ValueError) as e:
+            self.last_error = str(e)
+            return None
+        self.stamps = stamps
+        self.last_error = None
+        self.reloads += 1
+        return self.pipeline.reload(ElementalParticles_db, ComplexParticles_db)
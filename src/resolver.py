@@ -0,0 +1,146 @@
+# Resolves particle names, symbols and aliases to integer IDs
+
+import hashlib
+import json
+from types import MappingProxyType
+
+
+def latex_aliases(latex):
+    """
+    Returns the spellings of a 'LaTeX' field that are accepted as aliases: the field as stored in the database (with escaped backslashes) and the plain LaTeX form.
+
+    Args:
+        latex (str): 'LaTeX' field of a particle
+    """
+    if not latex:
+        return []
+    return [latex, latex.replace('\\\\', '\\')]
+
+
+class ParticleResolver:
+    """
+    Immutable index over both particle databases, built once when the databases are loaded.
+    Every particle gets an integer ID. An index built from scratch has dense IDs: elemental particles come first and complex particles follow, in database order.
+    Every name, symbol and alias (LaTeX forms, ASCII spelling of symbols with a unicode minus) resolves to that ID.
+
+    When a token could mean several particles, the same precedence as the original 'normalize_particles' is kept: names first, then elemental symbols, then complex symbols, then aliases.
+    Within a database, a repeated symbol resolves to the last particle that uses it.
+
+    When the databases are reloaded, the index of the previous ones can be given as 'previous': every particle keeps its ID, new particles (elemental or complex) are appended after the existing IDs, and the IDs of particles that were removed leave holes: they stay in 'particles' and 'names', are listed in 'removed' and no longer resolve. Results stored by ID remain valid for the particles that did not change, but elemental and complex IDs are no longer in two blocks (see 'is_complex').
+
+    Args:
+        ElementalParticles_db (dict): database of elemental particles
+        ComplexParticles_db (dict, optional): database of complex particles
+        previous (ParticleResolver, optional): index of the databases before a reload
+    """
+    def __init__(self, ElementalParticles_db, ComplexParticles_db=None, previous=None):
+        elemental = list(ElementalParticles_db.values())
+        complex_particles = [p for name, p in (ComplexParticles_db or {}).items() if name not in ElementalParticles_db]
+
+        if previous is None:
+            particles = elemental + complex_particles
+            flags = [False] * len(elemental) + [True] * len(complex_particles)
+            removed = ()
+        else:
+            current = {p.name: (p, False) for p in elemental}
+            current.update((p.name, (p, True)) for p in complex_particles)
+            particles = []
+            flags = []
+            removed = []
+            for i, (name, old) in enumerate(zip(previous.names, previous.particles)):
+                if name in current:
+                    particle, is_complex = current.pop(name)
+                else:
+                    # Removed, now or in an earlier reload: the old particle keeps the ID taken
+                    particle, is_complex = old, previous.is_complex(i)
+                    removed.append(i)
+                particles.append(particle)
+                flags.append(is_complex)
+            for particle, is_complex in current.values():
+                particles.append(particle)
+                flags.append(is_complex)
+        removed = frozenset(removed)
+
+        self.particles = tuple(particles)
+        self.names = tuple(p.name for p in particles)
+        self.removed = removed
+        self._complex = tuple(flags)
+        self.index = MappingProxyType({name: i for i, name in enumerate(self.names) if i not in removed})
+
+        # Symbols are collected in database order, so that the last particle of a database that uses a symbol wins whatever its ID
+        ids = self.index
+        elemental_symbols = {p.symbol: ids[p.name] for p in elemental if p.symbol}
+        complex_symbols = {p.symbol: ids[p.name] for p in complex_particles if p.symbol}
+        aliases = {}
+        for p in elemental + complex_particles:
+            for alias in latex_aliases(p.LaTeX):
+                aliases[alias] = ids[p.name]
+            if p.symbol and '−' in p.symbol:
+                aliases[p.symbol.replace('−', '-')] = ids[p.name]
+
+        # Lowest precedence first, so that higher precedence entries overwrite them
+        lookup = {}
+        lookup.update(aliases)
+        lookup.update(complex_symbols)
+        lookup.update(elemental_symbols)
+        lookup.update(self.index)
+        self._lookup = MappingProxyType(lookup)
+
+        # Compositions of the complex particles, with the component symbols already mapped to elemental names
+        contents = []
+        for i, p in enumerate(particles):
+            if not flags[i] or i in removed:
+                contents.append(())
+                continue
+            compositions = []
+            for components in p.content:
+                component_list = []
+                for comp in components.split():
+                    comp_id = elemental_symbols.get(comp)
+                    component_list.append(self.names[comp_id] if comp_id is not None else comp)
+                compositions.append(tuple(component_list))
+            contents.append(tuple(compositions))
+        self.contents = tuple(contents)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, token):
+        return token in self._lookup
+
+    def tokens(self):
+        """Returns every name, symbol and alias that resolves to a particle"""
+        return list(self._lookup)
+
+    def get(self, token, default=None):
+        """Returns the ID of a name, symbol or alias, or 'default' if it is unknown"""
+        return self._lookup.get(token, default)
+
+    def resolve(self, token):
+        """
+        Returns the ID of a name, symbol or alias.
+
+        Args:
+            token (str): particle name, symbol or alias (e.g. 'electron', 'e-', 'nu_e-')
+        """
+        try:
+            return self._lookup[token]
+        except KeyError:
+            raise ValueError(f"Unknown particle: {token}") from None
+
+    def is_complex(self, particle_id):
+        """Returns True if the ID belongs to a complex particle"""
+        return self._complex[particle_id]
+
+    def signature(self):
+        """
+        Returns a fingerprint of the indexed particles (names, symbols, quantum numbers, masses, families and compositions).
+        Results stored by particle ID (e.g. a saved cache) are only valid for an index with the same signature.
+        """
+        rows = [
+            [p.name, p.symbol, p.mass, p.charge, p.baryon_number,
+             getattr(p, 'le_number', 0), getattr(p, 'lmu_number', 0), getattr(p, 'tau_number', 0),
+             p.family, getattr(p, 'content', [])]
+            for p in self.particles
+        ]
+        return hashlib.sha256(json.dumps(rows, ensure_ascii=False).encode('utf-8')).hexdigest()
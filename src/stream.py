@@ -0,0 +1,163 @@
+# Composable generator stages to stream reactions through the pipeline
+
+import sys
+
+from src.parser import parse_input, decay_tree, normalize_particles, analyze_complex_particles
+from src.validator import validate_process, validate_decays
+from src.identifier import identify_interactions, sorted_reaction
+from src.pipeline import iter_reactions
+
+# Every stage takes an iterable of records and yields the same records, one at a time, with the result of its step added.
+# Nothing is read until the last stage asks for the next record, so a chain of stages holds a single record at a time whatever the size of the input, and a slow consumer slows the whole chain down instead of letting records pile up.
+# A step that fails stores its name in 'stage' and the message in 'error'; later stages pass that record through untouched, so one bad line never stops the run.
+
+
+def _fail(record, stage, error):
+    record['stage'] = stage
+    record['error'] = str(error)
+    return record
+
+
+def read_reactions(source):
+    """
+    Yields one record {'reaction': ...} per reaction of a file, a pipe or any iterable of lines. The file is read line by line.
+    Blank lines and lines starting with '#' are skipped.
+
+    Args:
+        source (str or iterable): path of a file, '-' for stdin, or an iterable of lines (e.g. an open file)
+    """
+    if isinstance(source, str):
+        if source == '-':
+            yield from read_reactions(sys.stdin)
+            return
+        with open(source, encoding='utf-8') as f:
+            yield from read_reactions(f)
+        return
+    for reaction_str in iter_reactions(source):
+        yield {'reaction': reaction_str}
+
+
+def parse_stage(records):
+    """Parses the 'reaction' string of every record, a single reaction or a decay chain (see 'parse_input'). The result is kept in 'parsed' for the next stage"""
+    for record in records:
+        if 'error' not in record:
+            try:
+                record['parsed'] = parse_input(record['reaction'])
+            except Exception as e:
+                _fail(record, 'parse', e)
+        yield record
+
+
+def normalize_stage(records, resolver):
+    """
+    Converts the parsed particles of every record to canonical names (see 'normalize_particles'), stored in 'initial' and 'final'.
+    The decays of a decay chain are normalized too, in 'decays', once every decay is checked to have a parent produced by an earlier step.
+
+    Args:
+        records (iterable): records from 'parse_stage'
+        resolver (ParticleResolver): index of the particle databases
+    """
+    for record in records:
+        if 'error' not in record:
+            try:
+                parsed = record.pop('parsed')
+                normalized = normalize_particles(parsed, resolver)
+                record['initial'] = normalized['initial']
+                record['final'] = normalized['final']
+                if parsed.get('decays'):
+                    decay_tree(parsed, resolver)
+                    record['decays'] = [normalize_particles(step, resolver) for step in parsed['decays']]
+            except Exception as e:
+                _fail(record, 'normalize', e)
+        yield record
+
+
+def decays_stage(records, ElementalParticles_db, ComplexParticles_db):
+    """
+    Checks the conservation laws for every decay of the decay chains (see 'validate_decays'), and stores the result of every decay in 'decays'. Other records go through untouched.
+
+    Args:
+        records (iterable): records from 'normalize_stage'
+        ElementalParticles_db (dict): database of elemental particles
+        ComplexParticles_db (dict): database of complex particles
+    """
+    for record in records:
+        if 'error' not in record and 'decays' in record:
+            try:
+                record['decays'] = validate_decays(record['decays'], ElementalParticles_db, ComplexParticles_db)
+            except Exception as e:
+                _fail(record, 'decays', e)
+        yield record
+
+
+def validate_stage(records, ElementalParticles_db, ComplexParticles_db):
+    """
+    Checks the conservation laws for every record (see 'validate_process'), and stores the result in 'valid' and 'errors'.
+
+    Args:
+        records (iterable): records from 'decays_stage'
+        ElementalParticles_db (dict): database of elemental particles
+        ComplexParticles_db (dict): database of complex particles
+    """
+    for record in records:
+        if 'error' not in record:
+            try:
+                errors = validate_process(record, ElementalParticles_db, ComplexParticles_db)
+                record['valid'] = not errors
+                record['errors'] = errors
+            except Exception as e:
+                _fail(record, 'validate', e)
+        yield record
+
+
+def analyze_stage(records, resolver):
+    """
+    Breaks the complex particles of every valid record into elemental particles (see 'analyze_complex_particles'), stored in 'elemental'.
+
+    Args:
+        records (iterable): records from 'validate_stage'
+        resolver (ParticleResolver): index of the particle databases
+    """
+    for record in records:
+        if 'error' not in record and record.get('valid'):
+            try:
+                record['elemental'] = analyze_complex_particles(record, resolver)
+            except Exception as e:
+                _fail(record, 'analyze', e)
+        yield record
+
+
+def identify_stage(records, ElementalParticles_db):
+    """
+    Identifies the interactions of every valid record (see 'identify_interactions'), stored in 'interactions' and 'remaining'. The particles are sorted first, like in the pipeline (see 'sorted_reaction').
+
+    Args:
+        records (iterable): records from 'analyze_stage'
+        ElementalParticles_db (dict): database of elemental particles
+    """
+    for record in records:
+        if 'error' not in record and 'elemental' in record:
+            try:
+                record['interactions'], record['remaining'] = identify_interactions(sorted_reaction(record['elemental']), ElementalParticles_db)
+            except Exception as e:
+                _fail(record, 'identify', e)
+        yield record
+
+
+def stream_reactions(source, pipeline):
+    """
+    Chains every stage, from reading the source to identifying the interactions, and yields the finished records.
+    The records are the same as the ones of 'ReactionPipeline.run', decay chains included.
+
+    Args:
+        source (str or iterable): path of a file, '-' for stdin, or an iterable of lines
+        pipeline (ReactionPipeline): pipeline holding the particle databases and their index
+    """
+    records = read_reactions(source)
+    records = parse_stage(records)
+    records = normalize_stage(records, pipeline.resolver)
+    records = decays_stage(records, pipeline.ElementalParticles_db, pipeline.ComplexParticles_db)
+    records = validate_stage(records, pipeline.ElementalParticles_db, pipeline.ComplexParticles_db)
+    records = analyze_stage(records, pipeline.resolver)
+    return identify_stage(records, pipeline.ElementalParticles_db)
+
@@ -1,5 +1,21 @@
 # Applies conservation laws and interaction rules
 
+from fractions import Fraction
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed by the batched validator
+    np = None
+
+from src.resolver import ParticleResolver
+
+# Conserved quantum numbers, in the order of the columns of the quantum-number matrix
+QUANTUM_NUMBERS = ("charge", "baryon_number", "le_number", "lmu_number", "tau_number")
+
+# Names used in the error messages, and the factor that turns the integer units of 'quantum_numbers' back into physical values
+_LABELS = ("charge", "baryon number", "le_number", "lmu_number", "tau_number")
+_UNITS = (Fraction(1, 3), Fraction(1, 3), 1, 1, 1)
+
 def validate_process(reaction, elemental_particles_db, complex_particles_db=None):
     """
     Validates the process by checking conservation laws. Such are, in order of preference:
@@ -9,60 +25,166 @@ def validate_process(reaction, elemental_particles_db, complex_particles_db=None
     3. Lepton number (L)
 
     The laws state that the initial property must be equal in both sides of the process. If the process is a decay, it will also check if the initial mass is greater or equal to the final mass.
+    The quantum numbers are summed in exact integer units (see 'quantum_numbers'), so the fractional charges of quarks do not give rounding errors.
 
     Args:
         reaction (dict): Dictionary with 'initial' and 'final' lists of particle names
         elemental_particles_db (dict): Database of elemental particles
         complex_particles_db (dict, optional): Database of complex particles
     """
-    errors = []
-
-    # Sums all the attributes of initial and final particles
-    def sum_attributes(particles, attribute):
-        """Sum the given attribute for all particles in the list"""
-        total = 0
-        for p in particles:
-            # Try to find particle in either database
-            if p in elemental_particles_db:
-                particle = elemental_particles_db[p]
-            elif complex_particles_db and p in complex_particles_db:
-                particle = complex_particles_db[p]
-            else:
-                raise KeyError(f"Particle '{p}' not found in either database")
-
-            if hasattr(particle, attribute):
-                total += getattr(particle, attribute)
-        return total
-    
-    # 1. ELECTRIC CHARGE CONSERVATION (Q)
-    charge_initial = sum_attributes(reaction["initial"], "charge")
-    charge_final = sum_attributes(reaction["final"], "charge")
-    if charge_initial != charge_final:
-        errors.append(f"Process FORBIDDEN due to charge conservation: {charge_initial} != {charge_final}")
-    
-    # 2. BARYON NUMBER CONSERVATION (B)
-    baryon_initial = sum_attributes(reaction["initial"], "baryon_number")
-    baryon_final = sum_attributes(reaction["final"], "baryon_number")
-    if baryon_initial != baryon_final:
-        errors.append(f"Process FORBIDDEN due to baryon number conservation: {baryon_initial} != {baryon_final}")
-    
-    # 3. LEPTON NUMBER CONSERVATION (L)
-    for lepton_type in ["le_number", "lmu_number", "tau_number"]:
-        lepton_initial = sum_attributes(reaction["initial"], lepton_type)
-        lepton_final = sum_attributes(reaction["final"], lepton_type)
-        if lepton_initial != lepton_final:
-            errors.append(f"Process FORBIDDEN due to {lepton_type} conservation: {lepton_initial} != {lepton_final}")
-    
-    
+    def find(p):
+        """Returns a particle from either database"""
+        if p in elemental_particles_db:
+            return elemental_particles_db[p]
+        if complex_particles_db and p in complex_particles_db:
+            return complex_particles_db[p]
+        raise KeyError(f"Particle '{p}' not found in either database")
+
+    initial = [find(p) for p in reaction["initial"]]
+    final = [find(p) for p in reaction["final"]]
+
+    # 1-3. CHARGE, BARYON NUMBER AND LEPTON NUMBERS, in the order of QUANTUM_NUMBERS
+    initial_sums = [0] * len(QUANTUM_NUMBERS)
+    for particle in initial:
+        initial_sums = [a + b for a, b in zip(initial_sums, quantum_numbers(particle))]
+    final_sums = [0] * len(QUANTUM_NUMBERS)
+    for particle in final:
+        final_sums = [a + b for a, b in zip(final_sums, quantum_numbers(particle))]
+    errors = [
+        _conservation_error(column, value_initial, value_final)
+        for column, (value_initial, value_final) in enumerate(zip(initial_sums, final_sums))
+        if value_initial != value_final
+    ]
+
     # 4. MASS CONSERVATION
     # Only check mass conservation if there is a single initial particle 
-    if len(reaction["initial"]) == 1:
-        mass_initial = sum_attributes(reaction["initial"], "mass")
-        mass_final = sum_attributes(reaction["final"], "mass")  
+    if len(initial) == 1:
+        mass_initial = initial[0].mass
+        mass_final = 0
+        for particle in final:
+            mass_final += particle.mass
         if mass_initial < mass_final:
             errors.append(f"Process FORBIDDEN due to mass conservation: {mass_initial} < {mass_final}")
     
     return errors
-    
-    
 
+
+def validate_decays(decays, elemental_particles_db, complex_particles_db=None):
+    """
+    Validates every decay of a decay chain on its own with 'validate_process', and returns one dictionary per decay with its 'initial', 'final', 'valid' and 'errors'.
+
+    Args:
+        decays (list): normalized decays of the chain, each with 'initial' and 'final' lists of particle names
+        elemental_particles_db (dict): Database of elemental particles
+        complex_particles_db (dict, optional): Database of complex particles
+    """
+    results = []
+    for decay in decays:
+        errors = validate_process(decay, elemental_particles_db, complex_particles_db)
+        results.append({'initial': decay['initial'], 'final': decay['final'], 'valid': not errors, 'errors': errors})
+    return results
+
+
+def _conservation_error(column, value_initial, value_final):
+    # Error message for a quantum number given in the integer units of 'quantum_numbers'
+    return (f"Process FORBIDDEN due to {_LABELS[column]} conservation: "
+            f"{value_initial * _UNITS[column]} != {value_final * _UNITS[column]}")
+
+
+def quantum_numbers(particle):
+    """
+    Returns the conserved quantum numbers of a particle as exact integers, in the order of QUANTUM_NUMBERS.
+    Charge is given in thirds of e and baryon number is multiplied by 3, so quark values like 0.666... become whole numbers and sums can be compared exactly.
+
+    Args:
+        particle (ElementalParticle or ComplexParticle): particle object (from particles.py)
+    """
+    return (
+        round(3 * getattr(particle, "charge", 0)),
+        round(3 * getattr(particle, "baryon_number", 0)),
+        int(getattr(particle, "le_number", 0)),
+        int(getattr(particle, "lmu_number", 0)),
+        int(getattr(particle, "tau_number", 0)),
+    )
+
+
+class QuantumNumberMatrix:
+    """
+    Precomputed table of the conserved quantum numbers of every particle in the databases, to validate many reactions at once.
+    Row i holds the quantum numbers of the particle with ID i of a 'ParticleResolver' (see 'quantum_numbers'), and 'mass[i]' its mass.
+    With a reloaded resolver, new particles are the last rows and the rows of removed particles are holes: they keep the old values but their names are not in 'index', so they are never looked up.
+    Requires numpy.
+
+    Args:
+        elemental_particles_db (dict): Database of elemental particles
+        complex_particles_db (dict, optional): Database of complex particles
+        resolver (ParticleResolver, optional): index of both databases, if one was already built
+    """
+    def __init__(self, elemental_particles_db, complex_particles_db=None, resolver=None):
+        if np is None:
+            raise ImportError("numpy is required to build the quantum-number matrix")
+        if resolver is None:
+            resolver = ParticleResolver(elemental_particles_db, complex_particles_db)
+
+        particles = resolver.particles
+        self.names = resolver.names
+        self.index = resolver.index
+        self.matrix = np.array([quantum_numbers(p) for p in particles], dtype=np.int64).reshape(len(particles), len(QUANTUM_NUMBERS))
+        self.mass = np.array([p.mass for p in particles], dtype=np.float64)
+
+    def encode(self, reactions):
+        """
+        Encodes reactions as one flat array of particle IDs: the initial state of reaction n, then its final state, then reaction n + 1...
+        Returns the IDs and the offsets of the states, so that state k (2n for the initial state of reaction n, 2n + 1 for its final state) is ids[offsets[k]:offsets[k + 1]].
+        The memory used grows with the number of particles in the reactions, not with the size of the databases.
+
+        Args:
+            reactions (list): dictionaries with 'initial' and 'final' lists of particle names
+        """
+        index = self.index
+        ids = []
+        offsets = [0]
+        for reaction in reactions:
+            for side in ("initial", "final"):
+                for p in reaction[side]:
+                    i = index.get(p)
+                    if i is None:
+                        raise KeyError(f"Particle '{p}' not found in either database")
+                    ids.append(i)
+                offsets.append(len(ids))
+        return np.array(ids, dtype=np.int64), np.array(offsets, dtype=np.int64)
+
+
+def validate_batch(reactions, qn_matrix):
+    """
+    Validates many reactions at once with the same conservation laws as 'validate_process', and returns one list of errors per reaction (empty if the reaction is allowed).
+    The quantum numbers of every particle of every reaction are gathered from the table in one step, and the sums of every state are differences of their running sums.
+    Charge and baryon number are summed in exact integer units, so the comparison does not depend on float rounding.
+
+    Args:
+        reactions (list): dictionaries with 'initial' and 'final' lists of particle names
+        qn_matrix (QuantumNumberMatrix): precomputed quantum numbers of the particle databases
+    """
+    if not reactions:
+        return []
+
+    ids, offsets = qn_matrix.encode(reactions)
+    running = np.zeros((len(ids) + 1, len(QUANTUM_NUMBERS)), dtype=np.int64)
+    np.cumsum(qn_matrix.matrix[ids], axis=0, out=running[1:])
+    # Rows [0, 2N) are the states, alternating initial and final
+    sums = running[offsets[1:]] - running[offsets[:-1]]
+    initial_sums, final_sums = sums[0::2], sums[1::2]
+    violated = initial_sums != final_sums
+
+    # Masses are added in the order of the particles, like in 'validate_process', so both give the same values
+    sizes = np.diff(offsets)
+    mass_sums = np.bincount(np.repeat(np.arange(len(sizes)), sizes), weights=qn_matrix.mass[ids], minlength=len(sizes))
+    mass_initial, mass_final = mass_sums[0::2], mass_sums[1::2]
+    mass_violated = (sizes[0::2] == 1) & (mass_initial < mass_final)
+
+    all_errors = [[] for _ in reactions]
+    for n, column in zip(*np.nonzero(violated)):
+        all_errors[n].append(_conservation_error(column, int(initial_sums[n, column]), int(final_sums[n, column])))
+    for n in np.nonzero(mass_violated)[0]:
+        all_errors[n].append(f"Process FORBIDDEN due to mass conservation: {float(mass_initial[n])} < {float(mass_final[n])}")
+    return all_errors
@@ -0,0 +1,105 @@
+import copy
+import json
+import os
+import tempfile
+import time
+import unittest
+from src.cache import ReactionCache, canonical_key
+from src.particles import load_ElementalParticles, load_ComplexParticles
+from src.pipeline import ReactionPipeline
+
+# Checks if:
+# - the canonical key does not depend on the order of the particles
+# - entries are evicted in LRU order, by count and by size, and expire after their TTL
+# - the cache can be saved and loaded again
+# - the pipeline serves reorderings of a reaction from the cache, with the same record as an uncached run
+# - changing a record does not change the cache
+
+class TestReactionCache(unittest.TestCase):
+    def test_canonical_key(self):
+        self.assertEqual(
+            canonical_key({'initial': [3, 1], 'final': [5, 2, 5]}),
+            canonical_key({'initial': [1, 3], 'final': [5, 5, 2]})
+        )
+
+    def test_lru_eviction(self):
+        cache = ReactionCache(max_entries=2)
+        cache.put((1,), {'a': 1})
+        cache.put((2,), {'a': 2})
+        cache.get((1,))
+        cache.put((3,), {'a': 3})
+        self.assertIn((1,), cache)
+        self.assertNotIn((2,), cache)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_memory_budget(self):
+        cache = ReactionCache(max_bytes=40)
+        cache.put((1,), {'value': 'x' * 10})
+        cache.put((2,), {'value': 'y' * 10})
+        self.assertEqual(len(cache), 1)
+        self.assertLessEqual(cache.size, 40)
+        cache.put((3,), {'value': 'z' * 100})
+        self.assertNotIn((3,), cache)
+
+    def test_ttl(self):
+        cache = ReactionCache(ttl=0.01)
+        cache.put((1,), {'a': 1})
+        time.sleep(0.02)
+        self.assertIsNone(cache.get((1,)))
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+    def test_save_and_load(self):
+        cache = ReactionCache()
+        cache.put(((1, 2), (3,)), {'valid': True})
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache.json')
+            cache.save(path, signature='abc')
+            loaded = ReactionCache()
+            self.assertEqual(loaded.load(path, signature='other'), 0)
+            self.assertEqual(loaded.load(path, signature='abc'), 1)
+            self.assertEqual(loaded.get(((1, 2), (3,))), {'valid': True})
+
+class TestPipelineCache(unittest.TestCase):
+    def test_reordering_hits_cache(self):
+        pipeline = ReactionPipeline(
+            load_ElementalParticles("data/ElementalParticles.json"),
+            load_ComplexParticles("data/ComplexParticles.json"),
+            cache=ReactionCache()
+        )
+        first = pipeline.run("e+ e- -> mu+ mu-")
+        second = pipeline.run("e- e+ -> mu- mu+")
+        self.assertEqual(pipeline.cache.stats()['hits'], 1)
+        self.assertEqual(second['reaction'], "e- e+ -> mu- mu+")
+        self.assertEqual(second['initial'], ['electron', 'positron'])
+        self.assertEqual(second['interactions'], first['interactions'])
+
+    def test_hit_same_as_uncached(self):
+        elemental_db = load_ElementalParticles("data/ElementalParticles.json")
+        complex_db = load_ComplexParticles("data/ComplexParticles.json")
+        cached = ReactionPipeline(elemental_db, complex_db, cache=ReactionCache())
+        uncached = ReactionPipeline(elemental_db, complex_db)
+        cached.run("e+ e- -> mu+ mu-")
+        cached.run("K+ n -> pi0 sigma+")
+        for reaction in ("e- e+ -> mu- mu+", "n K+ -> sigma+ pi0"):
+            record = cached.run(reaction)
+            self.assertEqual(record, uncached.run(reaction))
+            self.assertEqual(json.dumps(record), json.dumps(uncached.run(reaction)))
+        self.assertEqual(cached.cache.stats()['hits'], 2)
+
+    def test_records_do_not_share_cache(self):
+        pipeline = ReactionPipeline(
+            load_ElementalParticles("data/ElementalParticles.json"),
+            load_ComplexParticles("data/ComplexParticles.json"),
+            cache=ReactionCache()
+        )
+        record = pipeline.run("e+ e- -> mu+ mu-")
+        expected = copy.deepcopy(record)
+        for _ in range(2):
+            # The first record was stored in the cache, the next ones come from it
+            record['interactions']['em']['initial_pairs'].clear()
+            record['errors'].append('changed')
+            record = pipeline.run("e+ e- -> mu+ mu-")
+            self.assertEqual(record, expected)
+
+if __name__ == "__main__":
+    unittest.main()
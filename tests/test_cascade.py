@@ -0,0 +1,94 @@
+import random
+import unittest
+from src.cascade import AliasTable, CascadeSimulator
+from src.particles import load_ElementalParticles, load_ComplexParticles, ComplexParticle
+
+# Checks if:
+# - the alias table gives every outcome its probability, and samples every outcome it can
+# - decay channels are read from the databases, checked once, and the forbidden ones are left out with a warning
+# - every channel of the databases passes the conservation checks
+# - cascades follow unstable products down to stable particles, unless they are marked as stable
+# - the expanded decay tree of a particle gives the probability of each of its final states
+
+class TestAliasTable(unittest.TestCase):
+    def test_probabilities(self):
+        weights = [0.5, 0.2, 0.2, 0.1, 0.0]
+        table = AliasTable(weights)
+        # Every column holds 1/n: its own share 'prob' and the rest for its alias
+        mass = [0.0] * len(weights)
+        for i in range(table.n):
+            mass[i] += table.prob[i] / table.n
+            mass[table.alias[i]] += (1 - table.prob[i]) / table.n
+        for expected, found in zip(weights, mass):
+            self.assertAlmostEqual(expected, found)
+
+        rng = random.Random(0)
+        samples = [table.sample(rng) for _ in range(20000)]
+        self.assertNotIn(4, samples)
+        self.assertAlmostEqual(samples.count(0) / len(samples), 0.5, delta=0.02)
+
+    def test_empty(self):
+        with self.assertRaises(ValueError):
+            AliasTable([0.0, 0.0])
+
+class TestCascadeSimulator(unittest.TestCase):
+    def setUp(self):
+        self.ElementalParticles_db = load_ElementalParticles("data/ElementalParticles.json")
+        self.ComplexParticles_db = load_ComplexParticles("data/ComplexParticles.json")
+        self.simulator = CascadeSimulator(self.ElementalParticles_db, self.ComplexParticles_db)
+
+    def test_data(self):
+        self.assertEqual(self.ComplexParticles_db['lambda0'].decays, ((('proton', 'pion-'), 0.639), (('neutron', 'pion0'), 0.358)))
+        self.assertEqual(self.ComplexParticles_db['proton'].decays, ())
+        self.assertEqual(self.ElementalParticles_db['muon'].decays, ((('electron', 'electron antineutrino', 'muon neutrino'), 1.0),))
+
+    def test_channels(self):
+        channels = self.simulator.channels('lambda0')
+        self.assertEqual([products for products, _ in channels], [('proton', 'pion-'), ('neutron', 'pion0')])
+        self.assertAlmostEqual(sum(p for _, p in channels), 1.0)
+        self.assertEqual(self.simulator.channels('proton'), [])
+
+    def test_forbidden_channels(self):
+        self.ComplexParticles_db['lambda0'] = ComplexParticle('lambda0', {
+            'mass': 1116.0, 'baryon_number': 1,
+            'decays': [{'products': ['proton', 'pion-'], 'branching': 0.6}, {'products': ['proton', 'pion0'], 'branching': 0.4}]})
+        with self.assertWarnsRegex(RuntimeWarning, "'lambda0' left out: proton pion0"):
+            self.assertEqual(self.simulator.channels('lambda0'), [(('proton', 'pion-'), 1.0)])
+        self.assertEqual([products for products, _ in self.simulator.rejected['lambda0']], [('proton', 'pion0')])
+        self.assertIn(('lambda0', ('proton', 'pion0')), self.simulator.validated)
+
+    def test_data_channels_allowed(self):
+        for db in (self.ElementalParticles_db, self.ComplexParticles_db):
+            for name, particle in db.items():
+                for products, _ in particle.decays:
+                    self.assertEqual(self.simulator.validate(name, products), [], (name, products))
+
+    def test_sample_tree(self):
+        tree = self.simulator.sample_tree('sigma0', random.Random(1))
+        self.assertEqual(tree[0], 'sigma0')
+        self.assertEqual([child[0] for child in tree[1]], ['lambda0', 'gamma'])
+
+        def leaves(node):
+            return [node[0]] if not node[1] else [leaf for child in node[1] for leaf in leaves(child)]
+        rng = random.Random(2)
+        for _ in range(50):
+            for leaf in leaves(self.simulator.sample_tree('omega-', rng)):
+                self.assertTrue(self.simulator.is_stable(leaf))
+
+    def test_final_states(self):
+        simulator = CascadeSimulator(self.ElementalParticles_db, self.ComplexParticles_db, stable=['pion-', 'neutron'])
+        states = simulator.final_states('lambda0')
+        self.assertAlmostEqual(sum(states.values()), 1.0)
+        self.assertAlmostEqual(states[('pion-', 'proton')], 0.639 / 0.997)
+        # The neutral pion decays further, to gamma gamma or to gamma e+ e-
+        pion0 = dict(simulator.channels('pion0'))
+        self.assertAlmostEqual(states[('gamma', 'gamma', 'neutron')], 0.358 / 0.997 * pion0[('gamma', 'gamma')])
+        self.assertAlmostEqual(states[('electron', 'gamma', 'neutron', 'positron')], 0.358 / 0.997 * pion0[('gamma', 'positron', 'electron')])
+
+        counts = simulator.simulate('lambda0', 100000, seed=3)
+        self.assertEqual(sum(counts.values()), 100000)
+        self.assertAlmostEqual(counts[('pion-', 'proton')] / 100000, 0.641, delta=0.01)
+        self.assertIn(simulator.sample_final_state('lambda0', random.Random(4)), states)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from src.particles import load_ElementalParticles
+from src.diagram_generator import generate_diagrams, TikzWriter
+from src.compiler import LatexCompiler, cache_key, split_document, preamble_key, batch_document
+
+
+def has_tikz_feynman():
+    if shutil.which('pdflatex') is None or shutil.which('kpsewhich') is None:
+        return False
+    return bool(subprocess.run(['kpsewhich', 'tikz-feynman.sty'], capture_output=True, text=True).stdout.strip())
+
+# Checks if:
+# - the cache key changes with the source, the engine version and the format
+# - documents with the same preamble are joined into one document, one page each, whatever the comments of their preambles
+
+class TestBatching(unittest.TestCase):
+    def setUp(self):
+        self.first = "\\documentclass{standalone}\n\\begin{document}\nA\n\\end{document}\n"
+        self.second = "\\documentclass{standalone}\n\\begin{document}\nB\n\\end{document}\n"
+
+    def test_cache_key(self):
+        key = cache_key(self.first, 'pdfTeX 3.14')
+        self.assertEqual(key, cache_key(self.first, 'pdfTeX 3.14'))
+        self.assertNotEqual(key, cache_key(self.second, 'pdfTeX 3.14'))
+        self.assertNotEqual(key, cache_key(self.first, 'pdfTeX 3.15'))
+        self.assertNotEqual(key, cache_key(self.first, 'pdfTeX 3.14', 'png'))
+
+    def test_split_document(self):
+        self.assertEqual(split_document(self.first), ("\\documentclass{standalone}\n", "\nA\n"))
+
+    def test_batch_document(self):
+        self.assertEqual(batch_document([self.first, self.second]),
+                         "\\documentclass{standalone}\n\\begin{document}\nA\nB\n\\end{document}\n")
+        with self.assertRaises(ValueError):
+            batch_document([self.first, self.second.replace('standalone', 'article')])
+
+    def test_comments_in_preamble(self):
+        commented = "% Feynman diagram of B\n" + self.second
+        self.assertEqual(preamble_key(split_document(commented)[0]), split_document(self.first)[0])
+        self.assertEqual(batch_document([self.first, commented]), batch_document([self.first, self.second]))
+
+# Checks if (only where pdflatex and TikZ-Feynman are installed):
+# - a diagram compiles to a PDF and is not compiled again
+# - the files of a batch are found in the cache as pages of the batch PDF, also in a different batch
+# - a broken file is reported with its log
+
+@unittest.skipIf(not has_tikz_feynman(), "pdflatex with TikZ-Feynman is not installed")
+class TestLatexCompiler(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        db = load_ElementalParticles("data/ElementalParticles.json")
+        diagrams = generate_diagrams({'initial': ['positron', 'electron'], 'final': ['antimuon', 'muon']}, db)
+        self.paths = TikzWriter(db, os.path.join(self.tmp, 'tex')).write_all(diagrams)
+        self.compiler = LatexCompiler(workers=2, cache_dir=os.path.join(self.tmp, 'out'), log_dir=os.path.join(self.tmp, 'logs'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_compile_and_cache(self):
+        records = self.compiler.compile_many(self.paths)
+        for record in records:
+            self.assertNotIn('error', record)
+            with open(record['output'], 'rb') as f:
+                self.assertEqual(f.read(4), b'%PDF')
+        self.assertTrue(all(record['cached'] for record in self.compiler.compile_many(self.paths)))
+
+    def test_batch(self):
+        records = self.compiler.compile_many(self.paths, batch=True)
+        self.assertEqual(len({record['output'] for record in records}), 1)
+        self.assertEqual([record['page'] for record in records], list(range(1, len(self.paths) + 1)))
+
+        # Every file is cached on its own, so a batch in another order compiles nothing
+        reordered = self.compiler.compile_many(self.paths[::-1], batch=True)
+        self.assertTrue(all(record['cached'] for record in reordered))
+        self.assertEqual([(record['output'], record['page']) for record in reordered[::-1]],
+                         [(record['output'], record['page']) for record in records])
+        self.assertTrue(self.compiler.compile(self.paths[0])['cached'])
+
+    def test_error(self):
+        path = os.path.join(self.tmp, 'broken.tex')
+        with open(path, 'w') as f:
+            f.write("\\documentclass{standalone}\n\\begin{document}\n\\undefinedmacro\n\\end{document}\n")
+        record = self.compiler.compile(path)
+        self.assertIsNone(record['output'])
+        self.assertIn('error', record)
+        self.assertTrue(os.path.exists(record['log']))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import unittest
+from src.particles import load_ElementalParticles
+from src.identifier import identify_interactions
+from src.diagram_generator import MAX_CACHED_LEGS, _cached_trees, topologies, generate_diagrams, propagators, antiparticles, latex_label, TikzWriter, _canonical_form
+
+# Checks if:
+# - the number of tree-level and one-loop topologies is the known one, and isomorphic graphs are merged
+# - only the topologies of up to MAX_CACHED_LEGS legs are cached, and larger diagrams can be refused before they are built
+# - the internal lines follow the vertices of the Standard Model and the identified interactions
+# - diagrams that only differ by the exchange of identical particles are generated once
+# - spectators are brought into the diagram when the other particles cannot form one
+
+class TestTopologies(unittest.TestCase):
+    def test_tree_count(self):
+        # (2n - 5)!! trees with n labelled legs
+        self.assertEqual([len(topologies(n)) for n in (3, 4, 5, 6)], [1, 3, 15, 105])
+
+    def test_one_loop_count(self):
+        # Triangle and three self-energies of the legs
+        self.assertEqual(len(topologies(3, 1)), 4)
+        self.assertEqual(len(topologies(4, 1)), 24)
+
+    def test_cache_bound(self):
+        self.assertEqual(len(topologies(MAX_CACHED_LEGS + 1)), 135135)
+        self.assertLessEqual(_cached_trees.cache_info().currsize, MAX_CACHED_LEGS - 2)
+
+    def test_canonical_form(self):
+        edges = [(0, 3), (1, 3), (2, 4), (3, 5), (4, 5), (4, 5)]
+        renumbered = [(0, 5), (1, 5), (2, 3), (5, 4), (3, 4), (4, 3)]
+        blank = [''] * len(edges)
+        self.assertEqual(_canonical_form(3, edges, blank, {'': ''}), _canonical_form(3, renumbered, blank, {'': ''}))
+
+    def test_unsupported_loops(self):
+        with self.assertRaises(ValueError):
+            topologies(4, 2)
+
+
+class TestGenerateDiagrams(unittest.TestCase):
+    def setUp(self):
+        self.db = load_ElementalParticles("data/ElementalParticles.json")
+
+    def internal(self, diagrams):
+        return sorted(sorted(p for u, v, p in propagators(d)) for d in diagrams)
+
+    def test_antiparticles(self):
+        conjugates = antiparticles(self.db)
+        self.assertEqual(conjugates['electron'], 'positron')
+        self.assertEqual(conjugates['muon antineutrino'], 'muon neutrino')
+        self.assertEqual(conjugates['antistrange'], 'strange')
+        self.assertEqual(conjugates['W+'], 'W-')
+        self.assertEqual(conjugates['gamma'], 'gamma')
+
+    def test_annihilation(self):
+        reaction = {'initial': ['positron', 'electron'], 'final': ['antimuon', 'muon']}
+        self.assertEqual(self.internal(generate_diagrams(reaction, self.db)), [['Z'], ['gamma']])
+        interactions, remaining = identify_interactions(reaction, self.db)
+        self.assertEqual(self.internal(generate_diagrams(reaction, self.db, interactions)), [['gamma']])
+        self.assertEqual(len(list(generate_diagrams(reaction, self.db, loops=1, max_legs=6))), len(list(generate_diagrams(reaction, self.db, loops=1))))
+        with self.assertRaises(ValueError):
+            list(generate_diagrams(reaction, self.db, loops=1, max_legs=5))
+
+    def test_beta_decay(self):
+        reaction = {'initial': ['up', 'down', 'down'], 'final': ['up', 'up', 'down', 'electron', 'electron antineutrino']}
+        diagrams = list(generate_diagrams(reaction, self.db))
+        self.assertEqual(len(diagrams), 1)
+        self.assertEqual(diagrams[0]['initial'], ['down'])
+        self.assertEqual(diagrams[0]['spectators'], ['up', 'down'])
+        self.assertEqual(self.internal(diagrams), [['W-']])
+
+    def test_identical_particles(self):
+        # The two photons can be exchanged, so the crossed diagram is the same one
+        reaction = {'initial': ['up', 'antiup'], 'final': ['gamma', 'gamma']}
+        self.assertEqual(self.internal(generate_diagrams(reaction, self.db)), [['up']])
+
+    def test_borrowed_spectators(self):
+        reaction = {'initial': ['electron', 'gamma'], 'final': ['electron', 'gamma']}
+        diagrams = list(generate_diagrams(reaction, self.db))
+        self.assertEqual(len(diagrams), 2)
+        self.assertTrue(all(d['initial'] == ['electron', 'gamma'] and d['spectators'] == [] for d in diagrams))
+
+    def test_one_loop(self):
+        reaction = {'initial': ['positron', 'electron'], 'final': ['antimuon', 'muon']}
+        diagrams = list(generate_diagrams(reaction, self.db, loops=1))
+        self.assertEqual(sum(d['loops'] == 0 for d in diagrams), 2)
+        self.assertTrue(any(d['loops'] == 1 for d in diagrams))
+        for d in diagrams:
+            self.assertEqual(d['vertices'], 2 + 2 * d['loops'])
+
+
+# Checks if:
+# - the TikZ-Feynman source uses the LaTeX labels of the database and the line style of every particle
+# - files are named after their contents and an unchanged diagram is not written again
+
+class TestTikzWriter(unittest.TestCase):
+    def setUp(self):
+        self.db = load_ElementalParticles("data/ElementalParticles.json")
+        self.out_dir = tempfile.mkdtemp()
+        reaction = {'initial': ['up', 'down', 'down'], 'final': ['up', 'up', 'down', 'electron', 'electron antineutrino']}
+        self.diagrams = list(generate_diagrams(reaction, self.db))
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_labels(self):
+        self.assertEqual(latex_label(self.db['muon']), '\\mu^-')
+        self.assertEqual(latex_label(self.db['antistrange']), '\\bar{s}')
+        self.assertEqual(latex_label(self.db['W+']), 'W^+')
+
+    def test_render(self):
+        tex = TikzWriter(self.db, self.out_dir).render(self.diagrams[0], 'neutron -> proton e- nu_e+')
+        self.assertIn('% Feynman diagram of neutron -> proton e- nu_e+', tex)
+        self.assertIn('\\vertex (l2) at', tex)
+        self.assertIn('{\\(\\antineutrino_e\\)}', tex)
+        self.assertIn('[boson, edge label=\\(W^-\\)]', tex)
+        self.assertIn('[anti fermion]', tex)
+
+    def test_unchanged_diagrams_not_rewritten(self):
+        writer = TikzWriter(self.db, self.out_dir)
+        paths = writer.write_all(self.diagrams)
+        self.assertEqual(writer.written, len(self.diagrams))
+        mtimes = [os.stat(path).st_mtime_ns for path in paths]
+
+        writer = TikzWriter(self.db, self.out_dir)
+        self.assertEqual(writer.write_all(self.diagrams), paths)
+        self.assertEqual((writer.written, writer.unchanged), (0, len(self.diagrams)))
+        self.assertEqual([os.stat(path).st_mtime_ns for path in paths], mtimes)
+        with open(paths[0], encoding='utf-8') as f:
+            self.assertEqual(f.read(), writer.render(self.diagrams[0]))
+
+if __name__ == "__main__":
+    unittest.main()
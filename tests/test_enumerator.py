@@ -0,0 +1,49 @@
+import unittest
+from itertools import combinations_with_replacement
+from src.particles import load_ElementalParticles, load_ComplexParticles
+from src.validator import validate_process
+from src.enumerator import enumerate_reactions
+
+# Checks if:
+# - the enumerator yields exactly the reactions that pass validate_process, also with fractional quark charges
+# - decays above the mass threshold are left out
+
+class TestEnumerateReactions(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.elemental_db = load_ElementalParticles("data/ElementalParticles.json")
+        cls.complex_db = load_ComplexParticles("data/ComplexParticles.json")
+
+    def assert_same_as_brute_force(self, pool):
+        found = {
+            (tuple(sorted(r['initial'])), tuple(sorted(r['final'])))
+            for r in enumerate_reactions(self.elemental_db, self.complex_db, 2, 3, particles=pool)
+        }
+        expected = set()
+        for n_initial in (1, 2):
+            for initial in combinations_with_replacement(pool, n_initial):
+                for n_final in (1, 2, 3):
+                    for final in combinations_with_replacement(pool, n_final):
+                        if sorted(initial) == sorted(final):
+                            continue
+                        if not validate_process({'initial': list(initial), 'final': list(final)}, self.elemental_db, self.complex_db):
+                            expected.add((tuple(sorted(initial)), tuple(sorted(final))))
+        self.assertEqual(found, expected)
+
+    def test_same_as_brute_force(self):
+        self.assert_same_as_brute_force(['electron', 'positron', 'muon', 'electron neutrino', 'muon neutrino', 'gamma',
+                                         'proton', 'neutron', 'pion+', 'pion-', 'pion0', 'lambda0'])
+
+    def test_fractional_charges(self):
+        # Quark charges and baryon numbers are thirds, which float sums get wrong
+        self.assert_same_as_brute_force(['up', 'down', 'strange', 'antiup', 'antidown', 'charm', 'gamma', 'electron',
+                                         'positron', 'proton', 'neutron', 'pion+', 'omega-', 'xi-'])
+
+    def test_mass_threshold(self):
+        decays = [r for r in enumerate_reactions(self.elemental_db, self.complex_db, 1, 2, particles=['sigma0', 'lambda0', 'pion0', 'gamma'])
+                  if r['initial'] == ['sigma0']]
+        self.assertIn({'initial': ['sigma0'], 'final': ['gamma', 'lambda0']}, decays)
+        self.assertNotIn({'initial': ['sigma0'], 'final': ['pion0', 'lambda0']}, decays)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,6 +6,7 @@ from src.identifier import identify_flavor_change
 from src.identifier import identify_strong
 from src.identifier import identify_em
 from src.identifier import identify_weak
+from src.identifier import identify_interactions, identify_branches, sorted_reaction
 
 # Checks for:
 # - the reaction correctly identifies spectator and interacting particles
@@ -198,5 +199,59 @@ class TestIdentifyWeak(unittest.TestCase):
         self.assertEqual(weak_pairs, [])
         self.assertEqual(interacting_particles, interacting_expected)'''
 
+
+# Checks if:
+# - the pairings with many particles on each side are the same as with the original nested loops
+
+class TestMultiplicity(unittest.TestCase):
+    def setUp(self):
+        self.db = load_ElementalParticles("data/ElementalParticles.json")
+
+    def test_flavor_change_many_particles(self):
+        interacting = {
+            'initial': ['up', 'up', 'down', 'electron', 'muon', 'electron'],
+            'final': ['down', 'strange', 'down', 'electron neutrino', 'electron', 'muon neutrino', 'up']
+        }
+        quark_pairs, lepton_pairs, interacting_final = identify_flavor_change(interacting, self.db)
+        self.assertEqual(quark_pairs, [('up', 'down'), ('up', 'strange'), ('down', 'up')])
+        self.assertEqual(lepton_pairs, [('electron', 'electron neutrino'), ('muon', 'muon neutrino')])
+        self.assertEqual(interacting_final, {'initial': ['electron'], 'final': ['down', 'electron']})
+
+    def test_weak_many_particles(self):
+        interacting = {
+            'initial': ['electron', 'up', 'electron', 'antidown', 'muon'],
+            'final': ['muon', 'antiup', 'electron', 'down', 'up', 'electron']
+        }
+        weak_pairs, interacting_final = identify_weak(interacting, self.db)
+        self.assertEqual(weak_pairs, [('electron', 'muon'), ('electron', 'electron'), ('up', 'up'), ('muon', 'electron')])
+        self.assertEqual(interacting_final, {'initial': ['antidown'], 'final': ['antiup', 'down']})
+
+# Checks if:
+# - every branch gets the same interactions as identifying it on its own with sorted particles, and branches with the same interacting particles share the result
+# - sorting the particles makes the identification independent of their order
+
+class TestIdentifyBranches(unittest.TestCase):
+    def setUp(self):
+        self.db = load_ElementalParticles("data/ElementalParticles.json")
+
+    def test_branches(self):
+        branches = [
+            {'initial': ['up', 'antiup'], 'final': ['gamma', 'gamma']},
+            {'initial': ['down', 'antidown'], 'final': ['gamma', 'gamma']},
+            {'initial': ['electron', 'up', 'antiup'], 'final': ['gamma', 'electron', 'gamma']},
+        ]
+        results = list(identify_branches(branches, self.db))
+        self.assertEqual(len(results), 3)
+        for branch, (elemental, interactions, remaining) in zip(branches, results):
+            self.assertEqual(elemental, branch)
+            self.assertEqual((interactions, remaining), identify_interactions(sorted_reaction(branch), self.db))
+        self.assertIs(results[0][1], results[2][1])
+
+    def test_sorted_reaction(self):
+        reaction = {'initial': ['electron', 'positron', 'up'], 'final': ['up', 'muon', 'antimuon']}
+        reordered = {'initial': ['up', 'positron', 'electron'], 'final': ['antimuon', 'up', 'muon']}
+        self.assertEqual(sorted_reaction(reaction), sorted_reaction(reordered))
+        self.assertEqual(identify_interactions(sorted_reaction(reaction), self.db), identify_interactions(sorted_reaction(reordered), self.db))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
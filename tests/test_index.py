@@ -0,0 +1,50 @@
+import unittest
+from src.index import ParticleIndex
+from src.particles import load_ElementalParticles, load_ComplexParticles
+
+# Checks if:
+# - interactions are stored as bit flags and can be filtered with a mask
+# - mass range queries return the particles in the range, lightest first
+# - the inverted indexes answer combined queries with values, collections and functions
+# - autocomplete suggests the names, symbols and aliases that start with a prefix
+
+class TestParticleIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.index = ParticleIndex(load_ElementalParticles("data/ElementalParticles.json"),
+                                  load_ComplexParticles("data/ComplexParticles.json"))
+
+    def names(self, ids):
+        return self.index.names(ids)
+
+    def test_interactions(self):
+        proton = self.index.resolver.resolve('p')
+        self.assertEqual(self.index.interactions[proton], self.index.interaction_mask('strong', 'EM', 'weak'))
+        electron = self.index.resolver.resolve('e-')
+        self.assertFalse(self.index.interactions[electron] & self.index.interaction_mask('strong'))
+        with self.assertRaises(ValueError):
+            self.index.interaction_mask('gravity')
+
+    def test_mass_range(self):
+        self.assertEqual(self.names(self.index.mass_range(130, 140)), ['pion0', 'pion-', 'pion+'])
+        masses = [self.index.resolver.particles[i].mass for i in self.index.mass_range()]
+        self.assertEqual(masses, sorted(masses))
+        self.assertEqual(self.index.mass_range(200000), [])
+
+    def test_select(self):
+        self.assertEqual(self.names(self.index.select(category='baryons', charge=0, strangeness=lambda s: s != 0, mass_max=1500)),
+                         ['lambda0', 'antilambda0', 'sigma0', 'antisigma0', 'xi0', 'antixi0', 'sigma0_star'])
+        self.assertEqual(self.names(self.index.select(category='mesons', charge=[1, -1], interactions=['weak'], mass_max=600)),
+                         ['pion-', 'pion+', 'kaon+', 'kaon-'])
+        self.assertEqual(self.names(self.index.select(category='baryons', strangeness=-3)), ['omega-'])
+        self.assertEqual(self.index.select(category='baryons', charm=1), [])
+        with self.assertRaises(ValueError):
+            self.index.select(colour='red')
+
+    def test_complete(self):
+        self.assertEqual(self.index.complete('pi', limit=3), [('pi+', 'pion+'), ('pi-', 'pion-'), ('pi0', 'pion0')])
+        self.assertIn(('muon', 'muon'), self.index.complete('MU'))
+        self.assertEqual(self.index.complete('zzz'), [])
+
+if __name__ == "__main__":
+    unittest.main()
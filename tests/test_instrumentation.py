@@ -0,0 +1,89 @@
+import json
+import os
+import tempfile
+import unittest
+from src import instrumentation
+from src.cache import ReactionCache
+from src.particles import load_ElementalParticles, load_ComplexParticles
+from src.pipeline import ReactionPipeline
+
+# Checks if:
+# - nothing is recorded while instrumentation is disabled
+# - the pipeline records every stage it runs, by reaction shape, and the cache, resolver and pair counters
+# - statistics drained in a worker can be merged into another process
+# - the statistics are exported as JSON and in the Prometheus text format
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        instrumentation.reset()
+        self.pipeline = ReactionPipeline(load_ElementalParticles("data/ElementalParticles.json"),
+                                         load_ComplexParticles("data/ComplexParticles.json"),
+                                         cache=ReactionCache())
+
+    def tearDown(self):
+        instrumentation.disable()
+        instrumentation.reset()
+
+    def test_disabled(self):
+        self.pipeline.run('e+ e- -> mu+ mu-')
+        stats = instrumentation.stats()
+        self.assertFalse(stats['enabled'])
+        self.assertEqual((stats['stages'], stats['counters']), ({}, {}))
+
+    def test_pipeline_stages(self):
+        instrumentation.enable()
+        self.pipeline.run('e+ e- -> mu+ mu-')
+        self.pipeline.run('mu- mu+ -> e- e+')
+        self.pipeline.run('e- -> e- e-')
+        self.pipeline.run('foo -> bar')
+        stats = instrumentation.stats()
+
+        self.assertEqual(stats['stages']['parse']['calls'], 4)
+        self.assertEqual(stats['stages']['identify']['calls'], 2)
+        self.assertEqual(stats['stages']['validate']['shapes']['1->2']['calls'], 1)
+        self.assertGreaterEqual(stats['stages']['identify']['cpu_s'], 0.0)
+        self.assertEqual(stats['counters']['reactions'], 4)
+        self.assertEqual(stats['counters']['errors.normalize'], 1)
+        self.assertGreater(stats['counters']['identify_em.pairs'], 0)
+        self.assertEqual(stats['hit_rates']['cache'], {'hits': 0, 'misses': 3, 'hit_rate': 0.0})
+        self.assertEqual(stats['hit_rates']['resolver']['misses'], 1)
+
+    def test_cache_hits(self):
+        instrumentation.enable()
+        self.pipeline.run('e+ e- -> mu+ mu-')
+        self.pipeline.run('e- e+ -> mu- mu+')
+        stats = instrumentation.stats()
+        self.assertEqual(stats['hit_rates']['cache']['hit_rate'], 0.5)
+        self.assertEqual(stats['stages']['identify']['calls'], 1)
+
+    def test_drain_and_merge(self):
+        instrumentation.enable()
+        self.pipeline.run('e+ e- -> mu+ mu-')
+        state = instrumentation.drain()
+        self.assertEqual(instrumentation.stats()['counters'], {})
+        instrumentation.merge(state)
+        instrumentation.merge(state)
+        self.assertEqual(instrumentation.stats()['counters']['reactions'], 2)
+
+    def test_export(self):
+        instrumentation.enable()
+        self.pipeline.run('e+ e- -> mu+ mu-')
+        out_dir = tempfile.mkdtemp()
+        json_path = os.path.join(out_dir, 'stats.json')
+        prom_path = os.path.join(out_dir, 'stats.prom')
+        instrumentation.export(json_path)
+        instrumentation.export(prom_path)
+        with open(json_path, encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['counters']['reactions'], 1)
+        with open(prom_path, encoding='utf-8') as f:
+            text = f.read()
+        self.assertIn('# TYPE feyndiag_stage_wall_seconds_total counter', text)
+        self.assertIn('feyndiag_stage_calls_total{stage="validate",shape="2->2"} 1', text)
+        self.assertIn('feyndiag_reactions_total 1', text)
+        self.assertIn('feyndiag_hit_rate{source="cache"} 0.0', text)
+        for path in (json_path, prom_path):
+            os.remove(path)
+        os.rmdir(out_dir)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from src.particles import load_ElementalParticles, load_ComplexParticles
+
+try:
+    import numpy
+    from src.kinematics import MassTable, analyze_kinematics, two_body_momentum, scan_energies
+except ImportError:
+    numpy = None
+
+# Checks if:
+# - Q-values and thresholds are the mass differences and sums of every reaction
+# - two-body momenta and maximum kinetic energies match the textbook values
+# - scattering reactions use the given centre-of-mass energy, and decays the parent mass
+# - the energy scan finds the first energy of the grid that opens every reaction
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestKinematics(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.table = MassTable(load_ElementalParticles("data/ElementalParticles.json"),
+                              load_ComplexParticles("data/ComplexParticles.json"))
+        cls.reactions = [
+            {'initial': ['pi+'], 'final': ['mu+', 'nu_mu-']},
+            {'initial': ['n'], 'final': ['p', 'e-', 'nu_e+']},
+            {'initial': ['p', 'p'], 'final': ['p', 'p', 'pi0']},
+            {'initial': ['e+', 'e-'], 'final': ['mu+', 'mu-']},
+        ]
+
+    def test_q_values_and_thresholds(self):
+        result = analyze_kinematics(self.reactions, self.table)
+        numpy.testing.assert_allclose(result['q_value'], [33.9, 0.789, -135.0, -210.378])
+        numpy.testing.assert_allclose(result['threshold'], [105.7, 938.811, 2011.6, 211.4])
+        # p p -> p p pi0 on a fixed target: E = ((2 m_p + m_pi)^2 - 2 m_p^2) / (2 m_p)
+        self.assertAlmostEqual(result['fixed_target'][2], ((2 * 938.3 + 135.0) ** 2 - 2 * 938.3 ** 2) / (2 * 938.3))
+        self.assertTrue(numpy.isnan(result['fixed_target'][0]))
+
+    def test_decays(self):
+        result = analyze_kinematics(self.reactions, self.table)
+        # Muon momentum in the pion decay, and the kinetic energy it takes
+        self.assertAlmostEqual(result['momentum'][0], 29.78, places=2)
+        self.assertAlmostEqual(result['max_kinetic'][0, 0], 4.116, places=3)
+        # The electron of the neutron decay gets at most about the Q-value
+        self.assertAlmostEqual(result['max_kinetic'][1, 1], 0.788, places=3)
+        self.assertTrue(numpy.isnan(result['max_kinetic'][0, 2]))
+        self.assertTrue(result['allowed'][:2].all())
+
+    def test_scattering_energy(self):
+        result = analyze_kinematics(self.reactions, self.table)
+        self.assertTrue(numpy.isnan(result['sqrt_s'][3]))
+        result = analyze_kinematics(self.reactions, self.table, sqrt_s=1000.0)
+        self.assertEqual(list(result['allowed']), [True, True, False, True])
+        self.assertAlmostEqual(result['momentum'][3], two_body_momentum(1000.0, 105.7, 105.7))
+        numpy.testing.assert_allclose(result['max_kinetic'][3, :2], [394.3, 394.3])
+
+    def test_below_threshold(self):
+        self.assertTrue(numpy.isnan(two_body_momentum(100.0, 60.0, 60.0)))
+        self.assertEqual(two_body_momentum(120.0, 60.0, 60.0), 0.0)
+
+    def test_scan(self):
+        thresholds = numpy.array([105.7, 2011.6, 211.4, numpy.nan])
+        first, open_count = scan_energies(thresholds, numpy.array([300.0, 100.0, 2000.0, 2500.0]))
+        self.assertEqual(list(first), [0, 3, 0, 4])
+        self.assertEqual(list(open_count), [2, 0, 2, 3])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,12 +1,14 @@
+import io
 import unittest
-from src.parser import parse_reaction
-from src.parser import normalize_particles, analyze_complex_particles
+from src.parser import parse_reaction, parse_decay_chain, decay_tree, parse_many, iter_parsed
+from src.parser import normalize_particles, analyze_complex_particles, iter_complex_expansions
 from src.particles import load_ComplexParticles, load_ElementalParticles
+from src.resolver import ParticleResolver
 
 
 # Checks if:
 # - the parser function isolates correctly all the components of the process
-# - the parser function can handle whitespace
+# - the parser function can handle whitespace and optional '+' separators
 
 class TestParser(unittest.TestCase):
     def test_basic_parse(self):
@@ -20,6 +22,78 @@ class TestParser(unittest.TestCase):
         parsed = parse_reaction(reaction)
         self.assertEqual(parsed["initial"], ["e+", "e-"])
         self.assertEqual(parsed["final"], ["mu+", "mu-"])
+
+    def test_plus_separators(self):
+        parsed = parse_reaction("p + p -> p + p + pi0")
+        self.assertEqual(parsed, {"initial": ["p", "p"], "final": ["p", "p", "pi0"]})
+        self.assertEqual(parse_reaction("e+ e-->mu+ mu-"), {"initial": ["e+", "e-"], "final": ["mu+", "mu-"]})
+
+    def test_malformed(self):
+        for reaction in ("e+ e- mu+ mu-", "a -> b -> c", "K- p -> lambda0 pi0, lambda0 -> p pi-"):
+            with self.assertRaises(ValueError):
+                parse_reaction(reaction)
+
+# Checks if:
+# - decay chains are split into the first reaction and the decays of its products
+# - the tree of IDs attaches every decay to the first product that has not decayed yet, at any depth
+# - decays of particles that were never produced are rejected
+
+class TestDecayChain(unittest.TestCase):
+    def setUp(self):
+        self.resolver = ParticleResolver(
+            load_ElementalParticles("data/ElementalParticles.json"),
+            load_ComplexParticles("data/ComplexParticles.json")
+        )
+
+    def test_chain(self):
+        chain = parse_decay_chain("K- p -> lambda0 pi0, lambda0 -> p + pi-; pi0 -> gamma gamma")
+        self.assertEqual(chain["initial"], ["K-", "p"])
+        self.assertEqual(chain["final"], ["lambda0", "pi0"])
+        self.assertEqual(chain["decays"], [{"initial": ["lambda0"], "final": ["p", "pi-"]},
+                                           {"initial": ["pi0"], "final": ["gamma", "gamma"]}])
+        self.assertEqual(parse_decay_chain("n -> p e- nu_e+")["decays"], [])
+
+    def test_tree(self):
+        r = self.resolver.resolve
+        chain = parse_decay_chain("omega- -> xi0 pi-, xi0 -> lambda0 pi0, pi0 -> gamma gamma, lambda0 -> p pi-")
+        initial, final = decay_tree(chain, self.resolver)
+        self.assertEqual(initial, (r("omega-"),))
+        self.assertEqual(final, (
+            (r("xi0"), ((r("lambda0"), ((r("p"), ()), (r("pi-"), ()))), (r("pi0"), ((r("gamma"), ()), (r("gamma"), ()))))),
+            (r("pi-"), ()),
+        ))
+        # The second pion of the same kind decays once the first one has
+        chain = parse_decay_chain("eta -> pi0 pi0 pi0, pi0 -> gamma gamma, pi0 -> gamma gamma")
+        self.assertEqual([len(node[1]) for node in decay_tree(chain, self.resolver)[1]], [2, 2, 0])
+
+    def test_invalid_chains(self):
+        with self.assertRaises(ValueError):
+            decay_tree(parse_decay_chain("K- p -> lambda0 pi0, kaon+ -> pi+ pi0"), self.resolver)
+        with self.assertRaises(ValueError):
+            decay_tree(parse_decay_chain("lambda0 -> p pi-, lambda0 -> n pi0"), self.resolver)
+        with self.assertRaises(ValueError):
+            parse_decay_chain("K- p -> lambda0 pi0, lambda0 pi0 -> p pi-")
+
+# Checks if:
+# - a buffer of reactions is parsed like every line on its own, skipping blank lines and comments
+# - lines that cannot be parsed are kept, without a result
+# - decay chains are parsed with their decays
+# - streams are parsed block by block without cutting lines
+
+class TestBulkParser(unittest.TestCase):
+    text = "e+ e- -> mu+ mu-\n\n# comment -> here\n  n -> p + e- + nu_e+  \nbad line\nK- p -> lambda0 pi0, lambda0 -> p pi-\np antiproton -> pi+ pi-"
+
+    def test_parse_many(self):
+        results = parse_many(self.text)
+        self.assertEqual([reaction for reaction, _ in results],
+                         ["e+ e- -> mu+ mu-", "n -> p + e- + nu_e+", "bad line", "K- p -> lambda0 pi0, lambda0 -> p pi-", "p antiproton -> pi+ pi-"])
+        self.assertEqual(results[0][1], parse_reaction("e+ e- -> mu+ mu-"))
+        self.assertEqual(results[1][1], {"initial": ["n"], "final": ["p", "e-", "nu_e+"]})
+        self.assertIsNone(results[2][1])
+        self.assertEqual(results[3][1], parse_decay_chain("K- p -> lambda0 pi0, lambda0 -> p pi-"))
+
+    def test_blocks(self):
+        self.assertEqual(list(iter_parsed(io.StringIO(self.text), block_size=7)), parse_many(self.text))
         
 # Checks if:
 # - the parser function can handle complex particles
@@ -46,5 +120,28 @@ class TestComplexParser(unittest.TestCase):
         self.assertEqual(expanded["initial"], expected_initial)
         self.assertEqual(expanded["final"], expected_final)
     
+
+
+# Checks if:
+# - every combination of compositions of the mixed states is expanded once, the first one being the default expansion
+
+class TestAllCompositions(unittest.TestCase):
+    def setUp(self):
+        self.resolver = ParticleResolver(
+            load_ElementalParticles("data/ElementalParticles.json"),
+            load_ComplexParticles("data/ComplexParticles.json")
+        )
+
+    def test_expansions(self):
+        normalized = {"initial": ["pion0", "proton"], "final": ["eta", "proton"]}
+        expansions = list(iter_complex_expansions(normalized, self.resolver))
+        self.assertEqual(len(expansions), 2 * 3)
+        self.assertEqual(expansions[0], analyze_complex_particles(normalized, self.resolver))
+        self.assertIn({"initial": ["down", "antidown", "up", "up", "down"], "final": ["strange", "antistrange", "up", "up", "down"]}, expansions)
+
+    def test_duplicates_removed(self):
+        normalized = {"initial": ["pion0"], "final": ["proton", "antiproton"]}
+        self.assertEqual(len(list(iter_complex_expansions(normalized, self.resolver))), 2)
+
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -17,4 +17,32 @@ class TestComplexParticles(unittest.TestCase):
         db = load_ComplexParticles("data/ComplexParticles.json")
         self.assertIn("proton", db)
         self.assertTrue(hasattr(db["proton"], "mass"))
-        self.assertTrue(hasattr(db["proton"], "content"))
\ No newline at end of file
+        self.assertTrue(hasattr(db["proton"], "content"))
+
+# Checks if:
+# - particles have no per-instance __dict__
+# - particles are hashable and compare by name
+
+class TestParticleRepresentation(unittest.TestCase):
+    def test_slots(self):
+        electron = load_ElementalParticles("data/ElementalParticles.json")["electron"]
+        proton = load_ComplexParticles("data/ComplexParticles.json")["proton"]
+        self.assertFalse(hasattr(electron, "__dict__"))
+        self.assertFalse(hasattr(proton, "__dict__"))
+        with self.assertRaises(AttributeError):
+            electron.colour = "red"
+
+    def test_hash_and_equality(self):
+        db1 = load_ElementalParticles("data/ElementalParticles.json")
+        db2 = load_ElementalParticles("data/ElementalParticles.json")
+        self.assertEqual(db1["electron"], db2["electron"])
+        self.assertNotEqual(db1["electron"], db1["muon"])
+        self.assertEqual(len({db1["electron"], db2["electron"], db1["muon"]}), 2)
+        self.assertEqual(db1["up"].interactions, ["strong", "EM", "weak"])
+
+    def test_family_keys(self):
+        db = load_ElementalParticles("data/ElementalParticles.json")
+        self.assertEqual((db["antistrange"].lepton_flavour, db["antistrange"].generation, db["antistrange"].sign), ("", 2, -1))
+        self.assertEqual((db["muon"].lepton_flavour, db["muon"].generation, db["muon"].sign), ("mu", 2, 1))
+        self.assertEqual((db["positron"].lepton_flavour, db["positron"].generation, db["positron"].sign), ("e", 1, -1))
+        self.assertEqual((db["gamma"].generation, db["gamma"].sign), (0, 0))
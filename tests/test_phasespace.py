@@ -0,0 +1,83 @@
+import math
+import os
+import shutil
+import tempfile
+import unittest
+from src.particles import load_ElementalParticles, load_ComplexParticles
+
+try:
+    import numpy
+    from src.phasespace import rambo, massless_volume, PhaseSpaceGenerator, load_events
+except ImportError:
+    numpy = None
+
+# Checks if:
+# - every event conserves four-momentum and puts every particle on its mass shell
+# - the weights give the known two-body and massless phase-space volumes
+# - forbidden reactions, and reactions below their threshold, are rejected
+# - the same seed gives the same events, and they are streamed to '.npy' chunks that can be loaded back
+# - writing to a directory removes the chunks of an earlier, larger run
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestPhaseSpace(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ElementalParticles_db = load_ElementalParticles("data/ElementalParticles.json")
+        cls.ComplexParticles_db = load_ComplexParticles("data/ComplexParticles.json")
+
+    def generator(self, initial, final, sqrt_s=None):
+        return PhaseSpaceGenerator({'initial': initial, 'final': final},
+                                   self.ElementalParticles_db, self.ComplexParticles_db, sqrt_s)
+
+    def test_conservation(self):
+        masses = numpy.array([100.0, 200.0, 0.0, 300.0])
+        momenta, weights = rambo(1000.0, masses, 1000, numpy.random.default_rng(0))
+        self.assertEqual(momenta.shape, (1000, 4, 4))
+        numpy.testing.assert_allclose(momenta.sum(axis=1), numpy.tile([1000.0, 0, 0, 0], (1000, 1)), atol=1e-8)
+        invariant = momenta[:, :, 0] ** 2 - (momenta[:, :, 1:] ** 2).sum(axis=2)
+        numpy.testing.assert_allclose(invariant, numpy.tile(masses ** 2, (1000, 1)), atol=1e-6)
+        self.assertTrue((weights > 0).all())
+
+    def test_volumes(self):
+        # Three massless particles: s / (256 pi^3)
+        _, weights = rambo(1000.0, [0.0, 0.0, 0.0], 10, numpy.random.default_rng(0))
+        numpy.testing.assert_allclose(weights, 1000.0 ** 2 / (256 * math.pi ** 3))
+        self.assertAlmostEqual(massless_volume(1000.0, 2), 1 / (8 * math.pi))
+        # Two massive particles: 1 / (8 pi) * 2p / sqrt(s), the same for every event
+        generator = self.generator(['kaon+'], ['pion+', 'pion0'])
+        self.assertEqual(generator.sqrt_s, 493.7)
+        momenta, weights = generator.generate(10, numpy.random.default_rng(0))
+        p = numpy.linalg.norm(momenta[:, 0, 1:], axis=1)
+        numpy.testing.assert_allclose(p, p[0])
+        numpy.testing.assert_allclose(weights, 2 * p[0] / 493.7 / (8 * math.pi))
+
+    def test_rejected(self):
+        with self.assertRaises(ValueError):
+            self.generator(['kaon+'], ['pion+', 'pion+'])
+        with self.assertRaises(ValueError):
+            self.generator(['electron', 'positron'], ['muon', 'antimuon'])
+        with self.assertRaises(ValueError):
+            self.generator(['electron', 'positron'], ['muon', 'antimuon'], sqrt_s=200.0)
+        self.assertEqual(self.generator(['electron', 'positron'], ['muon', 'antimuon'], sqrt_s=1000.0).masses, [105.7, 105.7])
+
+    def test_chunks(self):
+        generator = self.generator(['neutron'], ['proton', 'electron', 'electron antineutrino'])
+        first = numpy.concatenate(list(generator.iter_batches(2500, 1000, seed=7)))
+        second = numpy.concatenate(list(generator.iter_batches(2500, 1000, seed=7)))
+        numpy.testing.assert_array_equal(first, second)
+
+        out_dir = tempfile.mkdtemp()
+        try:
+            paths = generator.write(out_dir, 2500, 1000, seed=7)
+            self.assertEqual([os.path.basename(path) for path in paths], ['events-00000.npy', 'events-00001.npy', 'events-00002.npy'])
+            chunks = list(load_events(out_dir))
+            self.assertEqual([len(chunk) for chunk in chunks], [1000, 1000, 500])
+            numpy.testing.assert_array_equal(numpy.concatenate(chunks), first)
+
+            generator.write(out_dir, 1500, 1000, seed=7)
+            self.assertEqual(sorted(os.listdir(out_dir)), ['events-00000.npy', 'events-00001.npy', 'manifest.json'])
+        finally:
+            shutil.rmtree(out_dir)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+import main
+from src.particles import load_ElementalParticles, load_ComplexParticles
+from src.pipeline import ReactionPipeline, classify_many, write_jsonl
+
+# Checks if:
+# - the pipeline returns one record per reaction with the result of every step
+# - invalid reactions and unknown particles are reported in the record instead of aborting the batch
+# - batches are written as JSON Lines
+# - batches validated together give the same records as reactions run one by one
+# - every decay of a decay chain is validated, in batches too
+# - batches can stop after the validate step
+# - the interactive mode identifies the same interactions as the pipeline
+
+class TestReactionPipeline(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pipeline = ReactionPipeline(
+            load_ElementalParticles("data/ElementalParticles.json"),
+            load_ComplexParticles("data/ComplexParticles.json")
+        )
+
+    def test_valid_reaction(self):
+        record = self.pipeline.run("neutron nu_e- -> proton e-")
+        self.assertTrue(record['valid'])
+        self.assertEqual(record['errors'], [])
+        self.assertEqual(record['initial'], ['neutron', 'electron neutrino'])
+        self.assertEqual(record['final'], ['proton', 'electron'])
+        self.assertEqual(record['interactions']['flavor_change']['lepton_pairs'], [('electron neutrino', 'electron')])
+        self.assertEqual(record['remaining'], {'initial': [], 'final': []})
+
+    def test_invalid_reaction(self):
+        record = self.pipeline.run("sigma0 -> lambda0 pi0")
+        self.assertFalse(record['valid'])
+        self.assertTrue(any('mass conservation' in err for err in record['errors']))
+        self.assertNotIn('interactions', record)
+
+    def test_errors_are_captured(self):
+        record = self.pipeline.run("e+ e- mu+ mu-")
+        self.assertEqual(record['stage'], 'parse')
+        record = self.pipeline.run("e+ e- -> unknownium")
+        self.assertEqual(record['stage'], 'normalize')
+        self.assertIn('unknownium', record['error'])
+
+    def test_stream(self):
+        text = "e+ e- -> mu+ mu-\n# comment\ne+ e- mu+ mu-\nn -> p + e- + nu_e+\n"
+        records = list(self.pipeline.run_stream(io.StringIO(text)))
+        self.assertEqual(records, list(self.pipeline.run_batch(text.splitlines())))
+        self.assertEqual(records[1]['stage'], 'parse')
+        self.assertTrue(records[2]['valid'])
+
+    def test_batch_matches_run(self):
+        lines = ["u p p antiu -> n p g pi+", "e+ e- -> mu+ mu-", "e+ e+ -> mu+ mu-", "sigma0 -> lambda0 pi0",
+                 "e+ e- -> unknownium", "e+ e- mu+ mu-", "u d -> p", "K- p -> lambda0 pi0"]
+        records = list(self.pipeline.run_batch(lines))
+        self.assertEqual(records, [self.pipeline.run(line) for line in lines])
+        self.assertTrue(records[0]['valid'])
+
+    def test_decay_chains(self):
+        text = "K- p -> lambda0 pi0, lambda0 -> p pi-; pi0 -> gamma gamma\nK- p -> lambda0 pi0, lambda0 -> p pi+\ne+ e- -> mu+ mu-, kaon+ -> pi+ pi0\n"
+        records = list(self.pipeline.run_stream(io.StringIO(text)))
+        self.assertEqual(records, list(self.pipeline.run_batch(text.splitlines())))
+        self.assertEqual(records, [self.pipeline.run(line) for line in text.splitlines()])
+        self.assertTrue(records[0]['valid'])
+        self.assertEqual([step['valid'] for step in records[0]['decays']], [True, True])
+        self.assertEqual(records[0]['decays'][0]['final'], ['proton', 'pion-'])
+        self.assertTrue(records[1]['valid'])
+        self.assertFalse(records[1]['decays'][0]['valid'])
+        self.assertEqual(records[2]['stage'], 'normalize')
+
+    def test_validate_only(self):
+        lines = ["e+ e- -> mu+ mu-", "e+ e+ -> mu+ mu-", "e+ e- -> unknownium"]
+        records = self.pipeline.run_many(lines, validate_only=True)
+        full = self.pipeline.run_many(lines)
+        self.assertEqual([r.get('valid') for r in records], [r.get('valid') for r in full])
+        self.assertNotIn('interactions', records[0])
+        self.assertEqual(records[1:], full[1:])
+
+    def test_same_as_interactive(self):
+        outputs = []
+        for reaction_str in ("e+ e- -> mu+ mu-", "K+ -> pi+ pi0"):
+            out = io.StringIO()
+            with mock.patch('builtins.input', side_effect=[reaction_str, 'no']), redirect_stdout(out):
+                main.main()
+            outputs.append(out.getvalue())
+        em = self.pipeline.run("e+ e- -> mu+ mu-")['interactions']['em']
+        self.assertIn(f"Initial: {em['initial_pairs']}, Final: {em['final_pairs']}", outputs[0])
+        remaining = self.pipeline.run("K+ -> pi+ pi0")['remaining']
+        self.assertEqual(remaining['final'], ['antiup', 'down'])
+        self.assertIn(f"Initial: {remaining['initial']}, Final: {remaining['final']}", outputs[1])
+
+    def test_batch_jsonl(self):
+        lines = ["e+ e- -> mu+ mu-", "", "# comment", "e+ e+ -> mu+ mu-", "e+ e- -> unknownium"]
+        out = io.StringIO()
+        count = write_jsonl(self.pipeline.run_batch(lines), out)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(count, 3)
+        self.assertEqual([r['reaction'] for r in records], ["e+ e- -> mu+ mu-", "e+ e+ -> mu+ mu-", "e+ e- -> unknownium"])
+        self.assertTrue(records[0]['valid'])
+        self.assertFalse(records[1]['valid'])
+        self.assertIn('error', records[2])
+
+
+    def test_all_compositions(self):
+        record = self.pipeline.run("pi0 -> gamma gamma", all_compositions=True)
+        self.assertEqual(len(record['branches']), 2)
+        self.assertEqual(record['branches'][0]['elemental'], record['elemental'])
+        self.assertEqual(record['branches'][1]['elemental'], {'initial': ['down', 'antidown'], 'final': ['gamma', 'gamma']})
+
+
+# Checks if:
+# - the parallel classifier gives the same records as the pipeline, in input order
+
+class TestClassifyMany(unittest.TestCase):
+    def test_same_as_serial(self):
+        reactions = [
+            "e+ e- -> mu+ mu-", "neutron nu_e- -> proton e-", "sigma0 -> lambda0 pi0", "",
+            "K+ n -> pi0 sigma+", "e+ e- -> unknownium", "tau- -> e- nu_e+ nu_tau-", "proton antiproton -> pi+ pi-",
+        ]
+        serial = [json.loads(json.dumps(r)) for r in ReactionPipeline().run_batch(reactions)]
+        parallel = [json.loads(json.dumps(r)) for r in classify_many(reactions, workers=2, chunksize=2)]
+        self.assertEqual(parallel, serial)
+
+if __name__ == "__main__":
+    unittest.main()
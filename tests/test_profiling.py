@@ -0,0 +1,57 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from src.cache import ReactionCache
+from src.particles import load_ElementalParticles, load_ComplexParticles
+from src.pipeline import ReactionPipeline
+from src.profiling import StackRecorder, SlowReactionProfiler
+
+# Checks if:
+# - the recorder writes one 'caller;callee microseconds' line per call stack
+# - only reactions over the threshold are profiled, once each, skipping the cache
+# - the profile is saved with the reaction and the input of every identification step
+
+class TestSlowReactionProfiler(unittest.TestCase):
+    def setUp(self):
+        self.pipeline = ReactionPipeline(load_ElementalParticles("data/ElementalParticles.json"),
+                                         load_ComplexParticles("data/ComplexParticles.json"),
+                                         cache=ReactionCache())
+        self.out_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_collapsed_stacks(self):
+        with StackRecorder() as recorder:
+            self.pipeline.run('e+ e- -> mu+ mu-')
+        lines = recorder.collapsed().splitlines()
+        self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit() for line in lines))
+        self.assertTrue(any(line.startswith('run (pipeline.py:') and ';identify_em (identifier.py:' in line for line in lines))
+        self.assertEqual([c['step'] for c in recorder.captured],
+                         ['identify_flavor_change', 'identify_strong', 'identify_em'])
+
+    def test_threshold(self):
+        profiler = SlowReactionProfiler(threshold_ms=1e6, out_dir=self.out_dir)
+        list(self.pipeline.run_batch(['e+ e- -> mu+ mu-'], profiler))
+        self.assertEqual(os.listdir(self.out_dir), [])
+
+    def test_slow_reaction_captured(self):
+        profiler = SlowReactionProfiler(threshold_ms=0, out_dir=self.out_dir)
+        records = list(self.pipeline.run_batch(['e+ e- -> mu+ mu-', 'e+ e- -> mu+ mu-'], profiler))
+        self.assertTrue(records[0]['valid'])
+        self.assertEqual(len(profiler.paths), 1)
+        self.assertEqual(len(self.pipeline.cache), 1)
+
+        with open(profiler.paths[0].replace('.folded', '.json'), encoding='utf-8') as f:
+            capture = json.load(f)
+        self.assertEqual(capture['reaction'], 'e+ e- -> mu+ mu-')
+        self.assertEqual(capture['record']['interactions'], json.loads(json.dumps(records[0]['interactions'])))
+        self.assertEqual(capture['interacting'][0]['interacting'],
+                         {'initial': ['electron', 'positron'], 'final': ['antimuon', 'muon']})
+        with open(profiler.paths[0], encoding='utf-8') as f:
+            self.assertIn('identify_interactions (identifier.py:', f.read())
+
+if __name__ == "__main__":
+    unittest.main()
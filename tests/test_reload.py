@@ -0,0 +1,96 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from src.cache import ReactionCache
+from src.particles import load_ElementalParticles, load_ComplexParticles
+from src.pipeline import ReactionPipeline
+from src.reload import diff_particles, DatabaseWatcher
+from src.resolver import ParticleResolver
+
+# Checks if:
+# - edits of a database are reported as added, removed and changed particles
+# - particles keep their IDs through a reload, and new ones are appended
+# - only the cached reactions that involve a changed particle (or a hadron made of one) are dropped
+# - the watcher reloads the pipeline when a file changes, and keeps the old data if it cannot be read
+
+class TestReload(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.elemental_path = os.path.join(self.tmp, "ElementalParticles.json")
+        self.complex_path = os.path.join(self.tmp, "ComplexParticles.json")
+        shutil.copy("data/ElementalParticles.json", self.elemental_path)
+        shutil.copy("data/ComplexParticles.json", self.complex_path)
+        self.pipeline = ReactionPipeline(load_ElementalParticles(self.elemental_path),
+                                         load_ComplexParticles(self.complex_path), cache=ReactionCache())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def edit(self, path, change):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        change(data)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        # Make sure the edit is seen even if the file system keeps coarse modification times
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    def add_hadron(self, data):
+        data['charmed_test'] = dict(data['proton'], symbol='pc_test', content=['u u c'])
+
+    def test_diff(self):
+        old = load_ComplexParticles(self.complex_path)
+        self.edit(self.complex_path, lambda data: (data['pion0'].update(mass=134.9), data.pop('phi'), self.add_hadron(data)))
+        diff = diff_particles(old, load_ComplexParticles(self.complex_path))
+        self.assertEqual(diff, {'added': ['charmed_test'], 'removed': ['phi'], 'changed': ['pion0']})
+
+    def test_stable_ids(self):
+        old = self.pipeline.resolver
+        self.edit(self.complex_path, lambda data: (data.pop('phi'), self.add_hadron(data)))
+        resolver = ParticleResolver(load_ElementalParticles(self.elemental_path), load_ComplexParticles(self.complex_path), previous=old)
+        self.assertEqual(resolver.resolve('p'), old.resolve('p'))
+        self.assertEqual(resolver.resolve('pc_test'), len(old))
+        self.assertTrue(resolver.is_complex(resolver.resolve('pc_test')))
+        self.assertEqual(resolver.contents[resolver.resolve('pc_test')], (('up', 'up', 'charm'),))
+        self.assertNotIn('phi', resolver)
+        self.assertIn(old.resolve('phi'), resolver.removed)
+
+    def test_invalidation(self):
+        for reaction in ('e+ e- -> mu+ mu-', 'p antiproton -> pi+ pi-', 'n -> p e- nu_e+', 'K+ -> pi+ pi0'):
+            self.pipeline.run(reaction)
+        self.assertEqual(len(self.pipeline.cache), 4)
+
+        # The down quark is in the neutron, the pions and the kaon, but not in the leptons
+        self.edit(self.elemental_path, lambda data: data['down'].update(mass=4.7))
+        summary = self.pipeline.reload(load_ElementalParticles(self.elemental_path), load_ComplexParticles(self.complex_path))
+        self.assertEqual(summary['changed'], ['down'])
+        self.assertEqual(summary['invalidated'], 3)
+        self.assertEqual(self.pipeline.ElementalParticles_db['down'].mass, 4.7)
+
+        record = self.pipeline.run('e- e+ -> mu- mu+')
+        self.assertTrue(record['valid'])
+        self.assertEqual(self.pipeline.cache.hits, 1)
+
+    def test_watcher(self):
+        watcher = DatabaseWatcher(self.pipeline, self.elemental_path, self.complex_path, interval=0)
+        self.assertIsNone(watcher.poll())
+        self.assertEqual(self.pipeline.index.complete('pc_'), [])
+
+        self.edit(self.complex_path, self.add_hadron)
+        summary = watcher.poll()
+        self.assertEqual(summary['added'], ['charmed_test'])
+        self.assertEqual(self.pipeline.index.complete('pc_'), [('pc_test', 'charmed_test')])
+        self.assertNotIn('error', self.pipeline.run('pc_test -> p'))
+        self.assertIsNone(watcher.poll())
+
+        with open(self.complex_path, 'a', encoding='utf-8') as f:
+            f.write('{ not json')
+        self.assertIsNone(watcher.poll())
+        self.assertIsNotNone(watcher.last_error)
+        self.assertIn('charmed_test', self.pipeline.ComplexParticles_db)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+from src.particles import load_ElementalParticles, load_ComplexParticles
+from src.resolver import ParticleResolver
+
+# Checks if:
+# - names, symbols and aliases resolve to the same ID
+# - IDs are dense, with elemental particles first
+# - complex particles keep their compositions in elemental names
+
+class TestParticleResolver(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.elemental_db = load_ElementalParticles("data/ElementalParticles.json")
+        cls.complex_db = load_ComplexParticles("data/ComplexParticles.json")
+        cls.resolver = ParticleResolver(cls.elemental_db, cls.complex_db)
+
+    def test_dense_ids(self):
+        self.assertEqual(len(self.resolver), len(self.elemental_db) + len(self.complex_db))
+        self.assertEqual(self.resolver.names[self.resolver.resolve('up')], 'up')
+        self.assertFalse(self.resolver.is_complex(self.resolver.resolve('electron')))
+        self.assertTrue(self.resolver.is_complex(self.resolver.resolve('proton')))
+
+    def test_aliases(self):
+        electron = self.resolver.resolve('electron')
+        self.assertEqual(self.resolver.resolve('e-'), electron)
+        self.assertEqual(self.resolver.resolve('\\electron'), electron)
+        self.assertEqual(self.resolver.resolve('nu_e-'), self.resolver.resolve('electron neutrino'))
+        self.assertEqual(self.resolver.resolve('K-'), self.resolver.resolve('kaon-'))
+        self.assertEqual(self.resolver.resolve('\\Lambda^0'), self.resolver.resolve('lambda0'))
+
+    def test_unknown_particle(self):
+        self.assertNotIn('unknownium', self.resolver)
+        with self.assertRaises(ValueError):
+            self.resolver.resolve('unknownium')
+
+    def test_contents(self):
+        pion0 = self.resolver.resolve('pi0')
+        self.assertEqual(self.resolver.contents[pion0], (('up', 'antiup'), ('down', 'antidown')))
+
+    def test_immutable(self):
+        with self.assertRaises(TypeError):
+            self.resolver.index['electron'] = 0
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import unittest
+from server import ReactionServer, LatencyHistogram
+
+# Checks if:
+# - the endpoints answer single reactions and batches with the records of the pipeline
+# - bad requests get an error status instead of closing the server
+# - oversized requests are rejected, and unexpected errors are answered with 500
+# - the latencies of the requests are counted in the histograms
+
+async def request(port, method, path, payload=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+
+class TestReactionServer(unittest.TestCase):
+    def run_server(self, *requests, setup=None, **options):
+        async def scenario():
+            server = ReactionServer(workers=1, **options)
+            if setup is not None:
+                setup(server)
+            listener = await server.start('127.0.0.1', 0)
+            port = listener.sockets[0].getsockname()[1]
+            try:
+                return [await request(port, *r) for r in requests], server.metrics()
+            finally:
+                await server.close()
+        return asyncio.run(scenario())
+
+    def test_endpoints(self):
+        responses, metrics = self.run_server(
+            ('POST', '/validate', {'reaction': 'e+ e- -> mu+ mu-'}),
+            ('POST', '/validate', {'reactions': ['e+ e- -> mu+ mu-', 'p -> e+ gamma']}),
+            ('POST', '/identify', {'reaction': 'e+ e- -> mu+ mu-'}),
+            ('POST', '/diagram', {'reaction': 'n -> p e- nu_e+', 'tikz': True}),
+        )
+        status, record = responses[0]
+        self.assertEqual(status, 200)
+        self.assertEqual(record, {'reaction': 'e+ e- -> mu+ mu-', 'initial': ['positron', 'electron'], 'final': ['antimuon', 'muon'], 'valid': True, 'errors': []})
+
+        status, batch = responses[1]
+        self.assertEqual([r['valid'] for r in batch['records']], [True, False])
+
+        status, record = responses[2]
+        self.assertEqual(record['interactions']['em'], {'initial_pairs': [['electron', 'positron']], 'final_pairs': [['antimuon', 'muon']]})
+
+        status, record = responses[3]
+        self.assertEqual(len(record['diagrams']), 1)
+        self.assertIn('W^-', record['diagrams'][0]['tikz'])
+
+        self.assertEqual(metrics['responses'], {'200': 4})
+        self.assertEqual(metrics['latency_ms']['/validate']['count'], 2)
+
+    def test_errors(self):
+        responses, metrics = self.run_server(
+            ('POST', '/validate', {'text': 'e+ e- -> mu+ mu-'}),
+            ('GET', '/validate'),
+            ('GET', '/nowhere'),
+            ('POST', '/diagram', {'reaction': 'e+ e- -> mu+ mu-', 'loops': 3}),
+            ('GET', '/health'),
+        )
+        self.assertEqual([status for status, payload in responses], [400, 405, 404, 400, 200])
+
+    def test_limits(self):
+        responses, metrics = self.run_server(
+            ('POST', '/validate', {'reactions': ['e+ e- -> mu+ mu-'] * 3}),
+            ('POST', '/validate', {'reaction': 'e+ e- -> mu+ mu- + gamma gamma'}),
+            ('POST', '/validate', {'reactions': ['e+ e- -> mu+ mu-', 'e+ e- -> mu+ mu-']}),
+            ('POST', '/diagram', {'reaction': 'n -> p e- nu_e+', 'loops': 1}),
+            ('POST', '/diagram', {'reactions': ['e+ e- -> mu+ mu- gamma', 'n -> p e- nu_e+']}),
+            max_reactions=2, max_particles=5, max_diagram_legs=4,
+        )
+        self.assertEqual([status for status, payload in responses], [413, 400, 200, 422, 200])
+        self.assertIn('over the limit of 4', responses[3][1]['error'])
+        records = responses[4][1]['records']
+        self.assertEqual(records[0]['stage'], 'diagram')
+        self.assertTrue(records[1]['diagrams'])
+
+    def test_internal_error(self):
+        def setup(server):
+            async def fail(task, reactions, options):
+                raise RuntimeError("worker crashed")
+            server.run = fail
+        with self.assertLogs('server', 'ERROR'):
+            responses, metrics = self.run_server(
+                ('POST', '/validate', {'reaction': 'e+ e- -> mu+ mu-'}),
+                ('GET', '/health'),
+                setup=setup,
+            )
+        self.assertEqual(responses, [(500, {'error': 'Internal server error'}), (200, responses[1][1])])
+        self.assertEqual(metrics['responses'], {'200': 1, '500': 1})
+
+    def test_histogram(self):
+        histogram = LatencyHistogram()
+        for ms in (0.5, 3, 3, 20000):
+            histogram.observe(ms)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['count'], 4)
+        self.assertEqual(snapshot['buckets'][0], [1, 1])
+        self.assertEqual(snapshot['buckets'][2], [5, 3])
+        self.assertEqual(snapshot['buckets'][-1], ['+Inf', 4])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import itertools
+import os
+import tempfile
+import unittest
+from src.particles import load_ElementalParticles, load_ComplexParticles
+from src.pipeline import ReactionPipeline
+from src.stream import read_reactions, parse_stage, normalize_stage, stream_reactions
+
+# Checks if:
+# - the chained stages give the same records as the pipeline, decay chains included
+# - errors are stored in the record and the stream goes on
+# - the input is read lazily
+
+class TestStream(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pipeline = ReactionPipeline(
+            load_ElementalParticles("data/ElementalParticles.json"),
+            load_ComplexParticles("data/ComplexParticles.json")
+        )
+
+    def test_same_as_pipeline(self):
+        reactions = ["e+ e- -> mu+ mu-", "K+ n -> pi0 sigma+", "sigma0 -> lambda0 pi0", "e+ e- mu+", "e+ e- -> unknownium",
+                     "K- p -> lambda0 pi0, lambda0 -> p pi-; pi0 -> gamma gamma", "K- p -> lambda0 pi0, lambda0 -> p pi+",
+                     "e+ e- -> mu+ mu-, kaon+ -> pi+ pi0"]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "reactions.txt")
+            with open(path, "w") as f:
+                f.write("\n".join(reactions) + "\n")
+            records = list(stream_reactions(path, self.pipeline))
+        self.assertEqual(records, [self.pipeline.run(r) for r in reactions])
+        self.assertEqual([step['valid'] for step in records[5]['decays']], [True, True])
+        self.assertFalse(records[6]['decays'][0]['valid'])
+
+    def test_errors_do_not_stop_the_stream(self):
+        records = list(normalize_stage(parse_stage(read_reactions(["e+ e- mu+", "e+ e- -> mu+ mu-"])), self.pipeline.resolver))
+        self.assertEqual(records[0]['stage'], 'parse')
+        self.assertEqual(records[1]['initial'], ['positron', 'electron'])
+
+    def test_lazy(self):
+        endless = itertools.cycle(["e+ e- -> mu+ mu-"])
+        records = list(itertools.islice(stream_reactions(endless, self.pipeline), 3))
+        self.assertEqual(len(records), 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,17 @@
 import unittest
-from src.validator import validate_process
+from src.validator import validate_process, validate_batch, QuantumNumberMatrix
 from src.particles import load_ElementalParticles, load_ComplexParticles
 from src.parser import normalize_particles
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # Checks if:
 # - errors are raised when conservation laws are violated
 # - no errors are raised when conservation laws are satisfied
+# - fractional quark charges and baryon numbers add up exactly
 
 class TestValidator(unittest.TestCase):
     def test_validate_process(self):
@@ -27,4 +33,50 @@ class TestValidator(unittest.TestCase):
         errors2 = validate_process(reaction2, elemental_db, complex_db)
         
         self.assertEqual(errors1, [])
-        self.assertNotEqual(errors2, [])
\ No newline at end of file
+        self.assertNotEqual(errors2, [])
+
+    def test_exact_quark_sums(self):
+        elemental_db = load_ElementalParticles("data/ElementalParticles.json")
+        complex_db = load_ComplexParticles("data/ComplexParticles.json")
+        # 2/3 + 1 + 1 - 2/3 in floats is 1.9999999999999998, not 2
+        reaction = normalize_particles({"initial": ["u", "p", "p", "antiu"], "final": ["n", "p", "g", "pi+"]}, elemental_db, complex_db)
+        self.assertEqual(validate_process(reaction, elemental_db, complex_db), [])
+        reaction = normalize_particles({"initial": ["u", "d"], "final": ["p"]}, elemental_db, complex_db)
+        self.assertIn("Process FORBIDDEN due to charge conservation: 1/3 != 1", validate_process(reaction, elemental_db, complex_db))
+
+# Checks if:
+# - the batched validator agrees with validate_process reaction by reaction
+# - charge is compared in exact units
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestValidateBatch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.elemental_db = load_ElementalParticles("data/ElementalParticles.json")
+        cls.complex_db = load_ComplexParticles("data/ComplexParticles.json")
+        cls.qn_matrix = QuantumNumberMatrix(cls.elemental_db, cls.complex_db)
+
+    def test_matches_validate_process(self):
+        reactions = [
+            {"initial": ["positron", "electron"], "final": ["antimuon", "muon"]},
+            {"initial": ["positron", "positron"], "final": ["antimuon", "muon"]},
+            {"initial": ["neutron", "electron neutrino"], "final": ["proton", "electron"]},
+            {"initial": ["sigma0"], "final": ["lambda0", "pion0"]},
+            {"initial": ["sigma0"], "final": ["lambda0", "gamma"]},
+            {"initial": ["proton"], "final": ["neutron", "positron", "electron neutrino"]},
+        ]
+        batch_errors = validate_batch(reactions, self.qn_matrix)
+        for reaction, errors in zip(reactions, batch_errors):
+            self.assertEqual(errors, validate_process(reaction, self.elemental_db, self.complex_db))
+        self.assertTrue(any('mass conservation' in err for err in batch_errors[3]))
+
+    def test_exact_charge(self):
+        # u u d has charge 2/3 + 2/3 - 1/3 = 1 exactly
+        errors = validate_batch([{"initial": ["up", "up", "down"], "final": ["proton"]}], self.qn_matrix)
+        self.assertEqual(errors, [[]])
+        errors = validate_batch([{"initial": ["up", "down"], "final": ["proton"]}], self.qn_matrix)
+        self.assertIn("Process FORBIDDEN due to charge conservation: 1/3 != 1", errors[0])
+
+    def test_unknown_particle(self):
+        with self.assertRaises(KeyError):
+            validate_batch([{"initial": ["unknownium"], "final": []}], self.qn_matrix)
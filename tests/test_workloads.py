@@ -0,0 +1,28 @@
+import unittest
+from benchmarks.workloads import reaction_batch
+from src.particles import load_ElementalParticles, load_ComplexParticles
+from src.pipeline import ReactionPipeline
+
+# Checks if:
+# - every synthetic reaction built without 'invalid_fraction' passes validation, whatever its multiplicity
+# - invalid reactions fail validation
+
+class TestReactionBatch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pipeline = ReactionPipeline(
+            load_ElementalParticles("data/ElementalParticles.json"),
+            load_ComplexParticles("data/ComplexParticles.json")
+        )
+
+    def test_valid_reactions(self):
+        for multiplicity in (2, 3, 8, 16, 50):
+            for record in self.pipeline.run_batch(reaction_batch(multiplicity, 300, invalid_fraction=0)):
+                self.assertTrue(record.get('valid'), record)
+
+    def test_invalid_reactions(self):
+        for record in self.pipeline.run_batch(reaction_batch(8, 50, invalid_fraction=1)):
+            self.assertFalse(record['valid'])
+
+if __name__ == "__main__":
+    unittest.main()